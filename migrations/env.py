@@ -8,7 +8,10 @@ from alembic import context
 
 from beer_review_dataserver.models.beers import Beers
 from beer_review_dataserver.models.breweries import Breweries
+from beer_review_dataserver.models.idempotency import IdempotencyKeys
+from beer_review_dataserver.models.images import BeerImages
 from beer_review_dataserver.models.reviews import Reviews
+from beer_review_dataserver.models.scores import ScorePriors
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,105 @@
+"""Index overhaul
+
+Revision ID: 15049afb924a
+Revises: 85809bcaf7e6
+Create Date: 2026-10-19 10:03:17.281950
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = '15049afb924a'
+down_revision: Union[str, Sequence[str], None] = '85809bcaf7e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY can't run inside a transaction, so every statement here is
+    # committed on its own. A failed concurrent build leaves an INVALID index
+    # behind which has to be dropped before rerunning the migration.
+    with op.get_context().autocommit_block():
+        # Reviews for a beer, newest first. Also backs the beer_id foreign key
+        # which had no index at all.
+        op.create_index(
+            'ix_reviews_beer_id_date_created',
+            'reviews',
+            ['beer_id', 'date_created'],
+            unique=False,
+            postgresql_include=['score'],
+            postgresql_concurrently=True,
+        )
+        # Reviews by a user, newest first. Replaces ix_reviews_username.
+        op.create_index(
+            'ix_reviews_username_date_created',
+            'reviews',
+            ['username', 'date_created'],
+            unique=False,
+            postgresql_include=['beer_id', 'score'],
+            postgresql_concurrently=True,
+        )
+        # Beers of a brewery ordered by score. Also backs the company_id
+        # foreign key.
+        op.create_index(
+            'ix_beers_company_id_score',
+            'beers',
+            ['company_id', 'score'],
+            unique=False,
+            postgresql_include=['name'],
+            postgresql_concurrently=True,
+        )
+        # Free text is never filtered on by equality, the index only costs us
+        # space and insert time.
+        op.drop_index(
+            'ix_reviews_comment',
+            table_name='reviews',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_reviews_username',
+            table_name='reviews',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_reviews_username',
+            'reviews',
+            ['username'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_reviews_comment',
+            'reviews',
+            ['comment'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_beers_company_id_score',
+            table_name='beers',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_reviews_username_date_created',
+            table_name='reviews',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_reviews_beer_id_date_created',
+            table_name='reviews',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,141 @@
+"""Partition reviews by month
+
+Revision ID: 1a4a0201b1b1
+Revises: f20b88f55763
+Create Date: 2026-10-19 16:40:12.734105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1a4a0201b1b1'
+down_revision: Union[str, Sequence[str], None] = 'f20b88f55763'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Months of empty partitions created ahead of the newest review
+MONTHS_AHEAD = 3
+
+# Creates the missing monthly partitions covering start_at to end_at, in UTC,
+# named reviews_YYYY_MM. Returns how many were created. A detached partition
+# keeps its name, so its month is never recreated. Workers calling it at the
+# same time are serialised by the advisory lock.
+CREATE_PARTITIONS = """
+CREATE OR REPLACE FUNCTION create_reviews_partitions(
+    start_at timestamptz, end_at timestamptz
+) RETURNS integer AS $$
+DECLARE
+    bound timestamp := date_trunc('month', start_at AT TIME ZONE 'UTC');
+    partition_name text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('create_reviews_partitions'));
+    WHILE bound <= end_at AT TIME ZONE 'UTC' LOOP
+        partition_name := 'reviews_' || to_char(bound, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF reviews FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                to_char(bound, 'YYYY-MM-DD') || ' 00:00:00+00',
+                to_char(bound + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+            );
+            created := created + 1;
+        END IF;
+        bound := bound + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+FOREIGN_KEYS = (
+    ('reviews_beer_id_fkey', 'beer_id', 'id'),
+    ('reviews_beer_name_fkey', 'beer_name', 'name'),
+)
+
+# (name, columns, included columns)
+INDEXES = (
+    ('ix_reviews_score', ['score'], []),
+    ('ix_reviews_beer_name', ['beer_name'], []),
+    ('ix_reviews_date_created', ['date_created'], []),
+    ('ix_reviews_beer_id_date_created', ['beer_id', 'date_created'], ['score']),
+    (
+        'ix_reviews_username_date_created',
+        ['username', 'date_created'],
+        ['beer_id', 'score'],
+    ),
+)
+
+
+def _copy_into_new_table(partition_by: str) -> None:
+    """Replace reviews with an empty copy of itself and move every row over."""
+    op.execute('ALTER TABLE reviews RENAME TO reviews_old')
+    op.execute(
+        'CREATE TABLE reviews '
+        '(LIKE reviews_old INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        f'{partition_by}'
+    )
+    if partition_by:
+        op.execute(CREATE_PARTITIONS)
+        op.execute(
+            'SELECT create_reviews_partitions('
+            'coalesce(min(date_created), now()), '
+            f"greatest(max(date_created), now()) + interval '{MONTHS_AHEAD} months'"
+            ') FROM reviews_old'
+        )
+    op.execute('INSERT INTO reviews SELECT * FROM reviews_old')
+    # Takes its primary key, foreign keys, indexes and trigger with it
+    op.execute('DROP TABLE reviews_old')
+
+
+def _recreate_constraints(primary_key: list[str]) -> None:
+    """Add back what was dropped with the old table."""
+    op.create_primary_key('reviews_pkey', 'reviews', primary_key)
+    for name, column, referred_column in FOREIGN_KEYS:
+        op.create_foreign_key(
+            name, 'reviews', 'beers', [column], [referred_column], ondelete='CASCADE'
+        )
+    # Indexes created on the parent are created on every partition, including
+    # the ones added later
+    for name, columns, include in INDEXES:
+        op.create_index(
+            name, 'reviews', columns, unique=False, postgresql_include=include
+        )
+    op.execute(
+        'CREATE TRIGGER reviews_notify_change '
+        'AFTER INSERT OR UPDATE OR DELETE ON reviews '
+        "FOR EACH ROW EXECUTE FUNCTION notify_change('reviews')"
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Reviews are the only table that grows without bound. Partitioning them
+    # by month keeps vacuum and index maintenance to the recent partitions,
+    # lets date filtered queries skip whole months and lets old months be
+    # detached and archived without a long running DELETE.
+    #
+    # Postgres requires the partition key in the primary key, so it becomes
+    # (id, date_created). Ids are still generated uuids, so the ORM keeps
+    # treating id alone as the primary key.
+    #
+    # Every row is copied while reviews is locked, so run this during a
+    # maintenance window on a large database.
+    _copy_into_new_table(' PARTITION BY RANGE (date_created)')
+    _recreate_constraints(['id', 'date_created'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Partitions detached beforehand are left behind as standalone tables
+    _copy_into_new_table('')
+    _recreate_constraints(['id'])
+    op.execute(
+        'DROP FUNCTION IF EXISTS create_reviews_partitions(timestamptz, timestamptz)'
+    )
@@ -0,0 +1,44 @@
+"""Index review date created
+
+Revision ID: 3298ec914e8f
+Revises: 39a8e2792a23
+Create Date: 2026-10-19 12:41:52.067314
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3298ec914e8f'
+down_revision: Union[str, Sequence[str], None] = '39a8e2792a23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Backs the date_from/date_to range filters and /reviews/stats when they
+    # aren't narrowed down to a beer or user first
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_reviews_date_created',
+            'reviews',
+            ['date_created'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_reviews_date_created',
+            table_name='reviews',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,54 @@
+"""Cascade deletes
+
+Revision ID: 39a8e2792a23
+Revises: 15049afb924a
+Create Date: 2026-10-19 11:26:05.914382
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = '39a8e2792a23'
+down_revision: Union[str, Sequence[str], None] = '15049afb924a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (constraint, table, column, referred table, referred column). The constraints
+# were created unnamed, so these are postgres' default names.
+FOREIGN_KEYS = (
+    ('beers_company_id_fkey', 'beers', 'company_id', 'breweries', 'id'),
+    ('beers_company_fkey', 'beers', 'company', 'breweries', 'name'),
+    ('reviews_beer_id_fkey', 'reviews', 'beer_id', 'beers', 'id'),
+    ('reviews_beer_name_fkey', 'reviews', 'beer_name', 'beers', 'name'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Let postgres remove the beers of a brewery and the reviews of a beer so
+    # deletes run as a single statement instead of the ORM loading children
+    for name, table, column, referred_table, referred_column in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(
+            name,
+            table,
+            referred_table,
+            [column],
+            [referred_column],
+            ondelete='CASCADE',
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, column, referred_table, referred_column in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(
+            name, table, referred_table, [column], [referred_column]
+        )
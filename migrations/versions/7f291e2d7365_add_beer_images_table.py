@@ -0,0 +1,42 @@
+"""Add beer images table
+
+Revision ID: 7f291e2d7365
+Revises: ddd4aa607a20
+Create Date: 2026-10-19 17:48:26.204113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f291e2d7365'
+down_revision: Union[str, Sequence[str], None] = 'ddd4aa607a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The image of each beer, by its key in the content addressed image store.
+    # Deleting a beer deletes its row and the garbage collection then removes
+    # images nothing references through the path index.
+    op.create_table('beer_images',
+    sa.Column('beer_id', sa.Uuid(), nullable=False),
+    sa.Column('path', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('content_type', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('last_updated', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.ForeignKeyConstraint(['beer_id'], ['beers.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('beer_id')
+    )
+    op.create_index(op.f('ix_beer_images_path'), 'beer_images', ['path'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_beer_images_path'), table_name='beer_images')
+    op.drop_table('beer_images')
@@ -0,0 +1,74 @@
+"""Add change notify triggers
+
+Revision ID: 85809bcaf7e6
+Revises: 92d085a27ca4
+Create Date: 2026-10-19 09:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = '85809bcaf7e6'
+down_revision: Union[str, Sequence[str], None] = '92d085a27ca4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("beers", "breweries", "reviews")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Publish every committed row change on the beer_review_changes channel so
+    # each worker's ChangeListener can evict its in-process caches. The table
+    # name is passed as a trigger argument rather than read from TG_TABLE_NAME
+    # so the payload stays stable if a table is ever partitioned.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger AS $$
+        DECLARE
+            rec jsonb;
+            old_rec jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                rec := to_jsonb(OLD);
+            ELSE
+                rec := to_jsonb(NEW);
+            END IF;
+            IF TG_OP = 'UPDATE' THEN
+                old_rec := to_jsonb(OLD);
+            END IF;
+            PERFORM pg_notify(
+                'beer_review_changes',
+                json_build_object(
+                    'table', TG_ARGV[0],
+                    'op', TG_OP,
+                    'id', rec->>'id',
+                    'name', rec->>'name',
+                    'old_name', old_rec->>'name',
+                    'beer_id', rec->>'beer_id'
+                )::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    for table in TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_notify_change "
+            f"AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION notify_change('{table}')"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_change()")
@@ -0,0 +1,32 @@
+"""Add idempotency request hash
+
+Revision ID: b5e0c3f7a912
+Revises: 7f291e2d7365
+Create Date: 2026-10-19 19:12:07.482311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e0c3f7a912'
+down_revision: Union[str, Sequence[str], None] = '7f291e2d7365'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # sha256 of the body of the request that claimed a key, a retry with a
+    # different body is refused. Null for keys claimed before this migration.
+    op.add_column('idempotency_keys', sa.Column('request_hash', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('idempotency_keys', 'request_hash')
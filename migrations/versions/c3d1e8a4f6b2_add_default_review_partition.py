@@ -0,0 +1,122 @@
+"""Add default review partition
+
+Revision ID: c3d1e8a4f6b2
+Revises: b5e0c3f7a912
+Create Date: 2026-10-19 19:31:52.106248
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d1e8a4f6b2'
+down_revision: Union[str, Sequence[str], None] = 'b5e0c3f7a912'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# As installed by partition_reviews_by_month, plus the months of the reviews in
+# the default partition. Each month's rows are moved out of the default
+# partition before its partition is created, which postgres requires, with
+# change notifications suppressed as the reviews haven't changed. A detached
+# month keeps its name, so its reviews stay in the default partition.
+CREATE_PARTITIONS = """
+CREATE OR REPLACE FUNCTION create_reviews_partitions(
+    start_at timestamptz, end_at timestamptz
+) RETURNS integer AS $$
+DECLARE
+    bound timestamp;
+    partition_name text;
+    notify text := current_setting('beer_review.notify', true);
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('create_reviews_partitions'));
+    PERFORM set_config('beer_review.notify', 'off', true);
+    FOR bound IN
+        SELECT generate_series(
+            date_trunc('month', start_at AT TIME ZONE 'UTC'),
+            end_at AT TIME ZONE 'UTC',
+            interval '1 month'
+        )
+        UNION
+        SELECT date_trunc('month', date_created AT TIME ZONE 'UTC')
+        FROM reviews_default
+        ORDER BY 1
+    LOOP
+        partition_name := 'reviews_' || to_char(bound, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            CREATE TEMP TABLE reviews_moved (LIKE reviews) ON COMMIT DROP;
+            WITH moved AS (
+                DELETE FROM reviews_default
+                WHERE date_created >= bound AT TIME ZONE 'UTC'
+                AND date_created < (bound + interval '1 month') AT TIME ZONE 'UTC'
+                RETURNING *
+            )
+            INSERT INTO reviews_moved SELECT * FROM moved;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF reviews FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                to_char(bound, 'YYYY-MM-DD') || ' 00:00:00+00',
+                to_char(bound + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+            );
+            INSERT INTO reviews SELECT * FROM reviews_moved;
+            DROP TABLE reviews_moved;
+            created := created + 1;
+        END IF;
+    END LOOP;
+    PERFORM set_config('beer_review.notify', coalesce(notify, ''), true);
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# As installed by partition_reviews_by_month
+PREVIOUS_CREATE_PARTITIONS = """
+CREATE OR REPLACE FUNCTION create_reviews_partitions(
+    start_at timestamptz, end_at timestamptz
+) RETURNS integer AS $$
+DECLARE
+    bound timestamp := date_trunc('month', start_at AT TIME ZONE 'UTC');
+    partition_name text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('create_reviews_partitions'));
+    WHILE bound <= end_at AT TIME ZONE 'UTC' LOOP
+        partition_name := 'reviews_' || to_char(bound, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF reviews FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                to_char(bound, 'YYYY-MM-DD') || ' 00:00:00+00',
+                to_char(bound + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+            );
+            created := created + 1;
+        END IF;
+        bound := bound + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Reviews dated in a month without a partition, because partitions weren't
+    # created in time or the month was detached, land here instead of failing
+    # to insert. create_reviews_partitions moves them to their own month.
+    op.execute('CREATE TABLE reviews_default PARTITION OF reviews DEFAULT')
+    op.execute(CREATE_PARTITIONS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("SELECT create_reviews_partitions(now(), now())")
+    op.execute(PREVIOUS_CREATE_PARTITIONS)
+    # Left behind as a standalone table, like detached partitions, in case it
+    # still holds reviews of detached months
+    op.execute('ALTER TABLE reviews DETACH PARTITION reviews_default')
@@ -0,0 +1,66 @@
+"""Add score to change notifications
+
+Revision ID: d223fbff93ae
+Revises: 3298ec914e8f
+Create Date: 2026-10-19 14:02:37.518206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd223fbff93ae'
+down_revision: Union[str, Sequence[str], None] = '3298ec914e8f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NOTIFY_CHANGE = """
+CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger AS $$
+DECLARE
+    rec jsonb;
+    old_rec jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        old_rec := to_jsonb(OLD);
+    END IF;
+    PERFORM pg_notify(
+        'beer_review_changes',
+        json_build_object(
+            'table', TG_ARGV[0],
+            'op', TG_OP,
+            'id', rec->>'id',
+            'name', rec->>'name',
+            'old_name', old_rec->>'name',
+            'beer_id', rec->>'beer_id'{extra_fields}
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Beer scores change with every review, publishing the new score lets the
+    # autocomplete indexes keep their ranking up to date without a query
+    op.execute(
+        NOTIFY_CHANGE.format(
+            extra_fields=",\n            'score', (rec->>'score')::float8"
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(NOTIFY_CHANGE.format(extra_fields=''))
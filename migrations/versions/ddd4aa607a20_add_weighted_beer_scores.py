@@ -0,0 +1,67 @@
+"""Add weighted beer scores
+
+Revision ID: ddd4aa607a20
+Revises: 1a4a0201b1b1
+Create Date: 2026-10-19 17:12:08.562427
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ddd4aa607a20'
+down_revision: Union[str, Sequence[str], None] = '1a4a0201b1b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Matches the score_prior_weight setting, the prior is recalculated with the
+# configured weight by the dataserver
+PRIOR_WEIGHT = 10.0
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A single row holding the mean of every review and its weight
+    op.create_table('score_priors',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('mean', sa.Float(), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.Column('last_updated', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.add_column('beers', sa.Column('review_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('beers', sa.Column('weighted_score', sa.Float(), server_default='0', nullable=False))
+    op.alter_column('beers', 'review_count', server_default=None)
+    op.alter_column('beers', 'weighted_score', server_default=None)
+
+    # Backfilled without notifying every worker of every beer
+    op.execute("SET LOCAL beer_review.notify = 'off'")
+    op.execute(
+        'UPDATE beers SET review_count = counts.review_count '
+        'FROM (SELECT beer_id, count(*) AS review_count FROM reviews GROUP BY beer_id) '
+        'AS counts WHERE beers.id = counts.beer_id'
+    )
+    op.execute(
+        'INSERT INTO score_priors (id, mean, weight) '
+        f'SELECT 1, coalesce(avg(score), 0), {PRIOR_WEIGHT} FROM reviews'
+    )
+    op.execute(
+        'UPDATE beers SET weighted_score = '
+        '(review_count * score + prior.weight * prior.mean) / (review_count + prior.weight) '
+        'FROM score_priors AS prior WHERE prior.id = 1 AND review_count > 0'
+    )
+    # Serves orderby=weighted_score leaderboards
+    op.create_index(op.f('ix_beers_weighted_score'), 'beers', ['weighted_score'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_beers_weighted_score'), table_name='beers')
+    op.drop_column('beers', 'weighted_score')
+    op.drop_column('beers', 'review_count')
+    op.drop_table('score_priors')
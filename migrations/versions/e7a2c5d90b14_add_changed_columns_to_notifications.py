@@ -0,0 +1,108 @@
+"""Add changed columns to change notifications
+
+Revision ID: e7a2c5d90b14
+Revises: c3d1e8a4f6b2
+Create Date: 2026-10-19 21:02:37.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2c5d90b14'
+down_revision: Union[str, Sequence[str], None] = 'c3d1e8a4f6b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+GUARD = (
+    "\n    IF current_setting('beer_review.notify', true) = 'off' THEN"
+    "\n        RETURN NULL;"
+    "\n    END IF;"
+)
+
+# As installed by allow_suppressing_change_notifications, with the columns an
+# UPDATE changed
+NOTIFY_CHANGE = """
+CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger AS $$
+DECLARE
+    rec jsonb;
+    old_rec jsonb;
+    changed json;
+BEGIN{guard}
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        old_rec := to_jsonb(OLD);
+        SELECT coalesce(json_agg(new_col.key), '[]'::json) INTO changed
+        FROM jsonb_each(rec) AS new_col
+        WHERE new_col.value IS DISTINCT FROM old_rec -> new_col.key;
+    END IF;
+    PERFORM pg_notify(
+        'beer_review_changes',
+        json_build_object(
+            'table', TG_ARGV[0],
+            'op', TG_OP,
+            'id', rec->>'id',
+            'name', rec->>'name',
+            'old_name', old_rec->>'name',
+            'beer_id', rec->>'beer_id',
+            'score', (rec->>'score')::float8,
+            'changed', changed
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# As installed by allow_suppressing_change_notifications
+PREVIOUS_NOTIFY_CHANGE = """
+CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger AS $$
+DECLARE
+    rec jsonb;
+    old_rec jsonb;
+BEGIN{guard}
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        old_rec := to_jsonb(OLD);
+    END IF;
+    PERFORM pg_notify(
+        'beer_review_changes',
+        json_build_object(
+            'table', TG_ARGV[0],
+            'op', TG_OP,
+            'id', rec->>'id',
+            'name', rec->>'name',
+            'old_name', old_rec->>'name',
+            'beer_id', rec->>'beer_id',
+            'score', (rec->>'score')::float8
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Every review updates its beer's score, listeners that only care about
+    # other columns can skip those updates
+    op.execute(NOTIFY_CHANGE.format(guard=GUARD))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(PREVIOUS_NOTIFY_CHANGE.format(guard=GUARD))
@@ -0,0 +1,69 @@
+"""Allow suppressing change notifications
+
+Revision ID: f50bb7c44df9
+Revises: d223fbff93ae
+Create Date: 2026-10-19 15:11:08.402913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f50bb7c44df9'
+down_revision: Union[str, Sequence[str], None] = 'd223fbff93ae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NOTIFY_CHANGE = """
+CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger AS $$
+DECLARE
+    rec jsonb;
+    old_rec jsonb;
+BEGIN{guard}
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        old_rec := to_jsonb(OLD);
+    END IF;
+    PERFORM pg_notify(
+        'beer_review_changes',
+        json_build_object(
+            'table', TG_ARGV[0],
+            'op', TG_OP,
+            'id', rec->>'id',
+            'name', rec->>'name',
+            'old_name', old_rec->>'name',
+            'beer_id', rec->>'beer_id',
+            'score', (rec->>'score')::float8
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Bulk imports set beer_review.notify to off for their transaction and send
+    # a single notification per table afterwards instead of one per row
+    op.execute(
+        NOTIFY_CHANGE.format(
+            guard="\n    IF current_setting('beer_review.notify', true) = 'off' THEN"
+            "\n        RETURN NULL;"
+            "\n    END IF;"
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(NOTIFY_CHANGE.format(guard=''))
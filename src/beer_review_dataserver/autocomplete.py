@@ -0,0 +1,183 @@
+"""In-memory sorted indexes of names answering prefix searches."""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import heapq
+from typing import TYPE_CHECKING
+
+from sqlalchemy import literal
+from sqlmodel import col, select
+
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.models.breweries import Breweries
+
+from .notifications import CONNECTED, DISCONNECTED
+
+if TYPE_CHECKING:
+    import uuid
+
+    from sqlalchemy.orm import Mapped
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from .notifications import ChangeEvent, ChangeListener
+
+MAX_SUGGESTIONS = 50
+
+
+class NameIndex:
+    """
+    Names of a table kept sorted by their case folded form.
+
+    A prefix search is a binary search for the first match followed by a scan
+    of the matches, the best scoring of which are returned. The index is
+    updated in place by the routes writing to the table and by change
+    notifications from other workers. It is loaded on the first search after
+    the change listener connects and, like the caches, is only used while the
+    listener is connected. Otherwise searches go to the database.
+    """
+
+    def __init__(
+        self,
+        model: type[Beers | Breweries],
+        score: Mapped[float] | None = None,
+    ) -> None:
+        """Create an index of the names of model, ranked by the score column."""
+        self.model = model
+        self.table = str(model.__tablename__)
+        self.score = score
+        self.enabled = False
+        self.loaded = False
+        self._keys: list[tuple[str, str]] = []
+        self._names: dict[str, str] = {}
+        self._scores: dict[str, float] = {}
+        # Changes arriving while the index is being loaded, replayed afterwards
+        self._pending: list[ChangeEvent] | None = None
+        # Bumped whenever the index is cleared, a load that overlapped a clear
+        # is thrown away
+        self._version = 0
+        self._lock = asyncio.Lock()
+
+    def clear(self) -> None:
+        """Drop every name, the index is reloaded by the next search."""
+        self._version += 1
+        self.loaded = False
+        self._keys.clear()
+        self._names.clear()
+        self._scores.clear()
+
+    def add(self, identifier: uuid.UUID | str, name: str, score: float = 0) -> None:
+        """Add or update a record, replacing its old name if it was renamed."""
+        if not self.loaded:
+            return
+        identifier = str(identifier)
+        old_name = self._names.get(identifier)
+        if old_name != name:
+            if old_name is not None:
+                self._discard(old_name)
+            bisect.insort(self._keys, (name.casefold(), name))
+            self._names[identifier] = name
+        self._scores[name] = score
+
+    def remove(self, identifier: uuid.UUID | str) -> None:
+        """Remove a record."""
+        if not self.loaded:
+            return
+        name = self._names.pop(str(identifier), None)
+        if name is not None:
+            self._discard(name)
+
+    def _discard(self, name: str) -> None:
+        key = (name.casefold(), name)
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+        self._scores.pop(name, None)
+
+    def handle_change(self, event: ChangeEvent) -> None:
+        """Change listener callback."""
+        if event.op == CONNECTED:
+            self.clear()
+            self.enabled = True
+        elif event.op == DISCONNECTED:
+            self.enabled = False
+            self.clear()
+        elif self._pending is not None:
+            self._pending.append(event)
+        else:
+            self._apply(event)
+
+    def _apply(self, event: ChangeEvent) -> None:
+        if event.identifier is None:
+            self.clear()
+        elif event.op == "DELETE":
+            self.remove(event.identifier)
+        elif event.name is not None:
+            self.add(event.identifier, event.name, event.score or 0)
+
+    async def load(self, session: AsyncSession) -> None:
+        """Load every name and score from the database."""
+        score = self.score if self.score is not None else literal(0.0)
+        stmt = select(col(self.model.id), col(self.model.name), score)
+        self._pending = []
+        try:
+            version = self._version
+            rows = (await session.exec(stmt)).all()
+            if version != self._version:
+                return
+            self.clear()
+            for identifier, name, row_score in rows:
+                self._names[str(identifier)] = name
+                self._scores[name] = row_score
+            self._keys = sorted((name.casefold(), name) for name in self._scores)
+            self.loaded = True
+            for event in self._pending:
+                self._apply(event)
+        finally:
+            self._pending = None
+
+    async def search(self, session: AsyncSession, prefix: str, limit: int) -> list[str]:
+        """Return the best scoring names starting with prefix, ignoring case."""
+        if not self.enabled:
+            return await self._search_database(session, prefix, limit)
+        if not self.loaded:
+            async with self._lock:
+                if not self.loaded:
+                    await self.load(session)
+            if not self.loaded:
+                return await self._search_database(session, prefix, limit)
+        folded = prefix.casefold()
+        index = bisect.bisect_left(self._keys, (folded, ""))
+        matches = []
+        while index < len(self._keys) and self._keys[index][0].startswith(folded):
+            matches.append(self._keys[index][1])
+            index += 1
+        # Matches are in name order and nlargest is stable, so ties stay sorted
+        return heapq.nlargest(limit, matches, key=self._scores.__getitem__)
+
+    async def _search_database(
+        self, session: AsyncSession, prefix: str, limit: int
+    ) -> list[str]:
+        stmt = (
+            select(col(self.model.name))
+            .where(col(self.model.name).istartswith(prefix, autoescape=True))
+            .limit(limit)
+        )
+        if self.score is not None:
+            stmt = stmt.order_by(self.score.desc())
+        stmt = stmt.order_by(col(self.model.name))
+        return list((await session.exec(stmt)).all())
+
+
+beer_names = NameIndex(Beers, score=col(Beers.score))
+# Breweries have no score of their own, so matches are returned by name
+brewery_names = NameIndex(Breweries)
+
+INDEXES: tuple[NameIndex, ...] = (beer_names, brewery_names)
+
+
+def register_indexes(listener: ChangeListener) -> None:
+    """Subscribe every index to its table."""
+    for index in INDEXES:
+        listener.subscribe(index.table, index.handle_change)
@@ -0,0 +1,152 @@
+"""In-process caches kept consistent by database change notifications."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, cast
+
+from .config import get_settings
+from .notifications import CONNECTED, DISCONNECTED
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Collection, Hashable
+
+    from .notifications import ChangeEvent, ChangeListener
+
+MISSING: Any = object()
+
+settings = get_settings()
+
+
+class LookupCache:
+    """
+    Least recently used cache of single records.
+
+    Entries are keyed by the record id or name and are evicted when a change
+    notification arrives for either of them. The cache only stores anything
+    while the change listener is connected, otherwise we would have no way of
+    knowing when another worker makes an entry stale.
+
+    Values are loaded outside the cache, so a change can arrive while one is
+    being loaded. Callers take the version before loading and pass it to set,
+    which ignores the value if the cache was invalidated in the meantime.
+    """
+
+    def __init__(self, *tables: str, maxsize: int = 1024) -> None:
+        """Create a cache invalidated by changes to the given tables."""
+        self.tables = tables
+        self.maxsize = maxsize
+        self.enabled = False
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        # Bumped whenever entries are dropped, a value loaded before that may
+        # already be stale
+        self.version = 0
+
+    def get(self, key: Hashable) -> Any:  # noqa: ANN401
+        """Return the cached value or MISSING."""
+        if not self.enabled or key not in self._data:
+            return MISSING
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def set(self, key: Hashable, value: Any, version: int) -> None:  # noqa: ANN401
+        """
+        Store a value, dropping the least recently used entry when full.
+
+        version is the cache's version from before the value was loaded, the
+        value is discarded if the cache has been invalidated since.
+        """
+        if not self.enabled or version != self.version:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self.version += 1
+        self._data.clear()
+
+    def evict(self, event: ChangeEvent) -> None:
+        """Drop the entries affected by a change to a single record."""
+        self.version += 1
+        for key in event.keys:
+            self._data.pop(key, None)
+
+    def handle_change(self, event: ChangeEvent) -> None:
+        """Change listener callback."""
+        if event.op == CONNECTED:
+            self.clear()
+            self.enabled = True
+        elif event.op == DISCONNECTED:
+            self.enabled = False
+            self.clear()
+        elif event.identifier is None:
+            self.clear()
+        else:
+            self.evict(event)
+
+
+class ListingCache(LookupCache):
+    """
+    Cache of query results spanning many records.
+
+    Entries are keyed by the query parameters, so an insert or delete clears
+    the whole cache. An update only drops the entries depending on a column it
+    changed, given by columns for each key, so the score updates of every new
+    review don't empty it. Keys are watched from their first miss, so a value
+    loaded meanwhile is discarded by set as well.
+    """
+
+    def __init__(
+        self,
+        *tables: str,
+        columns: Callable[[Hashable], Collection[str]],
+        maxsize: int = 1024,
+    ) -> None:
+        """Create a cache of listings built from columns of the given tables."""
+        super().__init__(*tables, maxsize=maxsize)
+        self.columns = columns
+        # Columns of every key looked up so far
+        self._watched: set[str] = set()
+
+    def get(self, key: Hashable) -> Any:  # noqa: ANN401
+        """Return the cached value or MISSING, watching the key's columns."""
+        value = super().get(key)
+        if value is MISSING:
+            self._watched.update(self.columns(key))
+        return value
+
+    def evict(self, event: ChangeEvent) -> None:
+        """Drop the entries that may hold the record."""
+        if event.op != "UPDATE" or event.changed is None:
+            self.clear()
+        elif not event.changed.isdisjoint(self._watched):
+            self.version += 1
+            for key in list(self._data):
+                if not event.changed.isdisjoint(self.columns(key)):
+                    del self._data[key]
+
+
+def listing_columns(key: Hashable) -> set[str]:
+    """Return the columns a /beers/list-beers listing depends on."""
+    _offset, _limit, orderby, _order = cast("tuple", key)
+    return {"name"} if orderby is None else {"name", orderby}
+
+
+# Brewery name -> id, used when resolving the brewery of a new beer
+brewery_ids = LookupCache("breweries", maxsize=settings.cache_size)
+# Query parameters -> beer names returned from /beers/list-beers
+beer_name_listings = ListingCache(
+    "beers", columns=listing_columns, maxsize=settings.cache_size
+)
+
+CACHES: tuple[LookupCache, ...] = (brewery_ids, beer_name_listings)
+
+
+def register_caches(listener: ChangeListener) -> None:
+    """Subscribe every cache to the tables it depends on."""
+    for cache in CACHES:
+        for table in cache.tables:
+            listener.subscribe(table, cache.handle_change)
@@ -0,0 +1,196 @@
+"""Serialised snapshot of the beer and brewery catalog held in memory."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import logging
+import time
+import uuid  # noqa: TC003
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from pydantic import BaseModel
+from sqlmodel import col, select
+
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.models.breweries import Breweries
+
+from .notifications import CONNECTED, DISCONNECTED
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from .notifications import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+# The columns of beers and breweries held in the catalog, updates to any other
+# column, like the score every new review updates, leave it as it is
+CATALOG_COLUMNS = frozenset({"id", "name", "company"})
+
+
+class CatalogBrewery(BaseModel):
+    """A brewery in the catalog."""
+
+    id: uuid.UUID
+    name: str
+
+
+class CatalogBeer(BaseModel):
+    """A beer in the catalog."""
+
+    id: uuid.UUID
+    name: str
+    company: str
+
+
+class Catalog(BaseModel):
+    """Every brewery and beer, ordered by name."""
+
+    breweries: list[CatalogBrewery]
+    beers: list[CatalogBeer]
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """A serialised catalog, compressed ahead of time."""
+
+    body: bytes
+    gzip_body: bytes
+    etag: str
+
+    @classmethod
+    def from_body(cls, body: bytes) -> Snapshot:
+        """Compress the body and derive the ETag from its contents."""
+        # The ETag only depends on the contents so every worker hands out the
+        # same one for the same catalog
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        return cls(
+            body=body,
+            gzip_body=gzip.compress(body, mtime=0),
+            etag=f'"{digest}"',
+        )
+
+
+class CatalogSnapshot:
+    """
+    Keep a serialised catalog in memory and rebuild it when it changes.
+
+    Inserts and deletes of beers or breweries, and updates to the columns it
+    holds, mark the snapshot stale and it is rebuilt in the background after
+    rebuild_delay seconds, so a burst of writes only causes one rebuild. The
+    score updates of new reviews are ignored. While the change listener isn't
+    connected a snapshot is only served for ttl seconds before being rebuilt,
+    as changes made by other workers can't be seen. Rebuilds are serialised, so
+    concurrent requests finding the snapshot missing or expired wait for one
+    rebuild.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        rebuild_delay: float,
+        ttl: float = 5.0,
+    ) -> None:
+        """Create the snapshot, start must be called to build it."""
+        self._session_factory = session_factory
+        self.rebuild_delay = rebuild_delay
+        self.ttl = ttl
+        self.enabled = False
+        self._snapshot: Snapshot | None = None
+        self._built_at = 0.0
+        self._lock = asyncio.Lock()
+        self._stale = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def handle_change(self, event: ChangeEvent) -> None:
+        """Change listener callback for the beers and breweries tables."""
+        if event.op in {CONNECTED, DISCONNECTED}:
+            # Changes may have been missed while disconnected
+            self.enabled = event.op == CONNECTED
+            self._snapshot = None
+        elif not event.changes_any(CATALOG_COLUMNS):
+            return
+        self._stale.set()
+
+    def _current(self) -> Snapshot | None:
+        """Return the snapshot if it can still be served."""
+        if self.enabled or time.monotonic() - self._built_at < self.ttl:
+            return self._snapshot
+        return None
+
+    async def get(self) -> Snapshot:
+        """Return the current snapshot, building one if there isn't any."""
+        snapshot = self._current()
+        if snapshot is None:
+            built_at = self._built_at
+            async with self._lock:
+                # Unless another request rebuilt it while this one waited
+                if self._built_at == built_at or (snapshot := self._current()) is None:
+                    snapshot = await self._rebuild()
+        return snapshot
+
+    async def rebuild(self) -> Snapshot:
+        """Load the catalog from the database and serialise it."""
+        async with self._lock:
+            return await self._rebuild()
+
+    async def _rebuild(self) -> Snapshot:
+        async with self._session_factory() as session:
+            breweries = (
+                await session.exec(
+                    select(Breweries.id, Breweries.name).order_by(col(Breweries.name))
+                )
+            ).all()
+            beers = (
+                await session.exec(
+                    select(Beers.id, Beers.name, Beers.company).order_by(
+                        col(Beers.name)
+                    )
+                )
+            ).all()
+        catalog = Catalog(
+            breweries=[
+                CatalogBrewery.model_validate(row, from_attributes=True)
+                for row in breweries
+            ],
+            beers=[
+                CatalogBeer.model_validate(row, from_attributes=True) for row in beers
+            ],
+        )
+        snapshot = Snapshot.from_body(catalog.model_dump_json().encode())
+        self._snapshot = snapshot
+        self._built_at = time.monotonic()
+        return snapshot
+
+    async def start(self) -> None:
+        """Build the snapshot and keep rebuilding it in the background."""
+        if self._task is None:
+            self._stale.set()
+            self._task = asyncio.create_task(self._run(), name="catalog-snapshot")
+
+    async def stop(self) -> None:
+        """Stop rebuilding the snapshot."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self._stale.wait()
+            await asyncio.sleep(self.rebuild_delay)
+            # Cleared before loading so changes made during the rebuild mark
+            # the new snapshot stale again
+            self._stale.clear()
+            if not self.enabled:
+                continue
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("Failed to rebuild the catalog snapshot")
@@ -0,0 +1,302 @@
+"""Beer Dataserver command line interface."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import time
+from pathlib import Path
+
+# The tables import and export work on, in the order they reference each other
+TABLES = ("breweries", "beers", "reviews")
+
+
+def positive_int(value: str) -> int:
+    """Parse an argument that must be a whole number of at least 1."""
+    number = int(value)
+    if number < 1:
+        msg = f"must be at least 1, not {number}"
+        raise argparse.ArgumentTypeError(msg)
+    return number
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Return the argument parser for the beer_dataserver command."""
+    parser = argparse.ArgumentParser(
+        prog="beer_dataserver",
+        description="REST API dataserver for the beer review website.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("serve", help="Start the dataserver (default)")
+    subparsers.add_parser(
+        "indexes", help="List the indexes used by the queries behind each route"
+    )
+    reconcile = subparsers.add_parser(
+        "reconcile-scores",
+        help="Recalculate every beer score and weighted score from its reviews",
+    )
+    reconcile.add_argument(
+        "--batch-size",
+        type=positive_int,
+        default=None,
+        help="Beers updated per transaction (default: score_reconcile_batch_size)",
+    )
+    bulk_import = subparsers.add_parser(
+        "import",
+        help="Load breweries, beers and reviews from CSV or NDJSON files",
+        description=(
+            "Load breweries (name), beers (name, company) and reviews (username, "
+            "score, comment, beer_name, date_created) from CSV files with a "
+            "header or NDJSON files. Breweries and beers are referenced by name."
+        ),
+    )
+    bulk_import.add_argument("--breweries", type=Path, help="Breweries file")
+    bulk_import.add_argument("--beers", type=Path, help="Beers file")
+    bulk_import.add_argument("--reviews", type=Path, help="Reviews file")
+    bulk_import.add_argument(
+        "--chunk-size", type=int, default=10_000, help="Rows sent per COPY"
+    )
+    bulk_import.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Connections copying chunks in parallel",
+    )
+    export = subparsers.add_parser(
+        "export",
+        help="Write breweries, beers and reviews to Parquet files",
+        description=(
+            "Write the rows changed since the last export to a new Parquet file "
+            "per table under OUTPUT/<table>/."
+        ),
+    )
+    export.add_argument("output", type=Path, help="Directory to export into")
+    export.add_argument(
+        "--tables",
+        nargs="+",
+        choices=TABLES,
+        default=list(TABLES),
+        help="Tables to export (default: all)",
+    )
+    export.add_argument(
+        "--full", action="store_true", help="Export every row, not only changes"
+    )
+    export.add_argument(
+        "--since",
+        type=datetime.datetime.fromisoformat,
+        help="Export rows changed after this ISO 8601 time instead",
+    )
+    export.add_argument(
+        "--batch-size", type=int, default=10_000, help="Rows fetched at a time"
+    )
+    partitions = subparsers.add_parser(
+        "partitions", help="Manage the monthly partitions of the reviews table"
+    )
+    partition_commands = partitions.add_subparsers(
+        dest="partitions_command", required=True
+    )
+    partition_commands.add_parser("list", help="List the partitions of reviews")
+    create = partition_commands.add_parser(
+        "create", help="Create the partitions of the coming months"
+    )
+    create.add_argument(
+        "--months-ahead",
+        type=int,
+        default=None,
+        help="Months to create ahead of today (default: review_partitions_ahead)",
+    )
+    detach = partition_commands.add_parser(
+        "detach",
+        help="Detach the partition of a month from reviews",
+        description=(
+            "Detach the partition of a month so it stops being vacuumed and "
+            "searched with the rest of reviews. The scores of the beers reviewed "
+            "that month are recalculated without its reviews. It's kept as a "
+            "standalone table unless --drop is given."
+        ),
+    )
+    detach.add_argument("month", type=_month, help="Month to detach, as YYYY-MM")
+    detach.add_argument(
+        "--archive",
+        type=Path,
+        help="Directory to write the reviews of the month to as a CSV file",
+    )
+    detach.add_argument(
+        "--drop", action="store_true", help="Drop the partition once detached"
+    )
+    gc_images = subparsers.add_parser(
+        "gc-images", help="Delete the stored images no beer uses any more"
+    )
+    gc_images.add_argument(
+        "--grace",
+        type=float,
+        default=None,
+        help="Keep images changed in the last GRACE seconds (default: image_gc_grace)",
+    )
+    return parser
+
+
+def _month(value: str) -> datetime.date:
+    return datetime.datetime.strptime(value, "%Y-%m").date()  # noqa: DTZ007
+
+
+async def _partitions(args: argparse.Namespace) -> None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: PLC0415
+    from sqlmodel.ext.asyncio.session import AsyncSession  # noqa: PLC0415
+
+    from .dependencies import engine, settings  # noqa: PLC0415
+    from .partitions import (  # noqa: PLC0415
+        create_review_partitions,
+        detach_review_partition,
+        list_review_partitions,
+    )
+
+    match args.partitions_command:
+        case "list":
+            for partition in await list_review_partitions(settings.postgres_uri):
+                print(
+                    f"{partition.name}: {partition.bounds}, "
+                    f"~{partition.rows} rows, {partition.size}"
+                )
+        case "create":
+            session_factory = async_sessionmaker(
+                bind=engine, class_=AsyncSession, expire_on_commit=False
+            )
+            months_ahead = (
+                args.months_ahead
+                if args.months_ahead is not None
+                else settings.review_partitions_ahead
+            )
+            created = await create_review_partitions(session_factory, months_ahead)
+            await engine.dispose()
+            print(f"Created {created} partitions")
+        case "detach":
+            session_factory = async_sessionmaker(
+                bind=engine, class_=AsyncSession, expire_on_commit=False
+            )
+            name = await detach_review_partition(
+                session_factory, args.month, args.archive, drop=args.drop
+            )
+            await engine.dispose()
+            print(f"Detached {name}")
+
+
+async def _export(args: argparse.Namespace) -> None:
+    from .config import get_settings  # noqa: PLC0415
+    from .exporter import export_tables, read_state  # noqa: PLC0415
+
+    if args.since is not None:
+        since = dict.fromkeys(args.tables, args.since)
+    elif args.full:
+        since = {}
+    else:
+        since = read_state(args.output)
+    exported = await export_tables(
+        get_settings().postgres_uri,
+        args.output,
+        args.tables,
+        since,
+        args.batch_size,
+    )
+    for name, rows in exported.items():
+        print(f"Exported {rows} {name}")
+
+
+async def _import(args: argparse.Namespace) -> None:
+    from .config import get_settings  # noqa: PLC0415
+    from .importer import import_files  # noqa: PLC0415
+
+    files = {name: path for name in TABLES if (path := getattr(args, name)) is not None}
+    started = time.perf_counter()
+    inserted = await import_files(
+        get_settings().postgres_uri,
+        files,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+    )
+    elapsed = time.perf_counter() - started
+    for name, rows in inserted.items():
+        print(f"Inserted {rows} {name}")
+    print(f"Import finished in {elapsed:.1f}s")
+
+
+async def _indexes() -> None:
+    from .dependencies import engine  # noqa: PLC0415
+    from .indexes import print_index_usage  # noqa: PLC0415
+
+    await print_index_usage(engine)
+    await engine.dispose()
+
+
+async def _reconcile_scores(batch_size: int | None) -> None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: PLC0415
+    from sqlmodel.ext.asyncio.session import AsyncSession  # noqa: PLC0415
+
+    from .dependencies import engine, settings  # noqa: PLC0415
+    from .scores import reconcile_scores, refresh_weighted_scores  # noqa: PLC0415
+
+    session_factory = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    corrected = await reconcile_scores(
+        session_factory,
+        batch_size if batch_size is not None else settings.score_reconcile_batch_size,
+    )
+    refreshed = await refresh_weighted_scores(
+        session_factory, settings.score_prior_weight
+    )
+    await engine.dispose()
+    print(f"Corrected {corrected} beer scores")
+    print(f"Refreshed {refreshed} weighted scores")
+
+
+async def _gc_images(grace: float | None) -> None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: PLC0415
+    from sqlmodel.ext.asyncio.session import AsyncSession  # noqa: PLC0415
+
+    from .dependencies import engine, image_store, settings  # noqa: PLC0415
+    from .images import collect_image_garbage  # noqa: PLC0415
+
+    session_factory = async_sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    removed = await collect_image_garbage(
+        session_factory,
+        image_store,
+        settings.image_gc_grace if grace is None else grace,
+    )
+    await engine.dispose()
+    print(f"Removed {removed} unreferenced images")
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Run a beer_dataserver subcommand, starting the dataserver by default."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    match args.command:
+        case "indexes":
+            asyncio.run(_indexes())
+        case "reconcile-scores":
+            asyncio.run(_reconcile_scores(args.batch_size))
+        case "import":
+            if not (args.breweries or args.beers or args.reviews):
+                parser.error(
+                    "import needs at least one of --breweries, --beers or --reviews"
+                )
+            asyncio.run(_import(args))
+        case "export":
+            asyncio.run(_export(args))
+        case "partitions":
+            asyncio.run(_partitions(args))
+        case "gc-images":
+            asyncio.run(_gc_images(args.grace))
+        case _:
+            # Imported here as importing the app mounts the image directory
+            from .main import main as serve  # noqa: PLC0415
+
+            serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Time budgets for the statements run on behalf of a request."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+
+from .config import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from fastapi import Request
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.orm import Session, SessionTransaction
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+settings = get_settings()
+
+# query_canceled, raised when statement_timeout is reached
+QUERY_CANCELED = "57014"
+
+# Statements cancelled by statement_timeout, by route
+timeouts: Counter[str] = Counter()
+# Requests cancelled because the client went away, by route
+disconnects: Counter[str] = Counter()
+
+
+class ClientDisconnectedError(Exception):
+    """Raised in place of the cancellation of a request whose client has left."""
+
+
+def route_key(request: Request) -> str:
+    """Return the method and path template of the route handling a request."""
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    return f"{request.method} {path}"
+
+
+def route_timeout(key: str) -> float:
+    """Return the statement timeout of a route in seconds, 0 for none."""
+    return settings.route_statement_timeouts.get(key, settings.statement_timeout)
+
+
+def apply_statement_timeout(session: AsyncSession, timeout: float) -> None:
+    """
+    Limit every statement run by the session to timeout seconds.
+
+    The limit is set with SET LOCAL at the start of every transaction the
+    session begins, so it never leaks to the next user of the pooled
+    connection. A timeout of 0 leaves the server default in place.
+    """
+    if timeout <= 0:
+        return
+    milliseconds = int(timeout * 1000)
+
+    @event.listens_for(session.sync_session, "after_begin")
+    def _set_timeout(
+        _session: Session, _transaction: SessionTransaction, connection: Connection
+    ) -> None:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {milliseconds}")
+
+
+def is_statement_timeout(exc: BaseException) -> bool:
+    """Return whether an exception is postgres cancelling a statement."""
+    return (
+        isinstance(exc, DBAPIError)
+        and getattr(exc.orig, "sqlstate", None) == QUERY_CANCELED
+    )
+
+
+async def _wait_for_disconnect(request: Request, task: asyncio.Task) -> None:
+    # The body has already been read by the time dependencies are solved, so
+    # the next message is the client going away
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+    task.cancel(ClientDisconnectedError.__name__)
+
+
+@contextlib.asynccontextmanager
+async def cancel_on_disconnect(request: Request) -> AsyncIterator[None]:
+    """
+    Cancel the current request when its client disconnects.
+
+    Cancelling the request cancels the statement it is waiting on, so the
+    pooled connection is released straight away. The cancellation comes out
+    as ClientDisconnectedError.
+    """
+    task = asyncio.current_task()
+    if task is None:
+        yield
+        return
+    watcher = asyncio.create_task(_wait_for_disconnect(request, task))
+    try:
+        yield
+    except asyncio.CancelledError as exc:
+        if not watcher.done() or watcher.cancelled():
+            raise
+        task.uncancel()
+        disconnects[route_key(request)] += 1
+        raise ClientDisconnectedError from exc
+    finally:
+        watcher.cancel()
@@ -2,28 +2,111 @@
 
 from collections.abc import AsyncGenerator, AsyncIterator
 from contextlib import asynccontextmanager
+from functools import partial
+from pathlib import Path
 from typing import Annotated
 
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Request
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from beer_review_dataserver.models.beers import Beers
 from beer_review_dataserver.models.breweries import Breweries
+from beer_review_dataserver.models.idempotency import IdempotencyKeys
+from beer_review_dataserver.models.images import BeerImages
 from beer_review_dataserver.models.reviews import Reviews
+from beer_review_dataserver.models.scores import ScorePriors
 
+from .autocomplete import register_indexes
+from .cache import register_caches
+from .catalog import CatalogSnapshot
 from .config import get_settings
+from .deadlines import (
+    apply_statement_timeout,
+    cancel_on_disconnect,
+    is_statement_timeout,
+    route_key,
+    route_timeout,
+    timeouts,
+)
+from .feed import ReviewFeed
+from .group_commit import ReviewBatcher
+from .idempotency import purge_idempotency_keys
+from .images import ImageStore, collect_image_garbage
+from .logs import configure_logging
+from .notifications import ChangeListener
+from .partitions import create_review_partitions
+from .profiling import ProfileStore, instrument_engine
+from .recommendations import Recommender
+from .routers.common import QUERY_TIMEOUT
+from .scores import reconcile_scores, refresh_weighted_scores
+from .similarity import SimilarityOptions
+from .tasks import BackgroundTasks
+from .warmup import Readiness, warm_up
 
 settings = get_settings()
 
 engine = create_async_engine(settings.postgres_uri)
 
-async_engine = create_async_engine(settings.postgres_uri, echo=True, future=True)
+async_engine = create_async_engine(
+    settings.postgres_uri,
+    future=True,
+    pool_size=settings.pool_size,
+    max_overflow=settings.pool_max_overflow,
+)
+
+instrument_engine(async_engine.sync_engine)
 
 async_session = async_sessionmaker(
     bind=async_engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# One listener per worker, shared by everything that needs to know when another
+# worker has changed the database.
+change_listener = ChangeListener(settings.postgres_uri)
+
+review_feed = ReviewFeed(
+    async_session,
+    max_connections=settings.feed_max_connections,
+    queue_size=settings.feed_queue_size,
+)
+
+review_batcher = ReviewBatcher(
+    async_session,
+    window=settings.review_batch_window,
+    max_size=settings.review_batch_size,
+)
+
+catalog_snapshot = CatalogSnapshot(
+    async_session,
+    rebuild_delay=settings.catalog_rebuild_delay,
+    ttl=settings.catalog_ttl,
+)
+
+recommender = Recommender(
+    async_session,
+    SimilarityOptions(
+        neighbours=settings.recommendation_neighbours,
+        min_overlap=settings.recommendation_min_overlap,
+        shrinkage=settings.recommendation_shrinkage,
+    ),
+    update_delay=settings.recommendation_update_delay,
+    rebuild_interval=settings.recommendation_rebuild_interval,
+)
+
+background_tasks = BackgroundTasks()
+
+readiness = Readiness()
+
+image_store = ImageStore(
+    Path(settings.image_dir)
+    if settings.image_dir
+    else Path(__file__).resolve().parent / "images"
+)
+
+profile_store = ProfileStore(Path(settings.profile_dir), keep=settings.profile_keep)
+
 
 async def create_db_and_tables() -> None:
     """Create the tables in the database if they don't already exist."""
@@ -31,20 +114,124 @@ async def create_db_and_tables() -> None:
         await conn.run_sync(Beers.metadata.create_all)
         await conn.run_sync(Breweries.metadata.create_all)
         await conn.run_sync(Reviews.metadata.create_all)
-
-
-async def get_session() -> AsyncGenerator[AsyncSession]:
-    """Return the session into the database when we access certain endpoints."""
-    async with async_session() as session:
-        yield session
+        await conn.run_sync(IdempotencyKeys.metadata.create_all)
+        await conn.run_sync(ScorePriors.metadata.create_all)
+        await conn.run_sync(BeerImages.metadata.create_all)
+
+
+async def get_session(request: Request) -> AsyncGenerator[AsyncSession]:
+    """
+    Return the session into the database when we access certain endpoints.
+
+    Statements are limited to the time budget of the route and are cancelled if
+    the client disconnects. The session is closed once the response has been
+    serialised, before it's sent, so the disconnect every client makes after
+    its response can't cancel the request while it closes the session.
+    """
+    key = route_key(request)
+    async with async_session() as session, cancel_on_disconnect(request):
+        apply_statement_timeout(session, route_timeout(key))
+        try:
+            yield session
+        except DBAPIError as exc:
+            if not is_statement_timeout(exc):
+                raise
+            timeouts[key] += 1
+            raise QUERY_TIMEOUT from exc
 
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
     """Create the db and tables if you dont use alembic."""
+    log_listener = configure_logging(
+        settings.log_level,
+        json_format=settings.log_format == "json",
+        log_sql=settings.log_sql,
+    )
     # Not needed if you setup a migration system like Alembic
     await create_db_and_tables()
+    register_caches(change_listener)
+    register_indexes(change_listener)
+    change_listener.subscribe("reviews", review_feed.handle_change)
+    change_listener.subscribe("beers", catalog_snapshot.handle_change)
+    change_listener.subscribe("breweries", catalog_snapshot.handle_change)
+    if settings.recommendations:
+        change_listener.subscribe("beers", recommender.handle_change)
+        change_listener.subscribe("reviews", recommender.handle_change)
+        await recommender.start()
+    if settings.review_batch_window:
+        await review_batcher.start()
+    if settings.change_listener:
+        await change_listener.start()
+        await review_feed.start()
+        await catalog_snapshot.start()
+    if settings.score_reconcile_interval:
+        background_tasks.run_periodically(
+            settings.score_reconcile_interval,
+            partial(
+                reconcile_scores,
+                async_session,
+                batch_size=settings.score_reconcile_batch_size,
+            ),
+            name="reconcile-scores",
+        )
+    if settings.weighted_score_interval:
+        background_tasks.run_periodically(
+            settings.weighted_score_interval,
+            partial(
+                refresh_weighted_scores,
+                async_session,
+                prior_weight=settings.score_prior_weight,
+            ),
+            name="refresh-weighted-scores",
+        )
+    if settings.review_partition_interval:
+        background_tasks.run_periodically(
+            settings.review_partition_interval,
+            partial(
+                create_review_partitions,
+                async_session,
+                months_ahead=settings.review_partitions_ahead,
+            ),
+            name="create-review-partitions",
+        )
+    if settings.image_gc_interval:
+        background_tasks.run_periodically(
+            settings.image_gc_interval,
+            partial(
+                collect_image_garbage,
+                async_session,
+                image_store,
+                grace=settings.image_gc_grace,
+            ),
+            name="collect-image-garbage",
+        )
+    background_tasks.run_periodically(
+        settings.idempotency_purge_interval,
+        partial(purge_idempotency_keys, async_session),
+        name="purge-idempotency-keys",
+    )
+    # Connections beyond pool_size would be closed as soon as they're returned
+    background_tasks.run(
+        partial(
+            warm_up,
+            async_engine,
+            async_session,
+            readiness,
+            min(settings.warmup_connections, settings.pool_size),
+        ),
+        name="warm-up",
+    )
     yield
-
-
-SessionDep = Annotated[AsyncSession, Depends(get_session)]
+    readiness.ready = False
+    await background_tasks.stop()
+    await review_batcher.stop()
+    await recommender.stop()
+    await catalog_snapshot.stop()
+    await review_feed.stop()
+    await change_listener.stop()
+    # Writes out whatever is still queued
+    log_listener.stop()
+
+
+SessionDep = Annotated[AsyncSession, Depends(get_session, scope="function")]
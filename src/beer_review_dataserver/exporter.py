@@ -0,0 +1,196 @@
+"""Export of breweries, beers and reviews to Parquet files for analytics."""
+
+from __future__ import annotations
+
+import datetime
+import json
+from typing import TYPE_CHECKING, Any
+
+import asyncpg
+
+from .importer import Progress
+from .notifications import asyncpg_dsn
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    import pyarrow as pa
+
+# (column, select expression, arrow type) of each exported table. Ids are
+# exported as text as not every reader understands the arrow uuid type.
+EXPORT_TABLES: dict[str, tuple[tuple[str, str, str], ...]] = {
+    "breweries": (
+        ("id", "id::text", "string"),
+        ("name", "name", "string"),
+        ("last_updated", "last_updated", "timestamp"),
+        ("date_created", "date_created", "timestamp"),
+    ),
+    "beers": (
+        ("id", "id::text", "string"),
+        ("name", "name", "string"),
+        ("company", "company", "string"),
+        ("company_id", "company_id::text", "string"),
+        ("score", "score", "float64"),
+        ("review_count", "review_count", "int64"),
+        ("weighted_score", "weighted_score", "float64"),
+        ("last_updated", "last_updated", "timestamp"),
+        ("date_created", "date_created", "timestamp"),
+    ),
+    "reviews": (
+        ("id", "id::text", "string"),
+        ("username", "username", "string"),
+        ("score", "score", "float64"),
+        ("comment", "comment", "string"),
+        ("beer_name", "beer_name", "string"),
+        ("beer_id", "beer_id::text", "string"),
+        ("last_updated", "last_updated", "timestamp"),
+        ("date_created", "date_created", "timestamp"),
+    ),
+}
+
+# Remembers where the next incremental export of each table starts from
+STATE_FILE = "export_state.json"
+
+# last_updated is set when a write's transaction starts, or by the dataserver
+# before that, so a row committed after an export's snapshot was taken can
+# carry an earlier time. The next export starts this long before the snapshot
+# to pick those rows up, so rows near the boundary are exported twice and
+# consumers should keep the newest row of each id.
+WATERMARK_OVERLAP = datetime.timedelta(minutes=10)
+
+
+def _schema(table: str) -> pa.Schema:
+    import pyarrow as pa  # noqa: PLC0415
+
+    types = {
+        "string": pa.string(),
+        "float64": pa.float64(),
+        "int64": pa.int64(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema(
+        [pa.field(column, types[kind]) for column, _, kind in EXPORT_TABLES[table]]
+    )
+
+
+def read_state(output: Path) -> dict[str, datetime.datetime]:
+    """Return the time the next export of each table starts from."""
+    path = output / STATE_FILE
+    if not path.exists():
+        return {}
+    state = json.loads(path.read_text())
+    return {
+        table: datetime.datetime.fromisoformat(value) for table, value in state.items()
+    }
+
+
+def write_state(output: Path, state: dict[str, datetime.datetime]) -> None:
+    """Save the time the next export of each table starts from."""
+    output.mkdir(parents=True, exist_ok=True)
+    path = output / STATE_FILE
+    path.write_text(
+        json.dumps({table: value.isoformat() for table, value in state.items()})
+    )
+
+
+async def export_table(
+    connection: asyncpg.Connection,
+    table: str,
+    path: Path,
+    since: datetime.datetime | None,
+    batch_size: int,
+) -> int:
+    """
+    Stream the rows of a table changed after since into a Parquet file.
+
+    Rows are read from a server side cursor batch_size at a time and written as
+    one row group each, so memory use doesn't grow with the table. No file is
+    written when there are no rows. Returns the rows exported.
+    """
+    import pyarrow as pa  # noqa: PLC0415
+    import pyarrow.parquet as pq  # noqa: PLC0415
+
+    schema = _schema(table)
+    columns = ", ".join(
+        f"{expression} AS {column}" for column, expression, _ in EXPORT_TABLES[table]
+    )
+    query = f"SELECT {columns} FROM {table}"  # noqa: S608
+    args: list[Any] = []
+    if since is not None:
+        query += " WHERE last_updated > $1"
+        args.append(since)
+
+    progress = Progress(f"Exporting {table}")
+    writer = None
+    partial = path.with_suffix(".partial")
+    try:
+        cursor = await connection.cursor(query, *args)
+        while rows := await cursor.fetch(batch_size):
+            batch = pa.RecordBatch.from_arrays(
+                [
+                    pa.array(values, type=field.type)
+                    for values, field in zip(
+                        zip(*rows, strict=True), schema, strict=True
+                    )
+                ],
+                schema=schema,
+            )
+            if writer is None:
+                writer = pq.ParquetWriter(partial, schema)
+            writer.write_batch(batch)
+            progress.advance(len(rows))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        # Only completed files appear under their final name
+        partial.replace(path)
+    progress.report()
+    return progress.rows
+
+
+async def export_tables(
+    postgres_uri: str,
+    output: Path,
+    tables: list[str],
+    since: dict[str, datetime.datetime],
+    batch_size: int = 10_000,
+) -> dict[str, int]:
+    """
+    Export tables to Parquet files under output, one directory per table.
+
+    :param postgres_uri: SQLAlchemy url of the database
+    :param output: Directory the files and export state are written to
+    :param tables: The tables to export
+    :param since: Only rows changed after this time are exported from each
+        table, every row is exported from tables missing from it
+    :param batch_size: Rows fetched from the cursor at a time
+
+    Every table is read from the same snapshot of the database, and the next
+    export of each table starts WATERMARK_OVERLAP before it. Incremental
+    exports only pick up inserted and updated rows, a full export is needed to
+    see deleted ones. Returns the rows exported from each table.
+    """
+    state = read_state(output)
+    stamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%SZ")
+    exported: dict[str, int] = {}
+    connection = await asyncpg.connect(asyncpg_dsn(postgres_uri))
+    try:
+        async with connection.transaction(isolation="repeatable_read", readonly=True):
+            # The first statement takes the snapshot every table is read from
+            snapshot_time = await connection.fetchval("SELECT now()")
+            for table in tables:
+                directory = output / table
+                directory.mkdir(parents=True, exist_ok=True)
+                exported[table] = await export_table(
+                    connection,
+                    table,
+                    directory / f"{table}-{stamp}.parquet",
+                    since.get(table),
+                    batch_size,
+                )
+                state[table] = snapshot_time - WATERMARK_OVERLAP
+    finally:
+        await connection.close()
+    write_state(output, state)
+    return exported
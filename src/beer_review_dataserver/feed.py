@@ -0,0 +1,216 @@
+"""Live feed of review changes pushed to connected clients."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import uuid
+from typing import TYPE_CHECKING
+
+from sqlmodel import col, select
+from starlette.responses import StreamingResponse
+
+from beer_review_dataserver.models.reviews import Reviews, ReviewsPublic
+
+from .notifications import CONNECTED, DISCONNECTED
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from starlette.types import Receive, Scope, Send
+
+    from .notifications import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+FEED_OPS = ("INSERT", "UPDATE")
+
+
+class FeedFullError(Exception):
+    """Raised when the worker already has the maximum number of subscribers."""
+
+
+class FeedUnavailableError(Exception):
+    """Raised when the change listener isn't connected, so nothing is published."""
+
+
+class FeedSubscription:
+    """A single connected client and the reviews queued up for it."""
+
+    def __init__(
+        self,
+        feed: ReviewFeed,
+        queue_size: int,
+        beer_name: str | None = None,
+        username: str | None = None,
+    ) -> None:
+        """Create a subscription, use ReviewFeed.subscribe instead."""
+        self.feed = feed
+        self.beer_name = beer_name
+        self.username = username
+        self.queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def matches(self, review: ReviewsPublic) -> bool:
+        """Return whether the client asked for this review."""
+        if self.beer_name is not None and review.beer_name != self.beer_name:
+            return False
+        return self.username is None or review.username == self.username
+
+    def push(self, review_id: str, data: str) -> None:
+        """
+        Queue a serialised review without waiting.
+
+        A client that can't keep up is marked as overflowed rather than
+        slowing down everyone else, its stream ends and it has to reconnect and
+        refetch what it missed.
+        """
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait((review_id, data))
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def stream(self, keepalive: float) -> AsyncIterator[str]:
+        """Yield server sent events until the client goes away."""
+        while not self.overflowed:
+            try:
+                review_id, data = await asyncio.wait_for(self.queue.get(), keepalive)
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: review\nid: {review_id}\ndata: {data}\n\n"
+        yield "event: overflow\ndata: {}\n\n"
+
+
+class FeedResponse(StreamingResponse):
+    """
+    Stream a subscription to its client, unsubscribing it once done.
+
+    Unsubscribes however the response ends, including before the stream has
+    started, so the slot taken by subscribing is always given back.
+    """
+
+    def __init__(self, subscription: FeedSubscription, keepalive: float) -> None:
+        """Stream the subscription's events, with a keepalive when idle."""
+        super().__init__(
+            subscription.stream(keepalive),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.subscription = subscription
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Send the response."""
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.subscription.feed.unsubscribe(self.subscription)
+
+
+class ReviewFeed:
+    """
+    Fan out review changes to every subscriber on this worker.
+
+    The feed listens to the shared ChangeListener, so however many clients are
+    connected each changed review is fetched and serialised once per worker.
+    Clients can only subscribe while the listener is connected, and are
+    disconnected with an overflow event when it disconnects, as they would
+    miss reviews.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        max_connections: int,
+        queue_size: int,
+    ) -> None:
+        """Create the feed, start must be called to begin processing changes."""
+        self._session_factory = session_factory
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self._subscriptions: set[FeedSubscription] = set()
+        self._pending: asyncio.Queue[uuid.UUID] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self.available = False
+
+    @property
+    def connections(self) -> int:
+        """Return the number of connected clients."""
+        return len(self._subscriptions)
+
+    def subscribe(
+        self, beer_name: str | None = None, username: str | None = None
+    ) -> FeedSubscription:
+        """
+        Start publishing reviews to a new client.
+
+        The client counts towards max_connections straight away, it must be
+        unsubscribed once done with, which FeedResponse takes care of.
+        """
+        if not self.available:
+            raise FeedUnavailableError
+        if self.connections >= self.max_connections:
+            raise FeedFullError
+        subscription = FeedSubscription(self, self.queue_size, beer_name, username)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: FeedSubscription) -> None:
+        """Remove a client."""
+        self._subscriptions.discard(subscription)
+
+    def handle_change(self, event: ChangeEvent) -> None:
+        """Change listener callback for the reviews table."""
+        if event.op == CONNECTED:
+            self.available = True
+        elif event.op == DISCONNECTED:
+            self.available = False
+            for subscription in self._subscriptions:
+                subscription.overflowed = True
+        if event.op not in FEED_OPS or event.identifier is None:
+            return
+        # Nobody is listening, so don't bother fetching the review
+        if not self._subscriptions:
+            return
+        self._pending.put_nowait(uuid.UUID(event.identifier))
+
+    async def start(self) -> None:
+        """Start publishing changes in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="review-feed")
+
+    async def stop(self) -> None:
+        """Stop publishing changes."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            review_ids = {await self._pending.get()}
+            # Pick up everything else that arrived in the meantime so a burst of
+            # reviews is loaded with a single query
+            while not self._pending.empty():
+                review_ids.add(self._pending.get_nowait())
+            try:
+                await self._publish(review_ids)
+            except Exception:
+                logger.exception("Failed to publish reviews to the feed")
+
+    async def _publish(self, review_ids: set[uuid.UUID]) -> None:
+        async with self._session_factory() as session:
+            stmt = select(Reviews).where(col(Reviews.id).in_(review_ids))
+            reviews = (await session.exec(stmt)).all()
+        for review_db in reviews:
+            review = ReviewsPublic.model_validate(review_db)
+            data = review.model_dump_json()
+            for subscription in list(self._subscriptions):
+                if subscription.matches(review):
+                    subscription.push(str(review.id), data)
@@ -0,0 +1,282 @@
+"""Group commit of new reviews, many requests written in one transaction."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from fastapi.exceptions import HTTPException
+from sqlalchemy import insert, inspect, tuple_
+from sqlmodel import col, select
+
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.models.reviews import Reviews, ReviewsPublic
+
+from .deadlines import (
+    apply_statement_timeout,
+    is_statement_timeout,
+    route_timeout,
+    timeouts,
+)
+from .routers.common import BEER_NOT_FOUND, DUPLICATE_REVIEW, QUERY_TIMEOUT
+from .scores import add_review_scores
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from beer_review_dataserver.models.reviews import ReviewsBase
+
+logger = logging.getLogger(__name__)
+
+# Batches are written with the statement timeout of the route they replace
+ROUTE_KEY = "POST /reviews/"
+
+
+def _own(error: HTTPException) -> HTTPException:
+    """
+    Return a copy of one of the shared errors for a single request.
+
+    Raising an exception records its traceback on it, so requests failing
+    together mustn't share one instance.
+    """
+    return HTTPException(
+        status_code=error.status_code, detail=error.detail, headers=error.headers
+    )
+
+
+@dataclass
+class PendingReview:
+    """A review waiting to be written, and the request waiting on it."""
+
+    review: ReviewsBase
+    future: asyncio.Future[ReviewsPublic] = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+    def resolve(self, result: ReviewsPublic | BaseException) -> None:
+        """Hand the request its review or error, unless it has gone away."""
+        if self.future.done():
+            return
+        if isinstance(result, BaseException):
+            self.future.set_exception(result)
+        else:
+            self.future.set_result(result)
+
+
+class ReviewBatcher:
+    """
+    Write new reviews in batches, one transaction for many requests.
+
+    Reviews submitted within window seconds of each other, up to max_size of
+    them, are checked with one query per table, inserted with one multi-row
+    statement and added to their beers' scores with one update per beer. A
+    popular beer's row is locked once per batch rather than once per review,
+    so a burst of reviews doesn't queue up on it. Reviews arriving while a
+    batch is written make up the next one.
+
+    Every request gets its own result. A review of an unknown beer, or one its
+    user has already written, fails on its own. If the batch fails as a whole
+    its reviews are retried one at a time, so one bad review doesn't fail the
+    rest, for no longer than the time budget of the route. A batch or review
+    timing out fails the reviews not yet written with a 504. Stopping waits for
+    the batch being written, then writes the reviews still queued.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        window: float,
+        max_size: int = 500,
+    ) -> None:
+        """Create the batcher, start must be called before submitting."""
+        self._session_factory = session_factory
+        self.window = window
+        self.max_size = max_size
+        self._pending: list[PendingReview] = []
+        self._waiting = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._writing: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        """Return whether reviews are being batched."""
+        return self._task is not None
+
+    async def submit(self, review: ReviewsBase) -> ReviewsPublic:
+        """Queue a review for the next batch and wait for it to be written."""
+        pending = PendingReview(review)
+        self._pending.append(pending)
+        self._waiting.set()
+        if len(self._pending) >= self.max_size:
+            self._full.set()
+        return await pending.future
+
+    async def start(self) -> None:
+        """Start writing batches in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="review-batcher")
+
+    async def stop(self) -> None:
+        """Stop writing batches, after writing the reviews already submitted."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        # Shielded from the cancellation, as its transaction may have committed
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+        while self._pending:
+            await self._write(self._take())
+
+    def _take(self) -> list[PendingReview]:
+        """Remove the next batch from the pending reviews."""
+        batch = self._pending[: self.max_size]
+        del self._pending[: self.max_size]
+        if len(self._pending) < self.max_size:
+            self._full.clear()
+        if not self._pending:
+            self._waiting.clear()
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            await self._waiting.wait()
+            # Give the rest of the burst a chance to join the batch
+            with contextlib.suppress(TimeoutError):
+                async with asyncio.timeout(self.window):
+                    await self._full.wait()
+            self._writing = asyncio.create_task(self._write(self._take()))
+            await asyncio.shield(self._writing)
+            self._writing = None
+
+    async def _write(self, batch: list[PendingReview]) -> None:
+        """Write a batch, resolving every review in it."""
+        try:
+            try:
+                results = await self._commit(batch)
+            except Exception as exc:
+                if is_statement_timeout(exc):
+                    # Retrying them one by one would only time out again
+                    logger.warning(
+                        "Writing a batch of %d reviews timed out", len(batch)
+                    )
+                    timeouts[ROUTE_KEY] += len(batch)
+                    results = [_own(QUERY_TIMEOUT) for _ in batch]
+                else:
+                    logger.exception(
+                        "Writing a batch of %d reviews failed, retrying one by one",
+                        len(batch),
+                    )
+                    results = await self._commit_each(batch)
+            for pending, result in zip(batch, results, strict=True):
+                pending.resolve(result)
+        finally:
+            # Only left unresolved when cancelled, the requests mustn't hang
+            for pending in batch:
+                pending.future.cancel()
+
+    async def _commit_each(
+        self, batch: list[PendingReview]
+    ) -> list[ReviewsPublic | BaseException]:
+        """
+        Write the reviews of a batch one at a time.
+
+        Gives up on the rest once the time budget of the route has been spent,
+        or a review times out, rather than keep their requests waiting for up
+        to max_size statement timeouts.
+        """
+        budget = route_timeout(ROUTE_KEY)
+        deadline = asyncio.get_running_loop().time() + budget
+        results: list[ReviewsPublic | BaseException] = []
+        for pending in batch:
+            if budget and asyncio.get_running_loop().time() >= deadline:
+                break
+            try:
+                results.extend(await self._commit([pending]))
+            except Exception as exc:  # noqa: BLE001
+                if is_statement_timeout(exc):
+                    break
+                results.append(exc)
+        timeouts[ROUTE_KEY] += len(batch) - len(results)
+        return results + [_own(QUERY_TIMEOUT) for _ in batch[len(results) :]]
+
+    async def _commit(
+        self, batch: list[PendingReview]
+    ) -> list[ReviewsPublic | BaseException]:
+        """Write the valid reviews of a batch in one transaction."""
+        async with self._session_factory() as session:
+            apply_statement_timeout(session, route_timeout(ROUTE_KEY))
+            results = await self._insert(session, [p.review for p in batch])
+            await session.commit()
+        return results
+
+    async def _insert(
+        self, session: AsyncSession, reviews: list[ReviewsBase]
+    ) -> list[ReviewsPublic | BaseException]:
+        """
+        Insert the reviews and add their scores to their beers.
+
+        Returns each review as inserted, or the error it was rejected with.
+        """
+        beer_ids = dict(
+            (
+                await session.exec(
+                    select(Beers.name, Beers.id).where(
+                        col(Beers.name).in_({review.beer_name for review in reviews})
+                    )
+                )
+            ).all()
+        )
+        # Users may only review a beer once
+        seen = set(
+            (
+                await session.exec(
+                    select(Reviews.username, Reviews.beer_name).where(
+                        tuple_(col(Reviews.username), col(Reviews.beer_name)).in_(
+                            {(review.username, review.beer_name) for review in reviews}
+                        )
+                    )
+                )
+            ).all()
+        )
+
+        results: list[ReviewsPublic | BaseException | uuid.UUID] = []
+        rows = []
+        scores: dict[uuid.UUID, list[float]] = defaultdict(list)
+        for review in reviews:
+            key = (review.username, review.beer_name)
+            if review.beer_name not in beer_ids:
+                results.append(_own(BEER_NOT_FOUND))
+            elif key in seen:
+                results.append(_own(DUPLICATE_REVIEW))
+            else:
+                seen.add(key)
+                review_id = uuid.uuid4()
+                beer_id = beer_ids[review.beer_name]
+                rows.append(review.model_dump() | {"id": review_id, "beer_id": beer_id})
+                scores[beer_id].append(review.score)
+                results.append(review_id)
+
+        inserted: dict[uuid.UUID, ReviewsPublic] = {}
+        if rows:
+            returned = await session.exec(
+                insert(Reviews).values(rows).returning(*inspect(Reviews).columns)
+            )
+            inserted = {
+                row.id: ReviewsPublic.model_validate(row, from_attributes=True)
+                for row in returned
+            }
+            await add_review_scores(session, scores)
+        return [
+            inserted[result] if isinstance(result, uuid.UUID) else result
+            for result in results
+        ]
@@ -0,0 +1,309 @@
+"""Replay of the stored response when a create request is retried."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import logging
+from typing import TYPE_CHECKING
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import col, select
+from starlette.responses import JSONResponse, Response
+
+from beer_review_dataserver.models.idempotency import IdempotencyKeys
+from beer_review_dataserver.routers.common import (
+    IDEMPOTENCY_BODY_TOO_LARGE,
+    IDEMPOTENCY_IN_PROGRESS,
+    IDEMPOTENCY_KEY_INVALID,
+    IDEMPOTENCY_KEY_REUSED,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Collection
+
+    from fastapi import HTTPException
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+
+def _error(exc: HTTPException) -> Response:
+    return JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+
+
+class BodyTooLargeError(Exception):
+    """The request body is larger than the middleware buffers."""
+
+
+async def _read_body(receive: Receive, max_body: int) -> tuple[Receive, str]:
+    """
+    Read the whole request body and return its sha256.
+
+    Also returns a receive that hands the body to the app again, followed by
+    the rest of the connection's messages. Raises BodyTooLargeError once more
+    than max_body bytes have been read.
+    """
+    messages: list[Message] = []
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_body:
+            raise BodyTooLargeError
+        digest.update(chunk)
+        if not message.get("more_body", False):
+            break
+
+    async def replay() -> Message:
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return replay, digest.hexdigest()
+
+
+def _content_length(scope: Scope) -> int | None:
+    """Return the Content-Length header of a request, if it has a valid one."""
+    header = dict(scope["headers"]).get(b"content-length")
+    try:
+        return None if header is None else int(header)
+    except ValueError:
+        return None
+
+
+async def purge_idempotency_keys(
+    session_factory: async_sessionmaker[AsyncSession],
+) -> int:
+    """Delete the expired idempotency keys. Returns how many were deleted."""
+    async with session_factory() as session:
+        result = await session.exec(
+            delete(IdempotencyKeys).where(col(IdempotencyKeys.expires_at) < func.now())
+        )
+        await session.commit()
+    logger.info("Purged %d expired idempotency keys", result.rowcount)
+    return result.rowcount
+
+
+class IdempotencyMiddleware:
+    """
+    Return the stored response when a create request is retried.
+
+    A POST to one of paths with an Idempotency-Key header claims the key before
+    it runs, and its response is stored against the key if it succeeds. Retries
+    with the same key get the stored response back from a single lookup on the
+    primary key, without running the route again. A retry arriving while the
+    first request is still running gets a 409, and one with a different body
+    than the first a 422. Failed requests release their key so they can be
+    retried. The body is read before the route runs to compare it, so requests
+    with a key are buffered in memory and get a 413 when their body is larger
+    than max_body bytes.
+
+    Keys are kept for ttl seconds. A claim is extended every half of
+    pending_ttl seconds while its request runs, however long that takes, so
+    claims of requests that never finished, e.g. because the worker died,
+    expire after pending_ttl seconds.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        app: ASGIApp,
+        session_factory: async_sessionmaker[AsyncSession],
+        paths: Collection[str],
+        *,
+        ttl: float = 86400.0,
+        pending_ttl: float = 60.0,
+        max_body: int = 10_485_760,
+    ) -> None:
+        """Wrap app, keys are stored in the database of session_factory."""
+        self.app = app
+        self.session_factory = session_factory
+        self.paths = frozenset(paths)
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.pending_ttl = datetime.timedelta(seconds=pending_ttl)
+        self.max_body = max_body
+
+    def idempotency_key(self, scope: Scope) -> str | None:
+        """Return the Idempotency-Key of a create request, if it was sent one."""
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            return None
+        header = dict(scope["headers"]).get(IDEMPOTENCY_HEADER)
+        return None if header is None else header.decode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, replaying the stored response of a retry."""
+        key = self.idempotency_key(scope)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+
+        route = f"POST {scope['path']}"
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _error(IDEMPOTENCY_KEY_INVALID)(scope, receive, send)
+            return
+        buffered = await self.read_body(scope, receive)
+        if buffered is None:
+            await _error(IDEMPOTENCY_BODY_TOO_LARGE)(scope, receive, send)
+            return
+        receive, request_hash = buffered
+        response = await self.lookup(key, route, request_hash)
+        if response is None and not await self.claim(key, route, request_hash):
+            # Another request claimed the key since the lookup
+            response = _error(IDEMPOTENCY_IN_PROGRESS)
+        if response is not None:
+            await response(scope, receive, send)
+            return
+
+        status_code = None
+        content_type = None
+        body = bytearray()
+
+        async def send_and_record(message: Message) -> None:
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = dict(message.get("headers", [])).get(b"content-type")
+            elif message["type"] == "http.response.body":
+                body.extend(message.get("body", b""))
+            await send(message)
+
+        heartbeat = asyncio.create_task(self.keep_claimed(key))
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await heartbeat
+            if status_code is not None and 200 <= status_code < 300:  # noqa: PLR2004
+                await self.complete(
+                    key,
+                    status_code,
+                    content_type.decode("latin-1") if content_type else None,
+                    bytes(body),
+                )
+            else:
+                await self.release(key)
+
+    async def read_body(
+        self, scope: Scope, receive: Receive
+    ) -> tuple[Receive, str] | None:
+        """Buffer the body of a request, unless it is larger than max_body."""
+        length = _content_length(scope)
+        if length is not None and length > self.max_body:
+            return None
+        try:
+            return await _read_body(receive, self.max_body)
+        except BodyTooLargeError:
+            return None
+
+    async def lookup(self, key: str, route: str, request_hash: str) -> Response | None:
+        """Return the response for a key that has been used before."""
+        async with self.session_factory() as session:
+            stored = (
+                await session.exec(
+                    select(IdempotencyKeys).where(
+                        IdempotencyKeys.key == key,
+                        col(IdempotencyKeys.expires_at) > func.now(),
+                    )
+                )
+            ).first()
+        if stored is None:
+            return None
+        if stored.route != route or stored.request_hash not in {None, request_hash}:
+            return _error(IDEMPOTENCY_KEY_REUSED)
+        if stored.status_code is None:
+            return _error(IDEMPOTENCY_IN_PROGRESS)
+        return Response(
+            stored.body,
+            status_code=stored.status_code,
+            media_type=stored.content_type,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    async def claim(self, key: str, route: str, request_hash: str) -> bool:
+        """Claim an unused or expired key, returning whether it was claimed."""
+        stmt = insert(IdempotencyKeys).values(
+            key=key,
+            route=route,
+            request_hash=request_hash,
+            expires_at=func.now() + self.pending_ttl,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[col(IdempotencyKeys.key)],
+            set_={
+                "route": stmt.excluded.route,
+                "request_hash": stmt.excluded.request_hash,
+                "status_code": None,
+                "content_type": None,
+                "body": None,
+                "expires_at": stmt.excluded.expires_at,
+            },
+            where=col(IdempotencyKeys.expires_at) <= func.now(),
+        ).returning(col(IdempotencyKeys.key))
+        async with self.session_factory() as session:
+            claimed = (await session.exec(stmt)).first()
+            await session.commit()
+        return claimed is not None
+
+    async def keep_claimed(self, key: str) -> None:
+        """Extend the claim on a key until cancelled, while its request runs."""
+        while True:
+            await asyncio.sleep(self.pending_ttl.total_seconds() / 2)
+            try:
+                async with self.session_factory() as session:
+                    await session.exec(
+                        update(IdempotencyKeys)
+                        .where(
+                            col(IdempotencyKeys.key) == key,
+                            col(IdempotencyKeys.status_code).is_(None),
+                        )
+                        .values(expires_at=func.now() + self.pending_ttl)
+                    )
+                    await session.commit()
+            except Exception:
+                logger.exception("Failed to extend the claim on an idempotency key")
+
+    async def complete(
+        self, key: str, status_code: int, content_type: str | None, body: bytes
+    ) -> None:
+        """Store the response of the request that claimed a key."""
+        async with self.session_factory() as session:
+            await session.exec(
+                update(IdempotencyKeys)
+                .where(col(IdempotencyKeys.key) == key)
+                .values(
+                    status_code=status_code,
+                    content_type=content_type,
+                    body=body,
+                    expires_at=func.now() + self.ttl,
+                )
+            )
+            await session.commit()
+
+    async def release(self, key: str) -> None:
+        """Give up the claim on a key whose request failed."""
+        async with self.session_factory() as session:
+            await session.exec(
+                delete(IdempotencyKeys).where(
+                    col(IdempotencyKeys.key) == key,
+                    col(IdempotencyKeys.status_code).is_(None),
+                )
+            )
+            await session.commit()
@@ -0,0 +1,133 @@
+"""Content addressed storage of beer images on the filesystem."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from sqlmodel import col, select
+
+from beer_review_dataserver.models.images import BeerImages
+
+if TYPE_CHECKING:
+    from typing import BinaryIO
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Uploads are written here before being moved to their shard
+TEMP_DIR = "tmp"
+# Images are stored under two levels of directories named after the first two
+# pairs of hex digits of their hash, which keeps every directory small
+SHARD_PATTERN = "[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*"
+CHUNK_SIZE = 1024 * 1024
+
+
+def image_key(digest: str, extension: str) -> str:
+    """Return the path of an image, relative to the store, from its hash."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+class ImageStore:
+    """
+    Store images under the sha256 of their contents.
+
+    Uploading the same image twice stores it once, and an image never changes
+    once stored, so it can be cached forever. Which beer uses which image is
+    kept in the beer_images table, images no beer uses any more are removed by
+    collect_image_garbage.
+    """
+
+    def __init__(self, root: Path) -> None:
+        """Store images in the root directory."""
+        self.root = root
+
+    def path(self, key: str) -> Path:
+        """Return the file of an image."""
+        return self.root / key
+
+    async def save(self, file: BinaryIO, extension: str) -> str:
+        """Store the contents of file and return its key."""
+        return await asyncio.to_thread(self._save, file, extension)
+
+    def _save(self, file: BinaryIO, extension: str) -> str:
+        temp_dir = self.root / TEMP_DIR
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+                temp.write(chunk)
+        key = image_key(digest.hexdigest(), extension)
+        path = self.path(key)
+        if path.exists():
+            # Touched so a garbage collection running now sees it as new and
+            # leaves it for the beer about to reference it
+            os.utime(path)
+            Path(temp.name).unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            Path(temp.name).replace(path)
+        return key
+
+    async def remove_unreferenced(self, referenced: set[str], grace: float) -> int:
+        """
+        Delete the images whose key isn't in referenced.
+
+        Images and abandoned uploads modified in the last grace seconds are
+        kept, as their beer_images rows may not have been committed yet.
+        Returns how many images were deleted.
+        """
+        return await asyncio.to_thread(self._remove_unreferenced, referenced, grace)
+
+    def _remove_unreferenced(self, referenced: set[str], grace: float) -> int:
+        cutoff = time.time() - grace
+        removed = 0
+        for path in self.root.glob(SHARD_PATTERN):
+            if path.relative_to(self.root).as_posix() in referenced:
+                continue
+            if _remove_if_older(path, cutoff):
+                removed += 1
+        for path in (self.root / TEMP_DIR).glob("*"):
+            _remove_if_older(path, cutoff)
+        return removed
+
+
+def _remove_if_older(path: Path, cutoff: float) -> bool:
+    """Delete a file last modified before cutoff, returning if it was deleted."""
+    try:
+        if path.stat().st_mtime >= cutoff:
+            return False
+        path.unlink()
+    except FileNotFoundError:
+        # Removed by another worker's collection
+        return False
+    return True
+
+
+async def collect_image_garbage(
+    session_factory: async_sessionmaker[AsyncSession],
+    store: ImageStore,
+    grace: float = 3600.0,
+) -> int:
+    """
+    Delete the stored images no beer references.
+
+    An image stops being referenced when its beer is deleted, which cascades to
+    beer_images, or is given a different image. Returns how many were deleted.
+    """
+    async with session_factory() as session:
+        referenced = set(
+            (await session.exec(select(col(BeerImages.path)).distinct())).all()
+        )
+    removed = await store.remove_unreferenced(referenced, grace)
+    logger.info("Removed %d unreferenced images", removed)
+    return removed
@@ -0,0 +1,364 @@
+"""Bulk import of breweries, beers and reviews with COPY."""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import datetime
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import asyncpg
+
+from .notifications import CHANGES_CHANNEL, asyncpg_dsn
+from .partitions import PARTITIONS_FUNCTION
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from pathlib import Path
+
+
+class ImportFileError(Exception):
+    """Raised when a row of an import file can't be read."""
+
+
+def _optional_timestamp(value: str | None) -> datetime.datetime | None:
+    if not value:
+        return None
+    timestamp = datetime.datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.UTC)
+    return timestamp
+
+
+def _optional_text(value: str | None) -> str | None:
+    return value or None
+
+
+def _text(value: str | None) -> str:
+    if value is None or value == "":
+        msg = "missing value"
+        raise ValueError(msg)
+    return str(value)
+
+
+@dataclass(frozen=True)
+class ImportTable:
+    """A table that can be imported and the staging table it's copied into."""
+
+    name: str
+    # (column, postgres type, converter from the file's value)
+    columns: tuple[tuple[str, str, Callable[[Any], Any]], ...]
+
+    @property
+    def staging(self) -> str:
+        """Return the name of the staging table."""
+        return f"import_{self.name}"
+
+    @property
+    def column_names(self) -> list[str]:
+        """Return the names of the columns read from the file."""
+        return [column for column, _, _ in self.columns]
+
+    def create_staging(self) -> str:
+        """Return the statement creating an empty staging table."""
+        columns = ", ".join(f"{column} {kind}" for column, kind, _ in self.columns)
+        return (
+            f"DROP TABLE IF EXISTS {self.staging}; "
+            f"CREATE UNLOGGED TABLE {self.staging} ({columns})"
+        )
+
+    def record(self, row: dict[str, Any]) -> tuple[Any, ...]:
+        """Convert a row of the file into a record of the staging table."""
+        return tuple(convert(row.get(column)) for column, _, convert in self.columns)
+
+
+IMPORT_TABLES = {
+    "breweries": ImportTable("breweries", (("name", "text", _text),)),
+    "beers": ImportTable(
+        "beers", (("name", "text", _text), ("company", "text", _text))
+    ),
+    "reviews": ImportTable(
+        "reviews",
+        (
+            ("username", "text", _text),
+            ("score", "float8", float),
+            ("comment", "text", _optional_text),
+            ("beer_name", "text", _text),
+            ("date_created", "timestamptz", _optional_timestamp),
+        ),
+    ),
+}
+
+# Rows are inserted in one transaction after every file has been staged. Names
+# are resolved to ids with joins, rows whose brewery or beer doesn't exist and
+# rows that already exist are skipped.
+MERGE_BREWERIES = """
+INSERT INTO breweries (id, name, last_updated, date_created)
+SELECT gen_random_uuid(), name, now(), now()
+FROM (SELECT DISTINCT name FROM import_breweries WHERE name IS NOT NULL) AS staged
+ON CONFLICT (name) DO NOTHING
+"""
+
+MERGE_BEERS = """
+INSERT INTO beers (
+    id, name, company, company_id, score, review_count, weighted_score,
+    last_updated, date_created
+)
+SELECT
+    gen_random_uuid(), staged.name, staged.company, breweries.id, 0, 0, 0,
+    now(), now()
+FROM (
+    SELECT DISTINCT ON (name) name, company FROM import_beers ORDER BY name
+) AS staged
+JOIN breweries ON breweries.name = staged.company
+ON CONFLICT (name) DO NOTHING
+"""
+
+# A user reviews a beer at most once, as enforced by POST /reviews/
+MERGE_REVIEWS = """
+INSERT INTO reviews (
+    id, username, score, comment, beer_name, beer_id, last_updated, date_created
+)
+SELECT
+    gen_random_uuid(),
+    staged.username,
+    staged.score,
+    staged.comment,
+    staged.beer_name,
+    beers.id,
+    coalesce(staged.date_created, now()),
+    coalesce(staged.date_created, now())
+FROM (
+    SELECT DISTINCT ON (username, beer_name) *
+    FROM import_reviews
+    WHERE score > 0 AND score <= 10
+    ORDER BY username, beer_name, date_created DESC NULLS LAST
+) AS staged
+JOIN beers ON beers.name = staged.beer_name
+WHERE NOT EXISTS (
+    SELECT 1 FROM reviews
+    WHERE reviews.username = staged.username
+    AND reviews.beer_name = staged.beer_name
+)
+"""
+
+# Reviews can be older than the oldest partition of reviews, so the months
+# being imported are created first
+CREATE_REVIEW_PARTITIONS = """
+SELECT create_reviews_partitions(
+    min(coalesce(date_created, now())), max(coalesce(date_created, now()))
+)
+FROM import_reviews
+"""
+
+# Every beer that received reviews has its score, review count and weighted
+# score, as in scores.weighted_score, recalculated in one statement
+UPDATE_SCORES = """
+UPDATE beers SET
+    score = averages.score,
+    review_count = averages.review_count,
+    weighted_score = (
+        averages.review_count * averages.score + prior.weight * prior.mean
+    ) / (averages.review_count + prior.weight),
+    last_updated = now()
+FROM (
+    SELECT reviews.beer_id, avg(reviews.score) AS score, count(*) AS review_count
+    FROM reviews
+    WHERE reviews.beer_id IN (
+        SELECT beers.id FROM beers
+        JOIN import_reviews ON import_reviews.beer_name = beers.name
+    )
+    GROUP BY reviews.beer_id
+) AS averages
+CROSS JOIN (
+    SELECT
+        coalesce((SELECT mean FROM score_priors WHERE id = 1), 0) AS mean,
+        coalesce((SELECT weight FROM score_priors WHERE id = 1), 0) AS weight
+) AS prior
+WHERE beers.id = averages.beer_id
+"""
+
+MERGES = (
+    ("breweries", MERGE_BREWERIES),
+    ("beers", MERGE_BEERS),
+    ("reviews", MERGE_REVIEWS),
+)
+
+
+def read_rows(path: Path) -> Iterator[dict[str, Any]]:
+    """Yield the rows of a CSV file with a header, or of a NDJSON file."""
+    with path.open(newline="", encoding="utf-8") as file:
+        if path.suffix.lower() == ".csv":
+            yield from csv.DictReader(file)
+            return
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as exc:
+                msg = f"{path}: line {number}: {exc}"
+                raise ImportFileError(msg) from exc
+
+
+def read_records(path: Path, table: ImportTable) -> Iterator[tuple[Any, ...]]:
+    """Yield the staging table records of an import file."""
+    for number, row in enumerate(read_rows(path), start=1):
+        try:
+            yield table.record(row)
+        except (TypeError, ValueError) as exc:
+            msg = f"{path}: row {number}: {exc}"
+            raise ImportFileError(msg) from exc
+
+
+class Progress:
+    """Print the rows handled so far and the rate they're handled at."""
+
+    def __init__(self, label: str, interval: float = 2.0) -> None:
+        """Start timing."""
+        self.label = label
+        self.interval = interval
+        self.rows = 0
+        self.start = time.perf_counter()
+        self._last_report = self.start
+
+    def advance(self, rows: int) -> None:
+        """Count rows, printing progress at most every interval seconds."""
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def report(self) -> None:
+        """Print the rows handled so far."""
+        elapsed = time.perf_counter() - self.start
+        rate = self.rows / elapsed if elapsed else 0
+        print(
+            f"{self.label}: {self.rows} rows in {elapsed:.1f}s ({rate:.0f} rows/s)",
+            flush=True,
+        )
+
+
+async def copy_file(
+    pool: asyncpg.Pool,
+    table: ImportTable,
+    path: Path,
+    chunk_size: int,
+    workers: int,
+) -> int:
+    """
+    Copy an import file into its staging table.
+
+    The file is read in chunks of chunk_size rows which are copied by workers
+    connections in parallel. Returns the number of rows copied.
+    """
+    progress = Progress(f"Staging {table.name}")
+    chunks: asyncio.Queue[list[tuple[Any, ...]] | None] = asyncio.Queue(workers * 2)
+
+    async def produce() -> None:
+        for chunk in itertools.batched(
+            read_records(path, table), chunk_size, strict=False
+        ):
+            await chunks.put(list(chunk))
+        for _ in range(workers):
+            await chunks.put(None)
+
+    async def load() -> None:
+        async with pool.acquire() as connection:
+            while (chunk := await chunks.get()) is not None:
+                await connection.copy_records_to_table(
+                    table.staging, records=chunk, columns=table.column_names
+                )
+                progress.advance(len(chunk))
+
+    async with asyncio.TaskGroup() as tasks:
+        tasks.create_task(produce())
+        for _ in range(workers):
+            tasks.create_task(load())
+    progress.report()
+    return progress.rows
+
+
+async def merge(connection: asyncpg.Connection, tables: list[str]) -> dict[str, int]:
+    """
+    Insert the staged rows and recalculate beer scores in one transaction.
+
+    Per row change notifications are turned off for the transaction and a
+    single notification is sent for each table instead, which makes every
+    worker drop what it has cached. Returns the rows inserted into each table.
+    """
+    inserted: dict[str, int] = {}
+    async with connection.transaction():
+        await connection.execute("SET LOCAL beer_review.notify = 'off'")
+        if "reviews" in tables and await connection.fetchval(
+            "SELECT to_regprocedure($1::text)", PARTITIONS_FUNCTION
+        ):
+            await connection.execute(CREATE_REVIEW_PARTITIONS)
+        for name, statement in MERGES:
+            if name not in tables:
+                continue
+            progress = Progress(f"Inserting {name}")
+            status = await connection.execute(statement)
+            progress.advance(int(status.split()[-1]))
+            progress.report()
+            inserted[name] = progress.rows
+        if "reviews" in tables:
+            progress = Progress("Updating beer scores")
+            status = await connection.execute(UPDATE_SCORES)
+            progress.advance(int(status.split()[-1]))
+            progress.report()
+        for name in tables:
+            await connection.execute(
+                "SELECT pg_notify($1, $2)",
+                CHANGES_CHANNEL,
+                json.dumps({"table": name, "op": "IMPORT"}),
+            )
+    return inserted
+
+
+async def import_files(
+    postgres_uri: str,
+    files: dict[str, Path],
+    chunk_size: int = 10_000,
+    workers: int = 4,
+) -> dict[str, int]:
+    """
+    Import breweries, beers and reviews from CSV or NDJSON files.
+
+    :param postgres_uri: SQLAlchemy url of the database
+    :param files: The file to import for each of breweries, beers and reviews
+    :param chunk_size: Rows sent per COPY
+    :param workers: Connections copying chunks in parallel
+
+    Rows reference their brewery and beer by name. Staging tables are created
+    for the duration of the import, so only one import can run at a time.
+    Returns the rows inserted into each table.
+    """
+    tables = [name for name in IMPORT_TABLES if name in files]
+    pool = await asyncpg.create_pool(
+        asyncpg_dsn(postgres_uri), min_size=1, max_size=workers
+    )
+    try:
+        async with pool.acquire() as connection:
+            for name in tables:
+                await connection.execute(IMPORT_TABLES[name].create_staging())
+        try:
+            for name in tables:
+                await copy_file(
+                    pool, IMPORT_TABLES[name], files[name], chunk_size, workers
+                )
+            async with pool.acquire() as connection:
+                return await merge(connection, tables)
+        finally:
+            async with pool.acquire() as connection:
+                for name in tables:
+                    await connection.execute(
+                        f"DROP TABLE IF EXISTS {IMPORT_TABLES[name].staging}"
+                    )
+    finally:
+        await pool.close()
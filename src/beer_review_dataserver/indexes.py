@@ -0,0 +1,155 @@
+"""Report which indexes the queries behind each route use."""
+
+from __future__ import annotations
+
+import datetime
+from typing import TYPE_CHECKING, Any
+
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.models.reviews import Reviews
+
+from .routers.common import explain_plan
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+    from .routers.batch import AnySubQuery
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def route_queries(review: Reviews, beer: Beers) -> dict[str, dict[str, Any]]:
+    """
+    Return batch sub-queries of the routes, with a sample review and beer.
+
+    Running them sends the statements the routes do, with values the planner
+    sees as realistic.
+    """
+    return {
+        "GET /beers/?name": {"route": "/beers/", "name": beer.name},
+        "GET /beers/?orderby=score": {
+            "route": "/beers/",
+            "orderby": "score",
+            "order": "desc",
+        },
+        "GET /beers/?orderby=weighted_score": {
+            "route": "/beers/",
+            "orderby": "weighted_score",
+            "order": "desc",
+        },
+        "GET /beers/batch": {"route": "/beers/batch", "ids": [beer.id]},
+        "GET /beers/list-beers": {"route": "/beers/list-beers"},
+        "GET /breweries/?name": {"route": "/breweries/", "name": beer.company},
+        "GET /breweries/summary?name": {
+            "route": "/breweries/summary",
+            "name": beer.company,
+        },
+        "GET /reviews/?beer_id&orderby=date_created": {
+            "route": "/reviews/",
+            "beer_id": str(review.beer_id),
+            "orderby": "date_created",
+            "order": "desc",
+        },
+        "GET /reviews/?username&orderby=date_created": {
+            "route": "/reviews/",
+            "username": review.username,
+            "orderby": "date_created",
+            "order": "desc",
+        },
+        # Only the partition of the review's month should be scanned
+        "GET /reviews/?date_from&date_to": {
+            "route": "/reviews/",
+            "date_from": review.date_created,
+            "date_to": review.date_created + ONE_DAY,
+        },
+        "GET /reviews/?beer_name": {
+            "route": "/reviews/",
+            "beer_name": review.beer_name,
+        },
+        "GET /reviews/stats?beer_name": {
+            "route": "/reviews/stats",
+            "beer_name": review.beer_name,
+        },
+    }
+
+
+def _walk_plan(plan: dict[str, Any], indexes: list[str]) -> None:
+    """Collect the index, or sequential scan, used by every node of a plan."""
+    if "Index Name" in plan:
+        indexes.append(f"{plan['Node Type']} using {plan['Index Name']}")
+    elif plan.get("Node Type") == "Seq Scan":
+        indexes.append(f"Seq Scan on {plan['Relation Name']}")
+    for child in plan.get("Plans", ()):
+        _walk_plan(child, indexes)
+
+
+async def explain_indexes(session: AsyncSession, query: AnySubQuery) -> list[str]:
+    """Run a sub-query and return the indexes postgres used for its statements."""
+    statements: list[tuple[str, Any]] = []
+
+    def record(
+        _connection: Connection,
+        _cursor: Any,  # noqa: ANN401
+        statement: str,
+        parameters: Any,  # noqa: ANN401
+        _context: Any,  # noqa: ANN401
+        _executemany: bool,  # noqa: FBT001
+    ) -> None:
+        statements.append((statement, parameters))
+
+    connection = (await session.connection()).sync_connection
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        await query.run(session)
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+
+    indexes: list[str] = []
+    for statement, parameters in statements:
+        _walk_plan(await explain_plan(session, statement, parameters or ()), indexes)
+    return indexes
+
+
+async def route_index_usage(engine: AsyncEngine) -> dict[str, list[str]]:
+    """
+    Explain the queries behind each route.
+
+    Returns an empty dict when there is no review to build sample queries from.
+    """
+    # The routers import this package's dependencies
+    from .routers.batch import AnySubQuery  # noqa: PLC0415
+
+    sub_query = TypeAdapter(AnySubQuery)
+
+    async with AsyncSession(engine) as session:
+        sample = (
+            await session.exec(
+                select(Reviews, Beers)
+                .join(Beers, col(Beers.id) == col(Reviews.beer_id))
+                .limit(1)
+            )
+        ).first()
+        if sample is None:
+            return {}
+        return {
+            route: await explain_indexes(session, sub_query.validate_python(query))
+            for route, query in route_queries(*sample).items()
+        }
+
+
+async def print_index_usage(engine: AsyncEngine) -> None:
+    """Print the indexes used by each route."""
+    usage = await route_index_usage(engine)
+    if not usage:
+        print("No reviews in the database to build sample queries from")
+        return
+    for route, indexes in usage.items():
+        print(route)
+        for index in indexes or ["(no table access)"]:
+            print(f"    {index}")
@@ -0,0 +1,171 @@
+"""Structured logging written from a background thread, and the access log."""
+
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import TYPE_CHECKING, Any
+
+from .profiling import RequestTimings, request_timings
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+access_logger = logging.getLogger("beer_review_dataserver.access")
+
+# Attributes every LogRecord has, anything else was passed in extra
+RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord("", 0, "", 0, "", (), None).__dict__
+) | {"message", "asctime", "taskName"}
+
+# Loggers that come with their own handlers, sent through the queue instead
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Responses with a status from this on are always logged
+SERVER_ERROR = 500
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one line of JSON, with its extra fields as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Return the record as a JSON object."""
+        data: dict[str, Any] = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.UTC
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(
+            (key, value)
+            for key, value in record.__dict__.items()
+            if key not in RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def configure_logging(
+    level: str, *, json_format: bool = True, log_sql: bool = False
+) -> logging.handlers.QueueListener:
+    """
+    Send every log record through a queue to a thread writing to stdout.
+
+    Logging from the event loop only puts the record on the queue, so a slow
+    stdout never holds up requests. Uvicorn's loggers and SQLAlchemy's
+    statement log go through the same queue. Returns the listener, which must
+    be stopped to flush the queue on shutdown.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(
+        JsonFormatter()
+        if json_format
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level.upper())
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    # Requests are logged by AccessLogMiddleware instead
+    logging.getLogger("uvicorn.access").disabled = True
+    logging.getLogger("sqlalchemy.engine").setLevel(
+        logging.INFO if log_sql else logging.WARNING
+    )
+    listener.start()
+    return listener
+
+
+class AccessLogMiddleware:
+    """
+    Log a sample of requests with their route, status and timings.
+
+    Every request slower than slow seconds or failing with a server error is
+    logged, the rest at random with probability sample_rate. Each entry carries
+    the rate it was sampled at so counts can be scaled back up.
+    """
+
+    def __init__(
+        self, app: ASGIApp, sample_rate: float = 1.0, slow: float = 1.0
+    ) -> None:
+        """Wrap app."""
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow = slow
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, logging it once the response has been sent."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = None
+
+        async def send_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        except Exception:
+            # The error response is sent by ServerErrorMiddleware, outside this
+            status_code = status_code or SERVER_ERROR
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            request_timings.reset(token)
+            self.log(scope, status_code, latency, timings)
+
+    def log(
+        self,
+        scope: Scope,
+        status_code: int | None,
+        latency: float,
+        timings: RequestTimings,
+    ) -> None:
+        """Log a finished request if it's selected."""
+        if latency >= self.slow or status_code is None or status_code >= SERVER_ERROR:
+            sample_rate = 1.0
+        elif random.random() < self.sample_rate:  # noqa: S311
+            sample_rate = self.sample_rate
+        else:
+            return
+        # Set by the router once it has matched the request, None for a 404
+        route = getattr(scope.get("route"), "path", None)
+        access_logger.info(
+            "%s %s %s",
+            scope["method"],
+            scope["path"],
+            status_code,
+            extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route,
+                "status": status_code,
+                "latency_ms": round(latency * 1000, 3),
+                "db_time_ms": round(timings.db_time * 1000, 3),
+                "queries": timings.queries,
+                "sample_rate": sample_rate,
+            },
+        )
@@ -2,84 +2,79 @@
 
 from __future__ import annotations
 
-import shutil
-from pathlib import Path
-
 import uvicorn
-from fastapi import APIRouter, FastAPI, UploadFile
+from fastapi import FastAPI, Request, Response
 from fastapi.staticfiles import StaticFiles
 
 from beer_review_dataserver.config import get_settings
-from beer_review_dataserver.dependencies import lifespan
-from beer_review_dataserver.routers import beers, breweries, reviews
-from beer_review_dataserver.routers.common import NO_VALID_FILE
-from beer_review_dataserver.routers.types import CreateFileResponse
+from beer_review_dataserver.deadlines import ClientDisconnectedError
+from beer_review_dataserver.dependencies import (
+    async_session,
+    image_store,
+    lifespan,
+    profile_store,
+)
+from beer_review_dataserver.idempotency import IdempotencyMiddleware
+from beer_review_dataserver.logs import AccessLogMiddleware
+from beer_review_dataserver.profiling import ProfilingMiddleware
+from beer_review_dataserver.routers import (
+    admin,
+    batch,
+    beers,
+    breweries,
+    catalog,
+    health,
+    images,
+    reviews,
+)
 
 app = FastAPI(lifespan=lifespan)
 
-
-# Include routes to the endpoints we wish to use
-app.include_router(beers.router)
-app.include_router(breweries.router)
-app.include_router(reviews.router)
-
 settings = get_settings()
-# Mount the beer images for now to act as a CDN for the website when querying images
-if settings.image_dir:
-    image_dir = Path(settings.image_dir)
-else:
-    current_dir = Path(__file__).resolve().parent
-    image_dir = current_dir / "images"
-
-# Creting an unimplemented route such that there is documentation on the /docs link
-router = APIRouter(
-    prefix="/images",
-    tags=["Images"],
-    responses={
-        404: {"Description": "Not Found"},
-        403: {"Description": "Not Authorised"},
-    },
+# Retries of these routes with the same Idempotency-Key get the first response
+app.add_middleware(
+    IdempotencyMiddleware,
+    session_factory=async_session,
+    paths=["/beers/", "/breweries/", "/reviews/", "/images/"],
+    ttl=settings.idempotency_ttl,
+    max_body=settings.idempotency_max_body,
 )
-
-
-@router.post("/")
-async def post_image(
-    beer_name: str, file: UploadFile | None = None
-) -> CreateFileResponse:
-    """Post Image to the CDN (Filesystem)."""
-    if not file:
-        raise NO_VALID_FILE
-    if file.filename is not None:
-        file_extension = Path(file.filename).suffix.lower()
-        beer_name = beer_name.replace(" ", "-") + file_extension
-        file_path = image_dir / beer_name
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return CreateFileResponse(filename=beer_name)
-    raise NO_VALID_FILE
-
-
-@router.get(
-    "/",
-    summary="Image Directory",
-    description=(
-        "Serves static beer pictures. Any beer image file can be accessed via "
-        "/images/{filename}."
-    ),
+if settings.profile_dir:
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=profile_store,
+        token=settings.admin_token,
+        sample_rate=settings.profile_sample_rate,
+        interval=settings.profile_interval,
+    )
+# Outermost, so the latency logged covers the other middlewares
+app.add_middleware(
+    AccessLogMiddleware,
+    sample_rate=settings.access_log_sample_rate,
+    slow=settings.access_log_slow,
 )
-async def serve_images() -> None:
-    """
-    Serve static image files.
 
-    Example: /images/photo.jpg
-    """
-    # This won't be called due to StaticFiles handling the path
 
+@app.exception_handler(ClientDisconnectedError)
+async def client_disconnected(_request: Request, _exc: Exception) -> Response:
+    """Nobody is left to read the response, so close the request quietly."""
+    # 499 as used by nginx for a client closing the connection
+    return Response(status_code=499)
 
-app.include_router(router)
 
-# Need to mount after the router otherwise we can't post to this route
-app.mount("/images", StaticFiles(directory=image_dir), name="images")
+# Include routes to the endpoints we wish to use
+app.include_router(beers.router)
+app.include_router(breweries.router)
+app.include_router(reviews.router)
+app.include_router(catalog.router)
+app.include_router(batch.router)
+app.include_router(admin.router)
+app.include_router(health.router)
+app.include_router(images.router)
+
+# Mount the beer images for now to act as a CDN for the website when querying
+# images. Need to mount after the router otherwise we can't post to this route
+app.mount("/images", StaticFiles(directory=image_store.root), name="images")
 
 
 def main() -> None:
@@ -90,6 +85,8 @@ def main() -> None:
         host=settings.host,
         port=settings.port,
         log_level=settings.log_level,
+        # Requests are logged by AccessLogMiddleware
+        access_log=False,
         reload=True,
     )
 
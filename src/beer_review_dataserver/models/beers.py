@@ -6,6 +6,7 @@ from copy import deepcopy
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 from .common import DATE_CREATED, LAST_UPDATED
@@ -21,16 +22,29 @@ class BeersBase(SQLModel):
     """Base object for the beers model."""
 
     name: str = Field(index=True, unique=True)
-    company: str = Field(index=True, foreign_key="breweries.name")
+    company: str = Field(index=True, foreign_key="breweries.name", ondelete="CASCADE")
 
 
 class Beers(BeersBase, table=True):
     """Beers object with columns that get generated."""
 
+    __table_args__ = (
+        Index(
+            "ix_beers_company_id_score",
+            "company_id",
+            "score",
+            postgresql_include=["name"],
+        ),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     last_updated: datetime = deepcopy(LAST_UPDATED)
     date_created: datetime = deepcopy(DATE_CREATED)
     score: float = Field(default=0, index=True)
+    # The reviews averaged in score and their Bayesian average, see
+    # scores.weighted_score, which ranks beers with few reviews fairly
+    review_count: int = Field(default=0)
+    weighted_score: float = Field(default=0, index=True)
 
     # A good example of resolving foreign key ambiguity
     # https://github.com/fastapi/sqlmodel/discussions/1038
@@ -45,9 +59,16 @@ class Beers(BeersBase, table=True):
     )
     reviews: Optional[list["Reviews"]] = Relationship(
         back_populates="beer",
-        sa_relationship_kwargs={"foreign_keys": "Reviews.beer_id"},
+        # Reviews are removed by the ON DELETE CASCADE foreign key rather than
+        # being loaded and deleted one by one
+        sa_relationship_kwargs={
+            "foreign_keys": "Reviews.beer_id",
+            "passive_deletes": True,
+        },
+    )
+    company_id: uuid.UUID = Field(
+        foreign_key="breweries.id", nullable=False, ondelete="CASCADE"
     )
-    company_id: uuid.UUID = Field(foreign_key="breweries.id", nullable=False)
 
 
 class BeersPublic(BeersBase):
@@ -55,6 +76,8 @@ class BeersPublic(BeersBase):
 
     id: uuid.UUID
     score: float
+    review_count: int
+    weighted_score: float
     last_updated: datetime
     date_created: datetime
     company_id: uuid.UUID
@@ -28,7 +28,10 @@ class Breweries(BreweriesBase, table=True):
     date_created: datetime = deepcopy(DATE_CREATED)
     beers: Optional[list["Beers"]] = Relationship(
         back_populates="brewery",
-        sa_relationship_kwargs={"foreign_keys": "Beers.company_id"},
+        sa_relationship_kwargs={
+            "foreign_keys": "Beers.company_id",
+            "passive_deletes": True,
+        },
     )
 
 
@@ -50,3 +53,13 @@ class BreweriesPublicWithBeers(BreweriesPublic):
     """Public Retrun for breweries object with Beers Relationship."""
 
     beers: Optional[list["BeersPublic"]] = []
+
+
+class BreweriesSummary(BreweriesPublic):
+    """Public return object for breweries with aggregates of their beers."""
+
+    beer_count: int
+    review_count: int
+    average_score: Optional[float]
+    top_beer: Optional[str]
+    top_beer_score: Optional[float]
@@ -0,0 +1,26 @@
+"""Idempotency key database models."""
+
+from datetime import datetime
+
+from sqlmodel import TIMESTAMP, Column, Field, LargeBinary, SQLModel
+
+
+class IdempotencyKeys(SQLModel, table=True):
+    """
+    The response stored for an Idempotency-Key sent to a create route.
+
+    status_code is null while the first request with the key is still running.
+    request_hash is the sha256 of its body, retries must send the same body.
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    key: str = Field(primary_key=True, max_length=255)
+    route: str
+    request_hash: str | None = Field(default=None, max_length=64)
+    status_code: int | None = Field(default=None)
+    content_type: str | None = Field(default=None)
+    body: bytes | None = Field(default=None, sa_column=Column(LargeBinary))
+    expires_at: datetime = Field(
+        sa_column=Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    )
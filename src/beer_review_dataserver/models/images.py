@@ -0,0 +1,27 @@
+"""Beer image database models."""
+
+import uuid
+from copy import deepcopy
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+
+from .common import LAST_UPDATED
+
+
+class BeerImages(SQLModel, table=True):
+    """
+    The image of a beer.
+
+    path is the image's key in the image store, beers with identical images
+    share one file.
+    """
+
+    __tablename__ = "beer_images"
+
+    beer_id: uuid.UUID = Field(
+        primary_key=True, foreign_key="beers.id", ondelete="CASCADE"
+    )
+    path: str = Field(index=True)
+    content_type: str | None = Field(default=None)
+    last_updated: datetime = deepcopy(LAST_UPDATED)
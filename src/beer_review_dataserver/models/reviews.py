@@ -5,7 +5,7 @@ from copy import deepcopy
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import CheckConstraint
+from sqlalchemy import CheckConstraint, Index
 from sqlmodel import Field, Relationship, SQLModel
 
 from .common import DATE_CREATED, LAST_UPDATED
@@ -17,10 +17,11 @@ if TYPE_CHECKING:
 class ReviewsBase(SQLModel):
     """Base object for the Reviews model."""
 
-    username: str = Field(index=True, unique=False)
+    # username lookups are served by ix_reviews_username_date_created
+    username: str = Field(unique=False)
     score: float = Field(index=True)
-    comment: str | None = Field(index=True, default=None)
-    beer_name: str = Field(index=True, foreign_key="beers.name")
+    comment: str | None = Field(default=None)
+    beer_name: str = Field(index=True, foreign_key="beers.name", ondelete="CASCADE")
     __table_args__ = (
         CheckConstraint("score  > 0 AND score <=10", name="check_score_range"),
     )
@@ -29,6 +30,26 @@ class ReviewsBase(SQLModel):
 class Reviews(ReviewsBase, table=True):
     """Reveiws object with columns that get generated."""
 
+    __table_args__ = (
+        *ReviewsBase.__table_args__,
+        Index(
+            "ix_reviews_beer_id_date_created",
+            "beer_id",
+            "date_created",
+            postgresql_include=["score"],
+        ),
+        Index("ix_reviews_date_created", "date_created"),
+        Index(
+            "ix_reviews_username_date_created",
+            "username",
+            "date_created",
+            postgresql_include=["beer_id", "score"],
+        ),
+    )
+
+    # In the database reviews are partitioned by month of date_created, which
+    # makes the primary key (id, date_created). See the partition_reviews_by_month
+    # migration.
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     last_updated: datetime = deepcopy(LAST_UPDATED)
     date_created: datetime = deepcopy(DATE_CREATED)
@@ -37,7 +58,9 @@ class Reviews(ReviewsBase, table=True):
         back_populates="reviews",
         sa_relationship_kwargs={"foreign_keys": "Reviews.beer_id"},
     )
-    beer_id: uuid.UUID = Field(foreign_key="beers.id", nullable=False)
+    beer_id: uuid.UUID = Field(
+        foreign_key="beers.id", nullable=False, ondelete="CASCADE"
+    )
 
 
 class ReviewsPublic(ReviewsBase):
@@ -60,3 +83,29 @@ class ReviewsUpdate(SQLModel):
 
     score: float | None = None
     comment: str | None = None
+
+
+class ReviewsScoreBucket(SQLModel):
+    """Number of reviews with a score in the range [min_score, max_score)."""
+
+    bucket: int
+    min_score: float
+    max_score: float
+    count: int
+
+
+class ReviewsTimeBucket(SQLModel):
+    """Number of reviews created in the period starting at period."""
+
+    period: datetime
+    count: int
+    average_score: float
+
+
+class ReviewsStats(SQLModel):
+    """Aggregated score distribution and review counts over time."""
+
+    total: int
+    average_score: float | None
+    histogram: list[ReviewsScoreBucket]
+    timeline: list[ReviewsTimeBucket]
@@ -0,0 +1,26 @@
+"""Score prior database models."""
+
+from copy import deepcopy
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+
+from .common import LAST_UPDATED
+
+
+class ScorePriors(SQLModel, table=True):
+    """
+    The prior the weighted scores of beers are pulled towards.
+
+    Holds a single row. mean is the average score of every review and weight is
+    how many reviews of that mean every beer starts out with.
+    """
+
+    __tablename__ = "score_priors"
+
+    id: int = Field(
+        default=1, primary_key=True, sa_column_kwargs={"autoincrement": False}
+    )
+    mean: float
+    weight: float
+    last_updated: datetime = deepcopy(LAST_UPDATED)
@@ -0,0 +1,182 @@
+"""Cross-worker change notifications using Postgres LISTEN/NOTIFY."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Collection
+
+    type ChangeHandler = Callable[[ChangeEvent], None]
+
+# Channel the notify_change() trigger function publishes to. See the
+# "add_change_notify_triggers" migration.
+CHANGES_CHANNEL = "beer_review_changes"
+
+# Pseudo operations dispatched by the listener itself rather than the database.
+# Anything caching data must drop it when the connection state changes as we
+# can't know what notifications were missed in between.
+CONNECTED = "CONNECTED"
+DISCONNECTED = "DISCONNECTED"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """A single row change published by the database."""
+
+    table: str
+    op: str
+    identifier: str | None = None
+    name: str | None = None
+    old_name: str | None = None
+    beer_id: str | None = None
+    score: float | None = None
+    # Columns an UPDATE changed, None when not known
+    changed: frozenset[str] | None = None
+
+    @classmethod
+    def from_payload(cls, payload: str) -> ChangeEvent:
+        """Build a change event from the json payload of a notification."""
+        data = json.loads(payload)
+        return cls(
+            table=data["table"],
+            op=data["op"],
+            identifier=data.get("id"),
+            name=data.get("name"),
+            old_name=data.get("old_name"),
+            beer_id=data.get("beer_id"),
+            score=data.get("score"),
+            changed=(
+                None if data.get("changed") is None else frozenset(data["changed"])
+            ),
+        )
+
+    def changes_any(self, columns: Collection[str]) -> bool:
+        """Return whether the change may have touched any of the columns."""
+        return (
+            self.op != "UPDATE"
+            or self.changed is None
+            or not self.changed.isdisjoint(columns)
+        )
+
+    @property
+    def keys(self) -> set[str]:
+        """Return every key a cache could have stored this record under."""
+        return {
+            key
+            for key in (self.identifier, self.name, self.old_name, self.beer_id)
+            if key is not None
+        }
+
+
+def asyncpg_dsn(postgres_uri: str) -> str:
+    """Convert the sqlalchemy connection uri into a plain asyncpg dsn."""
+    return (
+        make_url(postgres_uri)
+        .set(drivername="postgresql")
+        .render_as_string(hide_password=False)
+    )
+
+
+class ChangeListener:
+    """
+    Background listener for database change notifications.
+
+    A single dedicated connection per worker listens on CHANGES_CHANNEL and fans
+    each event out to the handlers subscribed to that table. Handlers are called
+    from the event loop so they must be quick and must not block, anything
+    requiring io should be handed off to a task or queue.
+    """
+
+    def __init__(self, postgres_uri: str, reconnect_delay: float = 1.0) -> None:
+        """Create the listener, the connection is only opened by start."""
+        self._dsn = asyncpg_dsn(postgres_uri)
+        self._reconnect_delay = reconnect_delay
+        self._handlers: defaultdict[str, list[ChangeHandler]] = defaultdict(list)
+        self._task: asyncio.Task | None = None
+        self._closed = asyncio.Event()
+        self.connected = False
+
+    def subscribe(self, table: str, handler: ChangeHandler) -> None:
+        """Call handler whenever a row in table changes."""
+        self._handlers[table].append(handler)
+
+    def unsubscribe(self, table: str, handler: ChangeHandler) -> None:
+        """Stop calling handler for changes to table."""
+        with contextlib.suppress(ValueError):
+            self._handlers[table].remove(handler)
+
+    async def start(self) -> None:
+        """Start listening in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="change-listener")
+
+    async def stop(self) -> None:
+        """Stop listening and close the connection."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def dispatch(self, event: ChangeEvent) -> None:
+        """Pass an event on to every handler subscribed to its table."""
+        for handler in list(self._handlers.get(event.table, ())):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Change handler failed for %s", event)
+
+    def _dispatch_all(self, op: str) -> None:
+        for table in list(self._handlers):
+            self.dispatch(ChangeEvent(table=table, op=op))
+
+    def _on_notification(
+        self,
+        _connection: asyncpg.Connection,
+        _pid: int,
+        _channel: str,
+        payload: str,
+    ) -> None:
+        try:
+            event = ChangeEvent.from_payload(payload)
+        except (ValueError, KeyError):
+            logger.warning("Ignoring malformed change notification: %s", payload)
+            return
+        self.dispatch(event)
+
+    def _on_terminate(self, _connection: asyncpg.Connection) -> None:
+        self._closed.set()
+
+    async def _run(self) -> None:
+        """Keep a listening connection open, reconnecting when it drops."""
+        while True:
+            connection = None
+            try:
+                self._closed.clear()
+                connection = await asyncpg.connect(self._dsn)
+                connection.add_termination_listener(self._on_terminate)
+                await connection.add_listener(CHANGES_CHANNEL, self._on_notification)
+                self.connected = True
+                self._dispatch_all(CONNECTED)
+                await self._closed.wait()
+            except (OSError, asyncpg.PostgresError):
+                logger.warning("Change listener connection failed", exc_info=True)
+            finally:
+                if self.connected:
+                    self.connected = False
+                    self._dispatch_all(DISCONNECTED)
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self._reconnect_delay)
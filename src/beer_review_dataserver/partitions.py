@@ -0,0 +1,161 @@
+"""Maintenance of the monthly partitions of the reviews table."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, cast
+
+import asyncpg
+from sqlalchemy import column, func, table
+from sqlmodel import select
+
+from .notifications import asyncpg_dsn
+from .scores import recompute_beer_scores
+
+if TYPE_CHECKING:
+    import datetime
+    from pathlib import Path
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Installed by the partition_reviews_by_month migration
+PARTITIONS_FUNCTION = "create_reviews_partitions(timestamptz, timestamptz)"
+
+# The columns of a reviews import file
+ARCHIVE_COLUMNS = ["username", "score", "comment", "beer_name", "date_created"]
+
+# How long detaching waits for the queries using reviews to finish
+DETACH_LOCK_TIMEOUT = "5s"
+
+LIST_PARTITIONS = """
+SELECT
+    child.relname AS name,
+    pg_get_expr(child.relpartbound, child.oid) AS bounds,
+    greatest(child.reltuples, 0)::bigint AS rows,
+    pg_size_pretty(pg_total_relation_size(child.oid)) AS size
+FROM pg_inherits
+JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname = 'reviews'
+ORDER BY child.relname
+"""
+
+
+@dataclass
+class ReviewPartition:
+    """A partition of reviews, rows is postgres' estimate."""
+
+    name: str
+    bounds: str
+    rows: int
+    size: str
+
+
+def partition_name(month: datetime.date) -> str:
+    """Return the name of the partition holding the reviews of a month."""
+    return f"reviews_{month:%Y_%m}"
+
+
+async def create_review_partitions(
+    session_factory: async_sessionmaker[AsyncSession], months_ahead: int = 3
+) -> int:
+    """
+    Create the partitions up to months_ahead months from now.
+
+    Reviews in the default partition are moved to the partitions created for
+    their months. Does nothing when reviews isn't partitioned, e.g. for a
+    database created by create_db_and_tables. Returns how many partitions were
+    created.
+    """
+    # make_interval takes years then months
+    end_at = func.now() + func.make_interval(0, months_ahead)
+    async with session_factory() as session:
+        installed = await session.exec(
+            select(func.to_regprocedure(PARTITIONS_FUNCTION))
+        )
+        if installed.one() is None:
+            return 0
+        created = await session.exec(
+            select(func.create_reviews_partitions(func.now(), end_at))
+        )
+        created = created.one()
+        await session.commit()
+    if created:
+        logger.info("Created %d review partitions", created)
+    return created
+
+
+async def list_review_partitions(postgres_uri: str) -> list[ReviewPartition]:
+    """Return the partitions of reviews, oldest first."""
+    connection = await asyncpg.connect(asyncpg_dsn(postgres_uri))
+    try:
+        rows = await connection.fetch(LIST_PARTITIONS)
+    finally:
+        await connection.close()
+    return [ReviewPartition(**row) for row in rows]
+
+
+async def detach_review_partition(
+    session_factory: async_sessionmaker[AsyncSession],
+    month: datetime.date,
+    archive: Path | None = None,
+    *,
+    drop: bool = False,
+) -> str:
+    """
+    Detach the partition of a month from reviews.
+
+    :param session_factory: Sessions into the database
+    :param month: Any date in the month to detach
+    :param archive: Directory to write the reviews of the partition to, as a
+        CSV file `beer_dataserver import --reviews` can load back once the
+        partition has been dropped
+    :param drop: Drop the partition once detached and archived
+
+    The default partition rules out detaching CONCURRENTLY, so reviews is
+    locked while the partition is detached. That only changes the catalog, but
+    the lock has to wait for the queries already using reviews, so it gives up
+    after DETACH_LOCK_TIMEOUT rather than hold up the requests queued behind it.
+    The beers reviewed in the month lose those reviews, so their scores are
+    recalculated straight after, in a transaction of their own to keep the lock
+    short. A detached partition is a standalone table that can be dumped,
+    moved to cheaper storage or dropped. Reviews dated in its month written
+    afterwards go to the default partition. Returns the name of the partition.
+    """
+    name = partition_name(month)
+    async with session_factory() as session:
+        connection = await session.connection()
+        await connection.exec_driver_sql(
+            f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"
+        )
+        await connection.exec_driver_sql(f"ALTER TABLE reviews DETACH PARTITION {name}")
+        await session.commit()
+
+        beer_ids = await session.exec(
+            select(column("beer_id")).distinct().select_from(table(name))
+        )
+        changed = await recompute_beer_scores(session, beer_ids.all())
+        await session.commit()
+        logger.info("Recalculated the scores of %d beers", len(changed))
+
+        if archive is not None:
+            await asyncio.to_thread(archive.mkdir, parents=True, exist_ok=True)
+            raw = await (await session.connection()).get_raw_connection()
+            driver_connection = cast("asyncpg.Connection", raw.driver_connection)
+            await driver_connection.copy_from_table(
+                name,
+                output=archive / f"{name}.csv",
+                columns=ARCHIVE_COLUMNS,
+                format="csv",
+                header=True,
+            )
+            await session.commit()
+        if drop:
+            await (await session.connection()).exec_driver_sql(f"DROP TABLE {name}")
+            await session.commit()
+    return name
@@ -0,0 +1,228 @@
+"""Opt-in sampling profiles of individual requests."""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import datetime
+import hmac
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import event
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pyinstrument.frame import Frame
+    from pyinstrument.session import Session
+    from sqlalchemy.engine import Engine
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_HEADER = b"x-profile"
+
+# Frames whose time is attributed to pydantic, by function name. Their callees
+# are not looked at so time isn't counted twice.
+VALIDATION_FUNCTIONS = frozenset(
+    {
+        "model_validate",
+        "validate_python",
+        "validate_json",
+        "request_body_to_args",
+        "_validate_value_with_model_field",
+    }
+)
+SERIALIZATION_FUNCTIONS = frozenset(
+    {
+        "serialize_response",
+        "jsonable_encoder",
+        "model_dump",
+        "model_dump_json",
+        "dump_python",
+        "dump_json",
+    }
+)
+
+
+@dataclass
+class RequestTimings:
+    """Time spent in the database by the current request."""
+
+    db_time: float = 0.0
+    queries: int = 0
+
+
+# Set while a request is being measured. The object is shared with the
+# greenlets SQLAlchemy runs queries in, so it's updated in place.
+request_timings: contextvars.ContextVar[RequestTimings | None] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+_query_started: contextvars.ContextVar[float] = contextvars.ContextVar(
+    "query_started", default=0.0
+)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record the time spent executing statements into request_timings."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(*_args: object) -> None:
+        if request_timings.get() is not None:
+            _query_started.set(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(*_args: object) -> None:
+        timings = request_timings.get()
+        if timings is not None:
+            timings.db_time += time.perf_counter() - _query_started.get()
+            timings.queries += 1
+
+
+def _attribute(frame: Frame, totals: dict[str, float]) -> None:
+    """Add up the time of the pydantic validation and serialisation frames."""
+    if frame.function in VALIDATION_FUNCTIONS:
+        totals["validation"] += frame.time
+    elif frame.function in SERIALIZATION_FUNCTIONS:
+        totals["serialization"] += frame.time
+    else:
+        for child in frame.children:
+            _attribute(child, totals)
+
+
+@dataclass
+class ProfileSummary:
+    """Where the time of a profiled request went, in seconds."""
+
+    id: str
+    method: str
+    path: str
+    status_code: int | None
+    started: datetime.datetime
+    duration: float
+    db_time: float
+    queries: int
+    validation: float
+    serialization: float
+
+
+class ProfileStore:
+    """Profiles saved to a directory, keeping only the most recent."""
+
+    def __init__(self, directory: Path, keep: int) -> None:
+        """Create the store, the directory is created on the first save."""
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, summary: ProfileSummary, session: Session) -> None:
+        """Write the summary and the profile rendered as html."""
+        from pyinstrument.renderers import HTMLRenderer  # noqa: PLC0415
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{summary.id}.html").write_text(
+            HTMLRenderer().render(session), encoding="utf-8"
+        )
+        (self.directory / f"{summary.id}.json").write_text(
+            json.dumps(asdict(summary), default=str), encoding="utf-8"
+        )
+        for old in self.summary_paths()[self.keep :]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".html").unlink(missing_ok=True)
+
+    def summary_paths(self) -> list[Path]:
+        """Return the summary files, newest first."""
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.json"), reverse=True)
+
+    def summaries(self) -> list[dict[str, Any]]:
+        """Return the saved summaries, newest first."""
+        return [json.loads(path.read_text()) for path in self.summary_paths()]
+
+    def html_path(self, profile_id: str) -> Path | None:
+        """Return the html profile with this id, if there is one."""
+        if not re.fullmatch(r"[\w-]+", profile_id):
+            return None
+        path = self.directory / f"{profile_id}.html"
+        return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of requests with pyinstrument.
+
+    A request is profiled when its X-Profile header matches the admin token, or
+    at random with probability sample_rate. The time spent executing
+    statements, validating with pydantic and serialising the response is split
+    out into a summary saved with the profile.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: ProfileStore,
+        token: str = "",
+        sample_rate: float = 0.0,
+        interval: float = 0.001,
+    ) -> None:
+        """Wrap app, profiles are saved to store."""
+        self.app = app
+        self.store = store
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.interval = interval
+
+    def should_profile(self, scope: Scope) -> bool:
+        """Return whether to profile this request."""
+        header = dict(scope["headers"]).get(PROFILE_HEADER)
+        if self.token and header and hmac.compare_digest(header, self.token):
+            return True
+        return random.random() < self.sample_rate  # noqa: S311
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, profiling it if selected."""
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler  # noqa: PLC0415
+
+        status_code = None
+
+        async def send_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = datetime.datetime.now(datetime.UTC)
+        # Shared with the access log when it's already measuring the request
+        timings = request_timings.get() or RequestTimings()
+        token = request_timings.set(timings)
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            session = profiler.stop()
+            request_timings.reset(token)
+            totals = {"validation": 0.0, "serialization": 0.0}
+            root = session.root_frame()
+            if root is not None:
+                _attribute(root, totals)
+            summary = ProfileSummary(
+                id=f"{started:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}",
+                method=scope["method"],
+                path=scope["path"],
+                status_code=status_code,
+                started=started,
+                duration=session.duration,
+                db_time=timings.db_time,
+                queries=timings.queries,
+                **totals,
+            )
+            await asyncio.to_thread(self.store.save, summary, session)
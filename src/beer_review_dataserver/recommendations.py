@@ -0,0 +1,245 @@
+"""In-memory index of the beers liked by the same users as each beer."""
+
+from __future__ import annotations
+
+import array
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from importlib.util import find_spec
+from typing import TYPE_CHECKING
+
+from pydantic import BaseModel
+from sqlmodel import col, select
+
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.models.reviews import Reviews
+
+from .similarity import (
+    Neighbours,
+    PreviousNeighbours,
+    Ratings,
+    SimilarityOptions,
+    build_neighbours,
+)
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from .notifications import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_SIMILAR = 100
+
+# Seconds to wait before trying again when an update fails
+RETRY_DELAY = 5.0
+
+# Reviews are loaded in batches of this many rows
+FETCH_SIZE = 10_000
+
+# The only column of beers held in the index, updates to the others, like the
+# score every new review updates, leave it as it is
+INDEX_COLUMNS = frozenset({"name"})
+
+
+class SimilarBeer(BaseModel):
+    """A beer liked by the users who liked another one."""
+
+    id: uuid.UUID
+    name: str
+    similarity: float
+
+
+@dataclass(frozen=True)
+class SimilarityIndex:
+    """Every beer with its neighbours, looked up by the beer's position."""
+
+    beer_ids: list[uuid.UUID]
+    names: list[str]
+    positions: dict[uuid.UUID, int]
+    neighbours: Neighbours
+
+    def similar(self, beer_id: uuid.UUID, limit: int) -> list[SimilarBeer] | None:
+        """Return the most similar beers, or None for a beer that isn't known."""
+        position = self.positions.get(beer_id)
+        if position is None:
+            return None
+        indices = self.neighbours.indices[position, :limit].tolist()
+        scores = self.neighbours.scores[position, :limit].tolist()
+        return [
+            SimilarBeer(
+                id=self.beer_ids[index], name=self.names[index], similarity=score
+            )
+            for index, score in zip(indices, scores, strict=True)
+            if index >= 0
+        ]
+
+
+class Recommender:
+    """
+    Keep the most similar beers of every beer in memory.
+
+    Similarity is the adjusted cosine similarity of the beers' review scores,
+    computed with sparse matrices in a separate process so the event loop and
+    the workers' requests aren't held up. Changes to reviews mark their beers
+    changed and after update_delay seconds only the neighbours of the affected
+    beers are recomputed, so a burst of reviews causes a single update. Beers
+    being added, deleted or renamed also cause an update, their score updates
+    don't. Every update, however few beers changed, loads every review with a
+    full scan of reviews, as the similarities of the changed beers depend on
+    all the scores of their reviewers. Everything is recomputed every
+    rebuild_interval seconds, which also keeps the index up to date when the
+    change listener is disabled.
+
+    Needs numpy and scipy from the recommendations extra.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        options: SimilarityOptions,
+        update_delay: float,
+        rebuild_interval: float,
+    ) -> None:
+        """Create the recommender, start must be called to build the index."""
+        self._session_factory = session_factory
+        self.options = options
+        self.update_delay = update_delay
+        self.rebuild_interval = rebuild_interval
+        self.index: SimilarityIndex | None = None
+        self._changed: set[str] = set()
+        self._rebuild = True
+        self._stale = asyncio.Event()
+        self._executor: ProcessPoolExecutor | None = None
+        self._task: asyncio.Task | None = None
+
+    def handle_change(self, event: ChangeEvent) -> None:
+        """Change listener callback for the beers and reviews tables."""
+        if event.table == "reviews":
+            if event.beer_id is None:
+                # An import, or changes may have been missed while disconnected
+                self._rebuild = True
+            else:
+                self._changed.add(event.beer_id)
+        elif not event.changes_any(INDEX_COLUMNS):
+            return
+        # Every update picks up new, renamed and deleted beers
+        self._stale.set()
+
+    async def update(self, changed: set[str], *, rebuild: bool) -> SimilarityIndex:
+        """Load every review and recompute the neighbours of the changed beers."""
+        async with self._session_factory() as session:
+            beers = (
+                await session.exec(select(Beers.id, Beers.name).order_by(col(Beers.id)))
+            ).all()
+            positions = {
+                beer_id: position for position, (beer_id, _) in enumerate(beers)
+            }
+            ratings = await self._load_ratings(session, positions)
+
+        previous = None
+        if self.index is not None and not rebuild:
+            changed_ids = (uuid.UUID(beer_id) for beer_id in changed)
+            previous = PreviousNeighbours(
+                neighbours=self.index.neighbours,
+                positions=[
+                    positions.get(beer_id, -1) for beer_id in self.index.beer_ids
+                ],
+                changed=[positions[i] for i in changed_ids if i in positions],
+            )
+        loop = asyncio.get_running_loop()
+        neighbours = await loop.run_in_executor(
+            self._executor, partial(build_neighbours, ratings, self.options, previous)
+        )
+        self.index = SimilarityIndex(
+            beer_ids=[beer_id for beer_id, _ in beers],
+            names=[name for _, name in beers],
+            positions=positions,
+            neighbours=neighbours,
+        )
+        logger.info(
+            "%s the similarities of %d beers from %d reviews",
+            "Rebuilt" if previous is None else "Updated",
+            len(beers),
+            len(ratings.scores),
+        )
+        return self.index
+
+    async def _load_ratings(
+        self, session: AsyncSession, positions: dict[uuid.UUID, int]
+    ) -> Ratings:
+        """Load every review score with its username and beer as codes."""
+        usernames: dict[str, int] = {}
+        users = array.array("i")
+        beers = array.array("i")
+        scores = array.array("f")
+        result = await session.stream(
+            select(Reviews.username, Reviews.beer_id, Reviews.score)
+        )
+        async for rows in result.partitions(FETCH_SIZE):
+            for username, beer_id, score in rows:
+                # Reviews of a beer created since the beers were loaded
+                position = positions.get(beer_id)
+                if position is None:
+                    continue
+                users.append(usernames.setdefault(username, len(usernames)))
+                beers.append(position)
+                scores.append(score)
+        return Ratings(
+            users=users, beers=beers, scores=scores, beer_count=len(positions)
+        )
+
+    async def start(self) -> None:
+        """Build the index and keep it up to date in the background."""
+        if self._task is not None:
+            return
+        if find_spec("numpy") is None or find_spec("scipy") is None:
+            logger.error("Recommendations need the recommendations extra installed")
+            return
+        # Forking would copy the event loop and open connections
+        self._executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._stale.set()
+        self._task = asyncio.create_task(self._run(), name="recommendations")
+
+    async def stop(self) -> None:
+        """Stop updating the index and shut down its process."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with asyncio.timeout(self.rebuild_interval or None):
+                    await self._stale.wait()
+            except TimeoutError:
+                self._rebuild = True
+            if self.index is not None:
+                await asyncio.sleep(self.update_delay)
+            # Cleared before loading so changes made during the update mark
+            # the new index stale again
+            self._stale.clear()
+            changed, self._changed = self._changed, set()
+            rebuild, self._rebuild = self._rebuild, False
+            try:
+                await self.update(changed, rebuild=rebuild)
+            except Exception:
+                logger.exception("Failed to update the beer similarities")
+                self._changed |= changed
+                self._rebuild |= rebuild
+                self._stale.set()
+                await asyncio.sleep(RETRY_DELAY)
@@ -0,0 +1,70 @@
+"""Admin dataserver routes."""
+
+from __future__ import annotations
+
+import secrets
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import FileResponse
+
+from beer_review_dataserver.config import get_settings
+from beer_review_dataserver.deadlines import disconnects, timeouts
+from beer_review_dataserver.dependencies import profile_store
+
+from .common import ADMIN_DISABLED, NOT_AUTHORISED, PROFILE_NOT_FOUND
+
+settings = get_settings()
+
+
+def require_admin(x_admin_token: Annotated[str | None, Header()] = None) -> None:
+    """Only let requests carrying the admin token through."""
+    if not settings.admin_token:
+        raise ADMIN_DISABLED
+    if x_admin_token is None or not secrets.compare_digest(
+        x_admin_token, settings.admin_token
+    ):
+        raise NOT_AUTHORISED
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+    responses={
+        404: {"Description": "Not Found"},
+        403: {"Description": "Not Authorised"},
+    },
+)
+
+
+@router.get("/profiles")
+async def list_profiles() -> list[dict[str, Any]]:
+    """
+    Return the summaries of the saved request profiles, newest first.
+
+    Each summary splits the duration of the request into time spent executing
+    statements, validating and serialising with pydantic.
+    """
+    return profile_store.summaries()
+
+
+@router.get("/profiles/{profile_id}", response_class=FileResponse)
+async def download_profile(profile_id: str) -> FileResponse:
+    """Download a request profile as a pyinstrument html report."""
+    path = profile_store.html_path(profile_id)
+    if path is None:
+        raise PROFILE_NOT_FOUND
+    return FileResponse(path, media_type="text/html", filename=path.name)
+
+
+@router.get("/timeouts")
+async def list_timeouts() -> dict[str, dict[str, int]]:
+    """
+    Return the requests cut short since the worker started, by route.
+
+    timeouts counts statements cancelled for running over the route's
+    statement timeout, disconnects counts requests cancelled because the client
+    went away before the response was ready.
+    """
+    return {"timeouts": dict(timeouts), "disconnects": dict(disconnects)}
@@ -0,0 +1,280 @@
+"""Batch dataserver route, running several read queries in one request."""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import uuid  # noqa: TC003
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Annotated, Any, Literal
+
+from fastapi import APIRouter, Response
+from fastapi.exceptions import HTTPException
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy.exc import DBAPIError
+
+from beer_review_dataserver.config import get_settings
+from beer_review_dataserver.deadlines import (
+    apply_statement_timeout,
+    is_statement_timeout,
+    route_timeout,
+    timeouts,
+)
+from beer_review_dataserver.dependencies import async_session
+from beer_review_dataserver.models.beers import (
+    BeersPublicWithBrewery,
+    BeersPublicWithRelations,
+)
+from beer_review_dataserver.models.breweries import (
+    BreweriesPublic,
+    BreweriesPublicWithBeers,
+    BreweriesSummary,
+)
+from beer_review_dataserver.models.reviews import ReviewsPublicWithBeers, ReviewsStats
+
+from . import beers, breweries, reviews
+from .common import QUERY_TIMEOUT, TotalCount
+from .types import (
+    MAX_BATCH_SIZE,
+    BatchOptions,
+    BatchResponse,
+    CommonOptions,
+    QueryOptions,
+)
+
+if TYPE_CHECKING:
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+settings = get_settings()
+
+MAX_BATCH_QUERIES = 10
+
+# Every sub-query holds its own pooled connection while it runs. Across every
+# batch at most pool_size of them run at once, leaving the overflow to the
+# other routes.
+batch_connections = asyncio.Semaphore(settings.pool_size)
+
+
+def _pick[M: BaseModel](model: type[M], query: BaseModel) -> M:
+    """Return the options of a route taken from the fields of a sub-query."""
+    return model.model_validate(query.model_dump(include=set(model.model_fields)))
+
+
+class SubQuery(BaseModel, ABC):
+    """
+    A query against one of the read routes, with that route's parameters.
+
+    Every sub-query with a route must implement run, which is checked when the
+    class is defined rather than on the first request for it.
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:  # noqa: ANN401
+        """Refuse a routable sub-query that doesn't implement run."""
+        super().__pydantic_init_subclass__(**kwargs)
+        if "route" in cls.model_fields and inspect.isabstract(cls):
+            msg = f"{cls.__name__} must implement run"
+            raise TypeError(msg)
+
+    @abstractmethod
+    async def run(self, session: AsyncSession) -> Any:  # noqa: ANN401
+        """Run the query and return the response of the route."""
+
+
+class BeersQuery(SubQuery, CommonOptions, QueryOptions):
+    """Parameters of GET /beers/."""
+
+    route: Literal["/beers/"]
+
+    async def run(self, session: AsyncSession) -> list[BeersPublicWithRelations]:
+        """Run the query and return the response of the route."""
+        found = await beers.read_beers(
+            session,
+            _pick(CommonOptions, self),
+            _pick(QueryOptions, self),
+            TotalCount(Response()),
+        )
+        return [BeersPublicWithRelations.model_validate(beer) for beer in found]
+
+
+class BeersBatchQuery(SubQuery, BatchOptions):
+    """Parameters of GET /beers/batch."""
+
+    route: Literal["/beers/batch"]
+
+    async def run(self, session: AsyncSession) -> BatchResponse[BeersPublicWithBrewery]:
+        """Run the query and return the response of the route."""
+        return await beers.read_beers_batch(session, _pick(BatchOptions, self))
+
+
+class ListBeersQuery(SubQuery, QueryOptions):
+    """Parameters of GET /beers/list-beers."""
+
+    route: Literal["/beers/list-beers"]
+
+    async def run(self, session: AsyncSession) -> list[str]:
+        """Run the query and return the response of the route."""
+        return await beers.list_beers(session, _pick(QueryOptions, self))
+
+
+class BreweriesQuery(SubQuery, CommonOptions, QueryOptions):
+    """Parameters of GET /breweries/."""
+
+    route: Literal["/breweries/"]
+    include_beers: bool = True
+
+    async def run(
+        self, session: AsyncSession
+    ) -> list[BreweriesPublicWithBeers] | list[BreweriesPublic]:
+        """Run the query and return the response of the route."""
+        found = await breweries.read_breweries(
+            session,
+            _pick(CommonOptions, self),
+            _pick(QueryOptions, self),
+            TotalCount(Response()),
+            include_beers=self.include_beers,
+        )
+        if not self.include_beers:
+            return found
+        return [BreweriesPublicWithBeers.model_validate(brewery) for brewery in found]
+
+
+class BrewerySummaryQuery(SubQuery, CommonOptions, QueryOptions):
+    """Parameters of GET /breweries/summary."""
+
+    route: Literal["/breweries/summary"]
+
+    async def run(self, session: AsyncSession) -> list[BreweriesSummary]:
+        """Run the query and return the response of the route."""
+        return await breweries.read_brewery_summaries(
+            session, _pick(CommonOptions, self), _pick(QueryOptions, self)
+        )
+
+
+class BreweriesBatchQuery(SubQuery, BatchOptions):
+    """Parameters of GET /breweries/batch."""
+
+    route: Literal["/breweries/batch"]
+
+    async def run(
+        self, session: AsyncSession
+    ) -> BatchResponse[BreweriesPublicWithBeers]:
+        """Run the query and return the response of the route."""
+        return await breweries.read_breweries_batch(session, _pick(BatchOptions, self))
+
+
+class ReviewsQuery(SubQuery, reviews.ReviewOptions, QueryOptions):
+    """Parameters of GET /reviews/."""
+
+    route: Literal["/reviews/"]
+
+    async def run(self, session: AsyncSession) -> list[ReviewsPublicWithBeers]:
+        """Run the query and return the response of the route."""
+        found = await reviews.read_reviews(
+            session,
+            _pick(reviews.ReviewOptions, self),
+            _pick(QueryOptions, self),
+            TotalCount(Response()),
+        )
+        return [ReviewsPublicWithBeers.model_validate(review) for review in found]
+
+
+class ReviewStatsQuery(SubQuery, reviews.ReviewStatsOptions):
+    """Parameters of GET /reviews/stats."""
+
+    route: Literal["/reviews/stats"]
+
+    async def run(self, session: AsyncSession) -> ReviewsStats:
+        """Run the query and return the response of the route."""
+        return await reviews.read_review_stats(
+            session, _pick(reviews.ReviewStatsOptions, self)
+        )
+
+
+class ReviewsBatchQuery(SubQuery):
+    """Parameters of GET /reviews/batch."""
+
+    route: Literal["/reviews/batch"]
+    ids: Annotated[list[uuid.UUID], Field(max_length=MAX_BATCH_SIZE)]
+
+    async def run(self, session: AsyncSession) -> BatchResponse[ReviewsPublicWithBeers]:
+        """Run the query and return the response of the route."""
+        return await reviews.read_reviews_batch(session, self.ids)
+
+
+type AnySubQuery = Annotated[
+    BeersQuery
+    | BeersBatchQuery
+    | ListBeersQuery
+    | BreweriesQuery
+    | BrewerySummaryQuery
+    | BreweriesBatchQuery
+    | ReviewsQuery
+    | ReviewStatsQuery
+    | ReviewsBatchQuery,
+    Field(discriminator="route"),
+]
+
+
+class BatchRequest(BaseModel):
+    """Named sub-queries to run in one request."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    queries: Annotated[dict[str, AnySubQuery], Field(max_length=MAX_BATCH_QUERIES)]
+
+
+class BatchQueryResult(BaseModel):
+    """The status code and response a sub-query would have had on its own."""
+
+    status_code: int
+    body: Any = None
+    detail: Any = None
+
+
+async def run_query(query: AnySubQuery) -> BatchQueryResult:
+    """Run a sub-query on its own pooled session, with its route's time budget."""
+    key = f"GET {query.route}"
+    async with batch_connections, async_session() as session:
+        apply_statement_timeout(session, route_timeout(key))
+        try:
+            body = await query.run(session)
+        except HTTPException as exc:
+            return BatchQueryResult(status_code=exc.status_code, detail=exc.detail)
+        except DBAPIError as exc:
+            if not is_statement_timeout(exc):
+                raise
+            timeouts[key] += 1
+            return BatchQueryResult(
+                status_code=QUERY_TIMEOUT.status_code, detail=QUERY_TIMEOUT.detail
+            )
+    return BatchQueryResult(status_code=200, body=body)
+
+
+router = APIRouter(
+    prefix="/batch",
+    tags=["batch"],
+)
+
+
+@router.post("/")
+async def run_batch(batch: BatchRequest) -> dict[str, BatchQueryResult]:
+    """
+    Run several read queries concurrently and return their results by name.
+
+    Each sub-query names the read route it would have been sent to and takes that
+    route's query parameters. A sub-query that fails returns its status code and
+    detail without failing the others. A database error other than a timeout
+    cancels the rest and fails the batch.
+    """
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = {
+                name: group.create_task(run_query(query))
+                for name, query in batch.queries.items()
+            }
+    except ExceptionGroup as exc:
+        raise exc.exceptions[0] from None
+    return {name: task.result() for name, task in tasks.items()}
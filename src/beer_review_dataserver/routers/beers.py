@@ -2,13 +2,19 @@
 
 from __future__ import annotations
 
-from typing import Annotated
+import uuid  # noqa: TC003
+from typing import Annotated, Any
 
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import selectinload
 from sqlmodel import select
 
-from beer_review_dataserver.dependencies import SessionDep  # noqa: TC001
+from beer_review_dataserver.autocomplete import MAX_SUGGESTIONS, beer_names
+from beer_review_dataserver.cache import MISSING, beer_name_listings, brewery_ids
+from beer_review_dataserver.dependencies import (
+    SessionDep,
+    recommender,
+)
 from beer_review_dataserver.models.beers import (
     Beers,
     BeersBase,
@@ -25,22 +31,54 @@ from beer_review_dataserver.models.breweries import (  # noqa: F401
     BreweriesPublic,
 )
 from beer_review_dataserver.models.reviews import Reviews, ReviewsPublic  # noqa: F401
+from beer_review_dataserver.recommendations import MAX_SIMILAR, SimilarBeer
 
 from .common import (
     BEER_NOT_FOUND,
     BREWERY_NOT_FOUND,
     NO_DELETE_ID,
     NO_PATCH_ID,
-    fetch_single_record,
+    RECOMMENDATIONS_UNAVAILABLE,
+    TotalCount,
+    delete_records,
+    fetch_many_records,
+    filter_clauses,
     oderby_function,
-    patch_record,
+    update_records,
+)
+from .types import (
+    BatchOptions,
+    BatchResponse,
+    BulkDeleteResponse,
+    BulkUpdateResponse,
+    CommonOptions,
+    DeleteResponse,
+    QueryOptions,
 )
-from .types import CommonOptions, DeleteResponse, QueryOptions
 
 BeersPublicWithRelations.model_rebuild()
 BeersPublicWithBrewery.model_rebuild()
 
 
+class BeerFilterOptions(BatchOptions):
+    """Beer specific filter options for bulk operations."""
+
+    company: str | None = None
+    company_id: uuid.UUID | None = None
+
+
+async def beer_update_values(session: SessionDep, beer: BeersUpdate) -> dict[str, Any]:
+    """Return the columns to update, keeping company_id in step with company."""
+    values = beer.model_dump(exclude_unset=True)
+    if "company" in values:
+        stmt = select(Breweries.id).where(Breweries.name == values["company"])
+        brewery_id = (await session.exec(stmt)).first()
+        if brewery_id is None:
+            raise BREWERY_NOT_FOUND
+        values["company_id"] = brewery_id
+    return values
+
+
 router = APIRouter(
     prefix="/beers",
     tags=["beers"],
@@ -51,20 +89,21 @@ router = APIRouter(
 @router.post("/")
 async def create_beer(beer: BeersBase, session: SessionDep) -> BeersPublic:
     """Create a beer from user input and insert into the database."""
-    stmt = select(Breweries).where(Breweries.name == beer.company)
-    result = await session.exec(stmt)
-    if not result:
-        raise BREWERY_NOT_FOUND
-    brewery = result.first()
+    brewery_id = brewery_ids.get(beer.company)
+    if brewery_id is MISSING:
+        version = brewery_ids.version
+        stmt = select(Breweries.id).where(Breweries.name == beer.company)
+        brewery_id = (await session.exec(stmt)).first()
+        if brewery_id is None:
+            raise BREWERY_NOT_FOUND
+        brewery_ids.set(beer.company, brewery_id, version)
     beer_data = beer.model_dump()
-    brewery_id = getattr(brewery, "id", None)
-    if brewery_id is None:
-        raise BREWERY_NOT_FOUND
     beer_data["company_id"] = brewery_id
     beer_db = Beers.model_validate(beer_data)
     session.add(beer_db)
     await session.commit()
     await session.refresh(beer_db)
+    beer_names.add(beer_db.id, beer_db.name, beer_db.score)
     return BeersPublic.model_validate(beer_db)
 
 
@@ -75,8 +114,28 @@ async def update_beer(
     options: Annotated[CommonOptions, Depends()],
 ) -> BeersPublic:
     """Patch a beer from user input and update the database."""
-    beer_db = await fetch_single_record(session, Beers, NO_PATCH_ID, options)
-    return await patch_record(beer_db, beer, session, BEER_NOT_FOUND)
+    values = await beer_update_values(session, beer)
+    beers = await update_records(session, Beers, NO_PATCH_ID, options, values)
+    if not beers:
+        raise BEER_NOT_FOUND
+    await session.commit()
+    beer_names.add(beers[0].id, beers[0].name, beers[0].score)
+    return BeersPublic.model_validate(beers[0])
+
+
+@router.patch("/bulk")
+async def update_beers(
+    session: SessionDep,
+    beer: BeersUpdate,
+    options: Annotated[BeerFilterOptions, Query()],
+) -> BulkUpdateResponse:
+    """Patch every beer matching the filters in a single statement."""
+    values = await beer_update_values(session, beer)
+    beers = await update_records(session, Beers, NO_PATCH_ID, options, values)
+    await session.commit()
+    for beer_db in beers:
+        beer_names.add(beer_db.id, beer_db.name, beer_db.score)
+    return BulkUpdateResponse(ok=True, updated=len(beers))
 
 
 @router.get(
@@ -86,8 +145,14 @@ async def read_beers(
     session: SessionDep,
     options: Annotated[CommonOptions, Depends()],
     query: Annotated[QueryOptions, Depends()],
+    total: Annotated[TotalCount, Depends()],
 ) -> list[BeersPublicWithRelations]:
-    """Return beers matching query parameters."""
+    """
+    Return beers matching query parameters.
+
+    Pass count=true to get the number of matching beers in X-Total-Count.
+    """
+    await total.add(session, Beers, filter_clauses(Beers, options))
     # Note selectinload is used to get the associated content from the other
     # tables. This provides us with a company from just the fk of company name
     # and also a list of reviews associated with our beer
@@ -108,16 +173,72 @@ async def read_beers(
     return beers.all()  # ty: ignore[invalid-return-type]
 
 
+@router.get("/batch")
+async def read_beers_batch(
+    session: SessionDep,
+    options: Annotated[BatchOptions, Query()],
+) -> BatchResponse[BeersPublicWithBrewery]:
+    """Return many beers by id or name, in the order they were requested."""
+    beers, missing = await fetch_many_records(
+        session,
+        Beers,
+        Beers.brewery,  # ty: ignore[invalid-argument-type]
+        options.ids,
+        options.names,
+    )
+    return BatchResponse[BeersPublicWithBrewery](
+        items=[BeersPublicWithBrewery.model_validate(beer) for beer in beers],
+        missing=missing,
+    )
+
+
 @router.get("/list-beers")
 async def list_beers(
     session: SessionDep,
     query: Annotated[QueryOptions, Query()],
 ) -> list[str]:
     """Return a list of beer names from the database."""
+    cache_key = (query.offset, query.limit, query.orderby, query.order)
+    names = beer_name_listings.get(cache_key)
+    if names is not MISSING:
+        return names
+
+    version = beer_name_listings.version
     stmt = select(Beers.name).offset(query.offset).limit(query.limit)
     stmt = oderby_function(stmt, Beers, query.orderby, query.order)
 
-    return (await session.exec(stmt)).all()  # ty: ignore[invalid-return-type]
+    names = list((await session.exec(stmt)).all())
+    beer_name_listings.set(cache_key, names, version)
+    return names
+
+
+@router.get("/autocomplete")
+async def autocomplete_beers(
+    session: SessionDep,
+    prefix: Annotated[str, Query(min_length=1)],
+    limit: Annotated[int, Query(ge=1, le=MAX_SUGGESTIONS)] = 10,
+) -> list[str]:
+    """Return the highest scoring beer names starting with prefix, ignoring case."""
+    return await beer_names.search(session, prefix, limit)
+
+
+@router.get("/{beer_id}/similar")
+async def similar_beers(
+    beer_id: uuid.UUID,
+    limit: Annotated[int, Query(ge=1, le=MAX_SIMILAR)] = 10,
+) -> list[SimilarBeer]:
+    """
+    Return the beers most liked by the users who liked this one.
+
+    Served from the similarity index each worker keeps in memory, a beer nobody
+    has reviewed has no similar beers yet.
+    """
+    if recommender.index is None:
+        raise RECOMMENDATIONS_UNAVAILABLE
+    similar = recommender.index.similar(beer_id, limit)
+    if similar is None:
+        raise BEER_NOT_FOUND
+    return similar
 
 
 @router.delete("/")
@@ -125,13 +246,27 @@ async def delete_beer(
     session: SessionDep,
     options: Annotated[CommonOptions, Query()],
 ) -> DeleteResponse:
-    """Delete a beer from the database."""
-    # Query for the beer by whether they pass the name or the id as a query parameter
-    beer_db = await fetch_single_record(session, Beers, NO_DELETE_ID, options)
+    """Delete a beer from the database, along with its reviews."""
+    # Delete the beer by whether they pass the name or the id as a query
+    # parameter, the database cascades the delete to the reviews
+    deleted = await delete_records(session, Beers, NO_DELETE_ID, options)
 
-    if not beer_db:
+    if not deleted:
         raise BEER_NOT_FOUND
 
-    await session.delete(beer_db)
     await session.commit()
+    beer_names.remove(deleted[0].id)
     return DeleteResponse(ok=True)
+
+
+@router.delete("/bulk")
+async def delete_beers(
+    session: SessionDep,
+    options: Annotated[BeerFilterOptions, Query()],
+) -> BulkDeleteResponse:
+    """Delete every beer matching the filters, along with their reviews."""
+    deleted = await delete_records(session, Beers, NO_DELETE_ID, options)
+    await session.commit()
+    for row in deleted:
+        beer_names.remove(row.id)
+    return BulkDeleteResponse(ok=True, deleted=len(deleted))
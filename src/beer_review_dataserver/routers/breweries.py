@@ -3,31 +3,46 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import selectinload
-from sqlmodel import select
+from sqlalchemy import func, true
+from sqlalchemy.orm import noload, selectinload
+from sqlmodel import col, select
 
+from beer_review_dataserver.autocomplete import MAX_SUGGESTIONS, brewery_names
 from beer_review_dataserver.dependencies import SessionDep
 
 # The following import is necessary to rebuild the model
 # This was the thought to be the best way to avoid circular import issues
-from beer_review_dataserver.models.beers import BeersPublic  # noqa: F401
+from beer_review_dataserver.models.beers import Beers, BeersPublic  # noqa: F401
 from beer_review_dataserver.models.breweries import (
     Breweries,
     BreweriesBase,
     BreweriesPublic,
     BreweriesPublicWithBeers,
+    BreweriesSummary,
     BreweriesUpdate,
 )
+from beer_review_dataserver.models.reviews import Reviews
 
 from .common import (
     BREWERY_NOT_FOUND,
     NO_DELETE_ID,
     NO_PATCH_ID,
-    fetch_single_record,
+    TotalCount,
+    delete_records,
+    fetch_many_records,
+    filter_clauses,
     oderby_function,
-    patch_record,
+    update_records,
+)
+from .types import (
+    BatchOptions,
+    BatchResponse,
+    BulkDeleteResponse,
+    BulkUpdateResponse,
+    CommonOptions,
+    DeleteResponse,
+    QueryOptions,
 )
-from .types import CommonOptions, DeleteResponse, QueryOptions
 
 BreweriesPublicWithBeers.model_rebuild()
 
@@ -47,6 +62,7 @@ async def create_brewery(
     session.add(brewery_db)
     await session.commit()
     await session.refresh(brewery_db)
+    brewery_names.add(brewery_db.id, brewery_db.name)
     return BreweriesPublic.model_validate(brewery_db)
 
 
@@ -57,9 +73,39 @@ async def update_brewery(
     options: Annotated[CommonOptions, Depends()],
 ) -> BreweriesPublic:
     """Patch a brewery from user input and update teh database."""
-    breweries_db = await fetch_single_record(session, Breweries, NO_PATCH_ID, options)
+    breweries = await update_records(
+        session,
+        Breweries,
+        NO_PATCH_ID,
+        options,
+        brewery.model_dump(exclude_unset=True),
+    )
+    if not breweries:
+        raise BREWERY_NOT_FOUND
+    await session.commit()
+    brewery_names.add(breweries[0].id, breweries[0].name)
+
+    return BreweriesPublic.model_validate(breweries[0])
 
-    return await patch_record(breweries_db, brewery, session, BREWERY_NOT_FOUND)
+
+@router.patch("/bulk")
+async def update_breweries(
+    session: SessionDep,
+    brewery: BreweriesUpdate,
+    options: Annotated[BatchOptions, Query()],
+) -> BulkUpdateResponse:
+    """Patch every brewery matching the ids or names in a single statement."""
+    breweries = await update_records(
+        session,
+        Breweries,
+        NO_PATCH_ID,
+        options,
+        brewery.model_dump(exclude_unset=True),
+    )
+    await session.commit()
+    for brewery_db in breweries:
+        brewery_names.add(brewery_db.id, brewery_db.name)
+    return BulkUpdateResponse(ok=True, updated=len(breweries))
 
 
 @router.get("/")
@@ -67,16 +113,28 @@ async def read_breweries(
     session: SessionDep,
     options: Annotated[CommonOptions, Depends()],
     query: Annotated[QueryOptions, Depends()],
-) -> list[BreweriesPublicWithBeers]:
-    """Return breweries matching query parameters."""
+    total: Annotated[TotalCount, Depends()],
+    *,
+    include_beers: bool = True,
+) -> list[BreweriesPublicWithBeers] | list[BreweriesPublic]:
+    """
+    Return breweries matching query parameters.
+
+    Pass include_beers=false to skip loading every beer of every brewery, the
+    breweries are then returned without a beers field rather than an empty
+    one, see /breweries/summary for beer counts and scores. Pass count=true to get the
+    number of matching breweries in X-Total-Count.
+    """
+    await total.add(session, Breweries, filter_clauses(Breweries, options))
     # Note selectinload is used to get the associated content from the other
     # tables. This provides us with a list of associated beers based on the fk
     # relationship
+    beers_loader = selectinload if include_beers else noload
     stmt = (
         select(Breweries)
         .offset(query.offset)
         .limit(query.limit)
-        .options(selectinload(Breweries.beers))  # ty: ignore[invalid-argument-type]
+        .options(beers_loader(Breweries.beers))  # ty: ignore[invalid-argument-type]
     )
     if options.name:
         stmt = stmt.where(Breweries.name == options.name)
@@ -85,8 +143,104 @@ async def read_breweries(
 
     stmt = oderby_function(stmt, Breweries, query.orderby, query.order)
 
-    breweries = await session.exec(stmt)
-    return breweries.all()  # ty: ignore[invalid-return-type]
+    breweries = (await session.exec(stmt)).all()
+    if not include_beers:
+        return [BreweriesPublic.model_validate(brewery) for brewery in breweries]
+    return breweries  # ty: ignore[invalid-return-type]
+
+
+@router.get("/summary")
+async def read_brewery_summaries(
+    session: SessionDep,
+    options: Annotated[CommonOptions, Depends()],
+    query: Annotated[QueryOptions, Depends()],
+) -> list[BreweriesSummary]:
+    """
+    Return breweries with their beer count, review count, average score and top beer.
+
+    The aggregates are computed per brewery on the page with lateral subqueries
+    so none of the beers or reviews are sent back to the dataserver. Results can
+    be ordered by any of the returned fields.
+    """
+    beer_counts = (
+        select(func.count().label("beer_count"))
+        .where(col(Beers.company_id) == col(Breweries.id))
+        .lateral("beer_counts")
+    )
+    review_stats = (
+        select(
+            func.count(col(Reviews.id)).label("review_count"),
+            func.avg(Reviews.score).label("average_score"),
+        )
+        .select_from(Reviews)
+        .join(Beers, col(Beers.id) == col(Reviews.beer_id))
+        .where(col(Beers.company_id) == col(Breweries.id))
+        .lateral("review_stats")
+    )
+    top_beer = (
+        select(
+            col(Beers.name).label("top_beer"),
+            col(Beers.score).label("top_beer_score"),
+        )
+        .where(col(Beers.company_id) == col(Breweries.id))
+        .order_by(col(Beers.score).desc())
+        .limit(1)
+        .lateral("top_beer")
+    )
+    stmt = (
+        select(  # ty: ignore[no-matching-overload]
+            col(Breweries.id),
+            col(Breweries.name),
+            col(Breweries.last_updated),
+            col(Breweries.date_created),
+            beer_counts.c.beer_count,
+            review_stats.c.review_count,
+            review_stats.c.average_score,
+            top_beer.c.top_beer,
+            top_beer.c.top_beer_score,
+        )
+        .select_from(Breweries)
+        .join(beer_counts, true())
+        .join(review_stats, true())
+        .outerjoin(top_beer, true())
+        .where(*filter_clauses(Breweries, options))
+        .offset(query.offset)
+        .limit(query.limit)
+    )
+    stmt = oderby_function(stmt, stmt.selected_columns, query.orderby, query.order)
+    rows = (await session.exec(stmt)).all()
+    return [BreweriesSummary.model_validate(row._asdict()) for row in rows]
+
+
+@router.get("/batch")
+async def read_breweries_batch(
+    session: SessionDep,
+    options: Annotated[BatchOptions, Query()],
+) -> BatchResponse[BreweriesPublicWithBeers]:
+    """Return many breweries by id or name, in the order they were requested."""
+    breweries, missing = await fetch_many_records(
+        session,
+        Breweries,
+        Breweries.beers,  # ty: ignore[invalid-argument-type]
+        options.ids,
+        options.names,
+    )
+    return BatchResponse[BreweriesPublicWithBeers](
+        items=[
+            BreweriesPublicWithBeers.model_validate(brewery) for brewery in breweries
+        ],
+        missing=missing,
+    )
+
+
+@router.get("/autocomplete")
+async def autocomplete_breweries(
+    session: SessionDep,
+    prefix: Annotated[str, Query(min_length=1)],
+    limit: Annotated[int, Query(ge=1, le=MAX_SUGGESTIONS)] = 10,
+) -> list[str]:
+    """Return brewery names starting with prefix, ignoring case."""
+    return await brewery_names.search(session, prefix, limit)
 
 
 @router.delete("/")
@@ -94,14 +248,28 @@ async def delete_brewery(
     session: SessionDep,
     options: Annotated[CommonOptions, Query()],
 ) -> DeleteResponse:
-    """Delete a brewery matching query parameters."""
-    # Query for the brewery by whether they pass the name or the id as a query parameter
-    brewery_db = await fetch_single_record(session, Breweries, NO_DELETE_ID, options)
+    """Delete a brewery matching query parameters, along with its beers."""
+    # Delete the brewery by whether they pass the name or the id as a query
+    # parameter, the database cascades the delete to its beers and their reviews
+    deleted = await delete_records(session, Breweries, NO_DELETE_ID, options)
 
-    if not brewery_db:
+    if not deleted:
         raise BREWERY_NOT_FOUND
 
-    await session.delete(brewery_db)
     await session.commit()
+    brewery_names.remove(deleted[0].id)
 
     return DeleteResponse(ok=True)
+
+
+@router.delete("/bulk")
+async def delete_breweries(
+    session: SessionDep,
+    options: Annotated[BatchOptions, Query()],
+) -> BulkDeleteResponse:
+    """Delete every brewery matching the ids or names, along with their beers."""
+    deleted = await delete_records(session, Breweries, NO_DELETE_ID, options)
+    await session.commit()
+    for row in deleted:
+        brewery_names.remove(row.id)
+    return BulkDeleteResponse(ok=True, deleted=len(deleted))
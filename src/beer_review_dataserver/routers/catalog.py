@@ -0,0 +1,75 @@
+"""Catalog dataserver routes."""
+
+from __future__ import annotations
+
+from typing import Annotated
+
+from fastapi import APIRouter, Header, Response
+
+from beer_review_dataserver.catalog import Catalog
+from beer_review_dataserver.dependencies import catalog_snapshot
+
+router = APIRouter(
+    prefix="/catalog",
+    tags=["catalog"],
+)
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """Return whether the client already holds this version."""
+    if if_none_match is None:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """Return whether Accept-Encoding allows gzip, honouring q-values."""
+    if accept_encoding is None:
+        return False
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    # An explicit gzip;q=0 wins over a wildcard
+    quality = qualities.get("gzip", qualities.get("x-gzip", qualities.get("*", 0.0)))
+    return quality > 0
+
+
+@router.get(
+    "/",
+    response_model=Catalog,
+    responses={304: {"description": "Not Modified"}},
+)
+async def read_catalog(
+    if_none_match: Annotated[str | None, Header()] = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Return every brewery and beer by name.
+
+    The catalog is served from a snapshot serialised and compressed ahead of
+    time. Send the ETag back in If-None-Match to get a 304 when it's unchanged.
+    """
+    snapshot = await catalog_snapshot.get()
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(snapshot.etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    if accepts_gzip(accept_encoding):
+        headers["Content-Encoding"] = "gzip"
+        body = snapshot.gzip_body
+    else:
+        body = snapshot.body
+    return Response(body, media_type="application/json", headers=headers)
@@ -3,12 +3,25 @@
 from __future__ import annotations
 
 import datetime
+import json
+import operator
 from typing import TYPE_CHECKING
 
+from fastapi import Response  # noqa: TC002
 from fastapi.exceptions import HTTPException
-from sqlmodel import select
+from sqlalchemy import delete, func, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlmodel import col, or_, select
 
 if TYPE_CHECKING:
+    import uuid
+    from collections.abc import Sequence
+    from typing import Any
+
+    from pydantic import BaseModel
+    from sqlalchemy import ColumnElement, Row
+    from sqlalchemy.orm import QueryableAttribute
     from sqlmodel.sql._expression_select_cls import SelectOfScalar
 
     from beer_review_dataserver.dependencies import SessionDep
@@ -16,7 +29,6 @@ if TYPE_CHECKING:
     from .beers import Beers, BeersPublicWithRelations, BeersUpdate
     from .breweries import Breweries, BreweriesPublicWithBeers, BreweriesUpdate
     from .reviews import Reviews, ReviewsPublicWithBeers, ReviewsUpdate
-    from .types import CommonOptions
 
     type Models = Beers | Breweries | Reviews
     type ReturnModels = (
@@ -24,9 +36,45 @@ if TYPE_CHECKING:
     )
     type UpdateModels = BeersUpdate | BreweriesUpdate | ReviewsUpdate
 
+# Option names that don't match the name of the column they filter on
+FILTER_COLUMNS = {"identifier": "id", "ids": "id", "names": "name"}
+# Options that filter on a range of a column rather than an exact value
+RANGE_FILTERS = {
+    "date_from": ("date_created", operator.ge),
+    "date_to": ("date_created", operator.lt),
+    "score_min": ("score", operator.ge),
+    "score_max": ("score", operator.le),
+}
+
+# Filtered totals are counted exactly up to this many records. Larger totals,
+# and the totals of unfiltered tables larger than this, are estimated by the
+# planner instead of scanning every matching row.
+MAX_EXACT_COUNT = 10_000
+
+# Rows in a table according to the last ANALYZE. Partitioned tables aren't
+# analysed by autovacuum, so their partitions are added up instead.
+TABLE_ESTIMATE = text(
+    """
+    SELECT coalesce(sum(greatest(reltuples, 0)), 0)::bigint
+    FROM pg_class
+    WHERE (oid = CAST(:table AS regclass) AND relkind = 'r')
+    OR oid IN (
+        SELECT inhrelid FROM pg_inherits
+        WHERE inhparent = CAST(:table AS regclass)
+    )
+    """
+)
+
 REVIEW_NOT_FOUND = HTTPException(status_code=404, detail="Review not found")
 BREWERY_NOT_FOUND = HTTPException(status_code=404, detail="Brewery not found")
 BEER_NOT_FOUND = HTTPException(status_code=404, detail="Beer not found")
+DUPLICATE_REVIEW = HTTPException(
+    status_code=403, detail="User is attempting to create multiple reviews"
+)
+UPDATE_CONFLICT = HTTPException(
+    status_code=409,
+    detail="Conflict: The update would duplicate a unique value or break a constraint",
+)
 NO_VALID_ORDER = HTTPException(
     status_code=400, detail="Invalid Order: Options include 'asc' and 'desc'"
 )
@@ -46,6 +94,48 @@ NO_VALID_FILE = HTTPException(
     status_code=400,
     detail="Invalid File: No filename found",
 )
+NO_BATCH_KEYS = HTTPException(
+    status_code=400,
+    detail="Invalid Batch: At least one id or name is required",
+)
+ADMIN_DISABLED = HTTPException(status_code=404, detail="Not Found")
+NOT_AUTHORISED = HTTPException(
+    status_code=403, detail="Not Authorised: Missing or invalid admin token"
+)
+IMAGE_NOT_FOUND = HTTPException(status_code=404, detail="Image not found")
+PROFILE_NOT_FOUND = HTTPException(status_code=404, detail="Profile not found")
+QUERY_TIMEOUT = HTTPException(
+    status_code=504,
+    detail="Query Timeout: The request took longer than its time budget",
+)
+IDEMPOTENCY_KEY_INVALID = HTTPException(
+    status_code=400,
+    detail="Invalid Idempotency-Key: Keys must be 1 to 255 characters long",
+)
+IDEMPOTENCY_KEY_REUSED = HTTPException(
+    status_code=422,
+    detail="Idempotency-Key Reused: The key was sent with a different request",
+)
+IDEMPOTENCY_IN_PROGRESS = HTTPException(
+    status_code=409,
+    detail="Conflict: A request with this Idempotency-Key is still in progress",
+)
+IDEMPOTENCY_BODY_TOO_LARGE = HTTPException(
+    status_code=413,
+    detail="Content Too Large: Requests with an Idempotency-Key are limited in size",
+)
+RECOMMENDATIONS_UNAVAILABLE = HTTPException(
+    status_code=503,
+    detail="Recommendations Unavailable: Similar beers haven't been computed yet",
+)
+FEED_UNAVAILABLE = HTTPException(
+    status_code=503,
+    detail="Feed Unavailable: Review changes aren't being received, try again later",
+)
+FEED_FULL = HTTPException(
+    status_code=503,
+    detail="Feed Unavailable: Too many clients are connected, try again later",
+)
 
 
 async def patch_record(
@@ -76,6 +166,42 @@ async def patch_record(
     return db
 
 
+async def update_records[T: Models](
+    session: SessionDep,
+    model: type[T],
+    exception: HTTPException,
+    options: BaseModel,
+    values: dict[str, Any],
+) -> list[T]:
+    """
+    Docstring for update_records.
+
+    :param session: default connection into the database
+    :param model: The sql model we are updating records of
+    :param exception: The exception to raise if no filters were given
+    :param options: The search options selecting the records to update
+    :param values: The columns to update, usually from
+        model_dump(exclude_unset=True) of the update model
+
+    Generic function for updating every matching record with a single
+    UPDATE ... RETURNING statement rather than fetching, modifying and
+    refreshing each record. The caller is responsible for committing.
+    Updates breaking a constraint, like giving several records the same
+    unique name, raise a 409.
+
+    returns the updated records
+    """
+    clauses = filter_clauses(model, options)
+    if not clauses:
+        raise exception
+    values = {**values, "last_updated": datetime.datetime.now(datetime.UTC)}
+    stmt = update(model).where(*clauses).values(values).returning(model)
+    try:
+        return list((await session.exec(stmt)).scalars())
+    except IntegrityError as exc:
+        raise UPDATE_CONFLICT from exc
+
+
 # Generic function for ordering/sorting results in ascending/descending order
 # based on a give column name
 def oderby_function(
@@ -108,22 +234,193 @@ def oderby_function(
     return stmt
 
 
-async def fetch_single_record(
+async def fetch_many_records[T: Models](
+    session: SessionDep,
+    model: type[T],
+    relation: QueryableAttribute,
+    ids: list[uuid.UUID],
+    names: list[str] | None = None,
+) -> tuple[list[T], list[str]]:
+    """
+    Fetch many records from the database by id or name in one query.
+
+    :param session: default connection into the database
+    :param model: The sql model we are fetching records of
+    :param relation: The relationship to load alongside the records
+    :param ids: The ids of the records to fetch
+    :param names: The names of the records to fetch, for models with a name
+
+    Records are returned in the order they were requested, with duplicates
+    removed, alongside the ids and names that couldn't be found.
+    """
+    names = names or []
+    clauses = []
+    if ids:
+        clauses.append(col(model.id).in_(ids))
+    if names:
+        clauses.append(col(model.name).in_(names))
+    if not clauses:
+        raise NO_BATCH_KEYS
+
+    stmt = select(model).where(or_(*clauses)).options(selectinload(relation))
+    records = (await session.exec(stmt)).all()
+    by_key: dict[uuid.UUID | str, T] = {record.id: record for record in records}
+    if names:
+        by_key.update(
+            {record.name: record for record in records}  # ty: ignore[unresolved-attribute]
+        )
+
+    found: dict[uuid.UUID, T] = {}
+    missing: list[str] = []
+    for key in (*ids, *names):
+        record = by_key.get(key)
+        if record is None:
+            missing.append(str(key))
+        else:
+            found.setdefault(record.id, record)
+    return list(found.values()), missing
+
+
+def filter_clauses(model: type[Models], options: BaseModel) -> list[ColumnElement]:
+    """
+    Docstring for filter_clauses.
+
+    :param model: The sql model that we are using to get the column names from
+    :param options: The search options passed to the route
+
+    Generic function for turning search options into where clauses. List
+    options match any of their values, range options (see RANGE_FILTERS) bound
+    their column and everything else is an equality check. Options that aren't
+    set are ignored.
+
+    returns the list of where clauses
+    """
+    clauses = []
+    for option, value in options.model_dump(exclude_none=True).items():
+        if option in RANGE_FILTERS:
+            column_name, compare = RANGE_FILTERS[option]
+            clauses.append(compare(col(getattr(model, column_name)), value))
+            continue
+        column = col(getattr(model, FILTER_COLUMNS.get(option, option)))
+        if isinstance(value, list):
+            if value:
+                clauses.append(column.in_(value))
+        else:
+            clauses.append(column == value)
+    return clauses
+
+
+async def delete_records(
     session: SessionDep,
     model: type[Models],
     exception: HTTPException,
-    options: CommonOptions,
-) -> Models | None:
-    """Fetch a single record from the database by name or id."""
-    if options.name:
-        data_db = (
-            await session.exec(select(model).where(model.options.name == options.name))
-        ).first()
-    elif options.identifier:
-        data_db = await session.get(model, options.identifier)
-    else:
+    options: BaseModel,
+    *returning: QueryableAttribute,
+) -> list[Row]:
+    """
+    Docstring for delete_records.
+
+    :param session: default connection into the database
+    :param model: The sql model we are deleting records of
+    :param exception: The exception to raise if no filters were given
+    :param options: The search options selecting the records to delete
+    :param returning: The columns of the deleted records to return
+
+    Deletes every matching record in a single statement, leaving the database to
+    cascade the delete to related tables. The caller is responsible for
+    committing.
+    """
+    clauses = filter_clauses(model, options)
+    if not clauses:
         raise exception
-    validate_func = getattr(Models, "model_validate", None)
-    if validate_func is not None:
-        return validate_func(data_db)
-    return None
+    stmt = delete(model).where(*clauses).returning(col(model.id), *returning)
+    return list((await session.exec(stmt)).all())
+
+
+async def explain_plan(
+    session: SessionDep, statement: str, parameters: Sequence[Any] = ()
+) -> dict[str, Any]:
+    """
+    Return the plan postgres makes for a statement, without running it.
+
+    The statement is in the driver's SQL with its positional parameters, as
+    sent to the database, and is passed on without being parsed for binds.
+    """
+    connection = await session.connection()
+    result = await connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {statement}", tuple(parameters)
+    )
+    plan = result.scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+async def estimate_rows(session: SessionDep, stmt: SelectOfScalar) -> int:
+    """Return the number of rows the planner expects a statement to return."""
+    connection = await session.connection()
+    compiled = stmt.compile(
+        dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+    )
+    return int((await explain_plan(session, str(compiled)))["Plan Rows"])
+
+
+async def count_records(
+    session: SessionDep, model: type[Models], clauses: list[ColumnElement]
+) -> tuple[int, bool]:
+    """
+    Docstring for count_records.
+
+    :param session: default connection into the database
+    :param model: The sql model we are counting records of
+    :param clauses: The where clauses selecting the records to count
+
+    Counts the matching records with count(*) over at most MAX_EXACT_COUNT + 1
+    rows. Unfiltered counts of large tables come from pg_class without touching
+    the table, and filtered counts over the cap from the planner's estimate.
+
+    returns the count and whether it is exact
+    """
+    if not clauses:
+        connection = await session.connection()
+        estimate = (
+            await connection.execute(TABLE_ESTIMATE, {"table": model.__tablename__})
+        ).scalar_one()
+        if estimate > MAX_EXACT_COUNT:
+            return estimate, False
+    matching = select(col(model.id)).where(*clauses)
+    count = (
+        await session.exec(
+            select(func.count()).select_from(
+                matching.limit(MAX_EXACT_COUNT + 1).subquery()
+            )
+        )
+    ).one()
+    if count <= MAX_EXACT_COUNT:
+        return count, True
+    return max(await estimate_rows(session, matching), count), False
+
+
+class TotalCount:
+    """
+    Dependency setting X-Total-Count when the route is called with count=true.
+
+    X-Total-Count-Estimated: true is added when the count is an estimate, see
+    count_records.
+    """
+
+    def __init__(self, response: Response, *, count: bool = False) -> None:
+        """Remember where to set the header and whether it was asked for."""
+        self.response = response
+        self.count = count
+
+    async def add(
+        self, session: SessionDep, model: type[Models], clauses: list[ColumnElement]
+    ) -> None:
+        """Set the headers to the number of records matching clauses."""
+        if not self.count:
+            return
+        total, exact = await count_records(session, model, clauses)
+        self.response.headers["X-Total-Count"] = str(total)
+        if not exact:
+            self.response.headers["X-Total-Count-Estimated"] = "true"
@@ -0,0 +1,38 @@
+"""Health check dataserver routes."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi import APIRouter, Response
+
+from beer_review_dataserver.dependencies import async_engine, readiness
+from beer_review_dataserver.warmup import pool_status
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"],
+)
+
+
+@router.get("/live")
+async def live() -> dict[str, str]:
+    """Report that the worker is running, whether or not it's ready."""
+    return {"status": "live"}
+
+
+@router.get("/ready")
+async def ready(response: Response) -> dict[str, Any]:
+    """
+    Report whether the worker should be sent traffic, with its pool usage.
+
+    Returns 503 until the connection pool has been warmed up, and again once
+    the worker starts shutting down.
+    """
+    if not readiness.ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if readiness.ready else "not ready",
+        "warmed_connections": readiness.warmed_connections,
+        "pool": pool_status(async_engine),
+    }
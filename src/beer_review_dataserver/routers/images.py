@@ -0,0 +1,94 @@
+"""Image dataserver routes."""
+
+from __future__ import annotations
+
+import uuid  # noqa: TC003
+from pathlib import Path
+
+from fastapi import APIRouter, UploadFile
+from fastapi.responses import RedirectResponse
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import col, select
+
+from beer_review_dataserver.dependencies import SessionDep, image_store
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.models.images import BeerImages
+
+from .common import BEER_NOT_FOUND, IMAGE_NOT_FOUND, NO_VALID_FILE
+from .types import CreateFileResponse
+
+router = APIRouter(
+    prefix="/images",
+    tags=["Images"],
+    responses={
+        404: {"Description": "Not Found"},
+        403: {"Description": "Not Authorised"},
+    },
+)
+
+
+@router.post("/")
+async def post_image(
+    session: SessionDep, beer_name: str, file: UploadFile | None = None
+) -> CreateFileResponse:
+    """
+    Store an image and make it the image of a beer.
+
+    The image is stored under the hash of its contents, so the same image
+    uploaded for several beers is only stored once. Returns the path the image
+    is served from under /images.
+    """
+    if not file or file.filename is None:
+        raise NO_VALID_FILE
+    beer = (await session.exec(select(Beers).where(Beers.name == beer_name))).first()
+    if beer is None:
+        raise BEER_NOT_FOUND
+
+    key = await image_store.save(file.file, Path(file.filename).suffix.lower())
+    # The beer's previous image is removed by the garbage collection once
+    # nothing references it
+    stmt = insert(BeerImages).values(
+        beer_id=beer.id, path=key, content_type=file.content_type
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[col(BeerImages.beer_id)],
+        set_={
+            "path": stmt.excluded.path,
+            "content_type": stmt.excluded.content_type,
+            "last_updated": func.now(),
+        },
+    )
+    await session.exec(stmt)
+    await session.commit()
+    return CreateFileResponse(filename=key)
+
+
+@router.get(
+    "/beers/{beer_id}",
+    response_class=RedirectResponse,
+    responses={307: {"description": "Redirect to the image"}},
+)
+async def read_beer_image(session: SessionDep, beer_id: uuid.UUID) -> str:
+    """Redirect to the image of a beer, which keeps working if it's renamed."""
+    image = await session.get(BeerImages, beer_id)
+    if image is None:
+        raise IMAGE_NOT_FOUND
+    return f"{router.prefix}/{image.path}"
+
+
+@router.get(
+    "/",
+    summary="Image Directory",
+    description=(
+        "Serves static beer pictures. Any beer image file can be accessed via "
+        "/images/{filename}."
+    ),
+)
+async def serve_images() -> None:
+    """
+    Serve static image files.
+
+    Example: /images/ab/cd/abcd...jpg
+    """
+    # This won't be called due to StaticFiles handling the path
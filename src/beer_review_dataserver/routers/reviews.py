@@ -2,15 +2,24 @@
 
 from __future__ import annotations
 
-from typing import Annotated
+import datetime  # noqa: TC003
+import uuid  # noqa: TC003
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends
-from fastapi.exceptions import HTTPException
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import func, text
 from sqlalchemy.orm import selectinload
-from sqlmodel import select
+from sqlmodel import col, select
 
-from beer_review_dataserver.dependencies import SessionDep  # noqa: TC001
+from beer_review_dataserver.config import get_settings
+from beer_review_dataserver.dependencies import SessionDep, review_batcher, review_feed
+from beer_review_dataserver.feed import (
+    FeedFullError,
+    FeedResponse,
+    FeedUnavailableError,
+)
 
 # The following import is necessary to rebuild the model
 # This was the thought to be the best way to avoid circular import issues
@@ -24,22 +33,45 @@ from beer_review_dataserver.models.reviews import (
     ReviewsBase,
     ReviewsPublic,
     ReviewsPublicWithBeers,
+    ReviewsScoreBucket,
+    ReviewsStats,
+    ReviewsTimeBucket,
     ReviewsUpdate,
 )
+from beer_review_dataserver.scores import add_review_score, recompute_beer_scores
 
 from .common import (
     BEER_NOT_FOUND,
+    DUPLICATE_REVIEW,
+    FEED_FULL,
+    FEED_UNAVAILABLE,
     NO_DELETE_ID,
     NO_PATCH_ID,
     REVIEW_NOT_FOUND,
-    fetch_single_record,
+    TotalCount,
+    delete_records,
+    fetch_many_records,
+    filter_clauses,
     oderby_function,
-    patch_record,
+    update_records,
+)
+from .types import (
+    MAX_BATCH_SIZE,
+    BatchResponse,
+    BulkDeleteResponse,
+    BulkUpdateResponse,
+    CommonOptions,
+    DeleteResponse,
+    QueryOptions,
 )
-from .types import CommonOptions, DeleteResponse, QueryOptions
 
 ReviewsPublicWithBeers.model_rebuild()
 
+settings = get_settings()
+
+# Upper bound of the check_score_range constraint on reviews
+MAX_SCORE = 10.0
+
 
 class ReviewOptions(BaseModel):
     """Review specific search options."""
@@ -50,6 +82,24 @@ class ReviewOptions(BaseModel):
     identifier: str | None = None
     beer_name: str | None = None
     beer_id: str | None = None
+    date_from: datetime.datetime | None = None
+    date_to: datetime.datetime | None = None
+    score_min: float | None = None
+    score_max: float | None = None
+
+
+class ReviewStatsOptions(BaseModel):
+    """Options selecting the reviews to aggregate and how to bucket them."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    username: str | None = None
+    beer_name: str | None = None
+    brewery: str | None = None
+    date_from: datetime.datetime | None = None
+    date_to: datetime.datetime | None = None
+    bins: Annotated[int, Query(ge=1, le=100)] = 10
+    period: Literal["day", "week", "month", "year"] = "month"
 
 
 router = APIRouter(
@@ -65,12 +115,11 @@ router = APIRouter(
 @router.post("/")
 async def create_review(review: ReviewsBase, session: SessionDep) -> ReviewsPublic:
     """Create a review from user input and insert into the database."""
+    if review_batcher.running:
+        # Written together with the other reviews submitted at the same time
+        return await review_batcher.submit(review)
     # First check to see if the beer exists in the database
-    find_beer = (
-        select(Beers)
-        .where(Beers.name == review.beer_name)
-        .options(selectinload(Beers.reviews))  # ty: ignore[invalid-argument-type]
-    )
+    find_beer = select(Beers).where(Beers.name == review.beer_name)
     result = await session.exec(find_beer)
     beer = result.first()
     # Raise a BEER NOT FOUND exception
@@ -89,28 +138,15 @@ async def create_review(review: ReviewsBase, session: SessionDep) -> ReviewsPubl
     duplicate_review = await session.exec(check_duplicate_reviews)
 
     if duplicate_review.first() is not None:
-        raise HTTPException(
-            status_code=403, detail="User is attempting to create multiple reviews"
-        )
-    if beer.reviews:
-        num_reviews = len(beer.reviews)
-        avg_score = beer.score
-
-        # calculate the new score by updating the average
-        new_score = (avg_score * num_reviews + review.score) / (num_reviews + 1)
-        review_data = review.model_dump()
-        review_data["beer_id"] = beer.id
-        review_db = Reviews.model_validate(review_data)
-        session.add(review_db)
-        await session.commit()
-        await session.refresh(review_db)
-
-        await patch_record(
-            beer,
-            data=BeersUpdate(score=new_score),
-            session=session,
-            exception=BEER_NOT_FOUND,
-        )
+        raise DUPLICATE_REVIEW
+    review_data = review.model_dump()
+    review_data["beer_id"] = beer.id
+    review_db = Reviews.model_validate(review_data)
+    session.add(review_db)
+    # Add the score to the beer's averages in the same transaction
+    await add_review_score(session, beer.id, review_db.score)
+    await session.commit()
+    await session.refresh(review_db)
     return ReviewsPublic.model_validate(review_db)
 
 
@@ -121,39 +157,41 @@ async def update_review(
     identifier: str | None = None,
 ) -> ReviewsPublic:
     """Patch a review from user input and update the database."""
-    review_db = await fetch_single_record(
-        session, Reviews, NO_PATCH_ID, options=CommonOptions(identifier=identifier)
+    reviews = await update_records(
+        session,
+        Reviews,
+        NO_PATCH_ID,
+        CommonOptions(identifier=identifier),
+        review.model_dump(exclude_unset=True),
     )
-    result = await patch_record(review_db, review, session, REVIEW_NOT_FOUND)
+    if not reviews:
+        raise REVIEW_NOT_FOUND
 
-    # Find the beer if the user changed their score so we can update the average
-    # score when the user changes their mind
-    score = getattr(review, "score", None)
-    beer_name = getattr(review_db, "beer_name", None)
+    # Recalculate the beer's average score when the user changes their mind
+    if review.score is not None:
+        await recompute_beer_scores(session, {reviews[0].beer_id})
+    await session.commit()
+    return ReviewsPublic.model_validate(reviews[0])
 
+
+@router.patch("/bulk")
+async def update_reviews(
+    session: SessionDep,
+    review: ReviewsUpdate,
+    options: Annotated[ReviewOptions, Query()],
+) -> BulkUpdateResponse:
+    """Patch every review matching the filters in a single statement."""
+    reviews = await update_records(
+        session,
+        Reviews,
+        NO_PATCH_ID,
+        options,
+        review.model_dump(exclude_unset=True),
+    )
     if review.score is not None:
-        find_beer = (
-            select(Beers)
-            .where(Beers.name == beer_name)
-            .options(selectinload(Beers.reviews))  # ty: ignore[invalid-argument-type]
-        )
-        result = await session.exec(find_beer)
-        beer = result.first()
-        reviews = getattr(beer, "reviews", None)
-        score = getattr(beer, "score", 0)
-        if reviews is not None and score:
-            num_reviews = len(reviews)
-            avg_score = score
-
-            # calculate the new score by updating the average
-            new_score = (avg_score * num_reviews + review.score) / (num_reviews + 1)
-            await patch_record(
-                beer,
-                data=BeersUpdate(score=new_score),
-                session=session,
-                exception=BEER_NOT_FOUND,
-            )
-    return ReviewsPublic.model_validate(result)
+        await recompute_beer_scores(session, {review.beer_id for review in reviews})
+    await session.commit()
+    return BulkUpdateResponse(ok=True, updated=len(reviews))
 
 
 @router.get("/")
@@ -161,44 +199,185 @@ async def read_reviews(
     session: SessionDep,
     options: Annotated[ReviewOptions, Depends()],
     query: Annotated[QueryOptions, Depends()],
+    total: Annotated[TotalCount, Depends()],
 ) -> list[ReviewsPublicWithBeers]:
-    """Return reviews matching query parameters."""
+    """
+    Return reviews matching query parameters.
+
+    Pass count=true to get the number of matching reviews in X-Total-Count.
+    """
+    clauses = filter_clauses(Reviews, options)
+    await total.add(session, Reviews, clauses)
     stmt = (
         select(Reviews)
+        .where(*clauses)
         .offset(query.offset)
         .limit(query.limit)
         .options(selectinload(Reviews.beer))  # ty: ignore[invalid-argument-type]
     )
-    reviews = await session.exec(stmt)
-    if options.username:
-        stmt = stmt.where(Reviews.username == options.username)
-    if options.identifier:
-        stmt = stmt.where(Reviews.id == options.identifier)
-    if options.beer_name:
-        stmt = stmt.where(Reviews.beer_name == options.beer_name)
-    if options.beer_id:
-        stmt = stmt.where(Reviews.beer_id == options.beer_id)
-
     stmt = oderby_function(stmt, Reviews, query.orderby, query.order)
     reviews = await session.exec(stmt)
     return reviews.all()  # ty: ignore[invalid-return-type]
 
 
+@router.get("/stats")
+async def read_review_stats(
+    session: SessionDep,
+    options: Annotated[ReviewStatsOptions, Query()],
+) -> ReviewsStats:
+    """
+    Return the score histogram and review counts over time.
+
+    Reviews can be narrowed down to a beer, a brewery or a user and a date
+    range. Both aggregations are computed in the database.
+    """
+    clauses = filter_clauses(
+        Reviews,
+        ReviewOptions(
+            username=options.username,
+            beer_name=options.beer_name,
+            date_from=options.date_from,
+            date_to=options.date_to,
+        ),
+    )
+    if options.brewery is not None:
+        clauses.append(
+            col(Reviews.beer_id).in_(
+                select(Beers.id).where(Beers.company == options.brewery)
+            )
+        )
+
+    # Scores are in (0, 10], so clamp the top score into the last bucket rather
+    # than the overflow bucket width_bucket puts it in
+    bucket = func.least(
+        func.width_bucket(Reviews.score, 0.0, MAX_SCORE, options.bins), options.bins
+    ).label("bucket")
+    # Group by the output column names, repeating the expressions would repeat
+    # their bound parameters which postgres doesn't treat as the same expression
+    histogram_stmt = (
+        select(bucket, func.count().label("count"))
+        .where(*clauses)
+        .group_by(text("bucket"))
+        .order_by(text("bucket"))
+    )
+    period = func.date_trunc(options.period, Reviews.date_created).label("period")
+    timeline_stmt = (
+        select(
+            period,
+            func.count().label("count"),
+            func.avg(Reviews.score).label("average_score"),
+        )
+        .where(*clauses)
+        .group_by(text("period"))
+        .order_by(text("period"))
+    )
+
+    width = MAX_SCORE / options.bins
+    histogram = [
+        ReviewsScoreBucket(
+            bucket=number,
+            min_score=(number - 1) * width,
+            max_score=number * width,
+            count=count,
+        )
+        for number, count in (await session.exec(histogram_stmt)).all()
+    ]
+    timeline = [
+        ReviewsTimeBucket(period=start, count=count, average_score=average)
+        for start, count, average in (await session.exec(timeline_stmt)).all()
+    ]
+    total = sum(row.count for row in timeline)
+    average_score = (
+        sum(row.average_score * row.count for row in timeline) / total
+        if total
+        else None
+    )
+    return ReviewsStats(
+        total=total,
+        average_score=average_score,
+        histogram=histogram,
+        timeline=timeline,
+    )
+
+
+@router.get("/batch")
+async def read_reviews_batch(
+    session: SessionDep,
+    ids: Annotated[list[uuid.UUID], Query(max_length=MAX_BATCH_SIZE)],
+) -> BatchResponse[ReviewsPublicWithBeers]:
+    """Return many reviews by id, in the order they were requested."""
+    reviews, missing = await fetch_many_records(
+        session,
+        Reviews,
+        Reviews.beer,  # ty: ignore[invalid-argument-type]
+        ids,
+    )
+    return BatchResponse[ReviewsPublicWithBeers](
+        items=[ReviewsPublicWithBeers.model_validate(review) for review in reviews],
+        missing=missing,
+    )
+
+
 @router.delete("/")
 async def delete_review(
     session: SessionDep,
     identifier: str | None = None,
 ) -> DeleteResponse:
     """Delete a review matching the id of the review."""
-    # Query for the review by the id as a query parameter as the review itself
+    # Delete the review by the id as a query parameter as the review itself
     # has no name field
-    review = await fetch_single_record(
-        session, Reviews, NO_DELETE_ID, options=CommonOptions(identifier=identifier)
+    deleted = await delete_records(
+        session,
+        Reviews,
+        NO_DELETE_ID,
+        CommonOptions(identifier=identifier),
+        Reviews.beer_id,  # ty: ignore[invalid-argument-type]
     )
 
-    if not review:
+    if not deleted:
         raise REVIEW_NOT_FOUND
 
-    await session.delete(review)
+    await recompute_beer_scores(session, {review.beer_id for review in deleted})
     await session.commit()
     return DeleteResponse(ok=True)
+
+
+@router.delete("/bulk")
+async def delete_reviews(
+    session: SessionDep,
+    options: Annotated[ReviewOptions, Query()],
+) -> BulkDeleteResponse:
+    """Delete every review matching the filters and update the beer scores."""
+    deleted = await delete_records(
+        session,
+        Reviews,
+        NO_DELETE_ID,
+        options,
+        Reviews.beer_id,  # ty: ignore[invalid-argument-type]
+    )
+    # Fix up the scores of the affected beers in the same transaction
+    await recompute_beer_scores(session, {review.beer_id for review in deleted})
+    await session.commit()
+    return BulkDeleteResponse(ok=True, deleted=len(deleted))
+
+
+@router.get("/feed", response_class=StreamingResponse)
+async def review_feed_stream(
+    beer_name: str | None = None,
+    username: str | None = None,
+) -> FeedResponse:
+    """
+    Stream new and updated reviews as server sent events.
+
+    Each event carries a ReviewsPublic object as json. Clients that fall too far
+    behind receive an overflow event and should reconnect and refetch, as do
+    all clients if the worker stops receiving review changes. Returns a 503
+    while it isn't receiving them.
+    """
+    try:
+        subscription = review_feed.subscribe(beer_name=beer_name, username=username)
+    except FeedFullError:
+        raise FEED_FULL from None
+    except FeedUnavailableError:
+        raise FEED_UNAVAILABLE from None
+    return FeedResponse(subscription, settings.feed_keepalive)
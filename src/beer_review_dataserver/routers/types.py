@@ -2,11 +2,14 @@
 
 from __future__ import annotations
 
+import uuid  # noqa: TC003
 from typing import Annotated, Literal
 
 from fastapi import Query
 from pydantic import BaseModel, ConfigDict
 
+MAX_BATCH_SIZE = 100
+
 
 class CommonOptions(BaseModel):
     """Common Search based options for routes."""
@@ -32,12 +35,46 @@ class QueryOptions(BaseModel):
     order: Literal["asc", "desc"] = "asc"
 
 
+class BatchOptions(BaseModel):
+    """
+    Batch lookup options for routes.
+
+    Records matching any of the ids or names are returned in the order they
+    were requested.
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    ids: Annotated[list[uuid.UUID], Query(max_length=MAX_BATCH_SIZE)] = []
+    names: Annotated[list[str], Query(max_length=MAX_BATCH_SIZE)] = []
+
+
+class BatchResponse[T](BaseModel):
+    """Return type for batch lookups, with the ids or names that weren't found."""
+
+    items: list[T]
+    missing: list[str]
+
+
 class DeleteResponse(BaseModel):
     """Return type for delete action."""
 
     ok: bool
 
 
+class BulkDeleteResponse(DeleteResponse):
+    """Return type for bulk delete action."""
+
+    deleted: int
+
+
+class BulkUpdateResponse(BaseModel):
+    """Return type for bulk update action."""
+
+    ok: bool
+    updated: int
+
+
 class CreateFileResponse(BaseModel):
     """Return type for delete action."""
 
@@ -0,0 +1,225 @@
+"""Set based recalculation of beer scores from their reviews."""
+
+from __future__ import annotations
+
+import datetime
+import logging
+from typing import TYPE_CHECKING
+
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import col, select
+
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.models.reviews import Reviews
+from beer_review_dataserver.models.scores import ScorePriors
+
+if TYPE_CHECKING:
+    import uuid
+    from collections.abc import Collection, Mapping, Sequence
+    from typing import Any
+
+    from sqlalchemy import ColumnElement
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlalchemy.orm import Mapped
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Running averages accumulate floating point noise, so only differences larger
+# than this count as a correction
+SCORE_TOLERANCE = 1e-6
+
+# The single row of score_priors
+PRIOR_ID = 1
+
+
+def weighted_score(
+    review_count: ColumnElement[int] | Mapped[int],
+    score: ColumnElement[Any] | Mapped[float],
+) -> ColumnElement[float]:
+    """
+    Return the Bayesian average of a beer's score.
+
+    The beer's reviews are averaged together with prior weight reviews scoring
+    the prior mean, the mean of every review. A beer with a handful of reviews
+    stays close to the mean while one with many reviews keeps its own average,
+    so one 10/10 review doesn't outrank hundreds averaging 9. Beers without
+    any reviews have a weighted score of 0, like their score. Evaluates to the
+    plain average until a prior has been stored by refresh_weighted_scores.
+    """
+    prior = col(ScorePriors.id) == PRIOR_ID
+    mean = func.coalesce(
+        select(col(ScorePriors.mean)).where(prior).scalar_subquery(), 0.0
+    )
+    weight = func.coalesce(
+        select(col(ScorePriors.weight)).where(prior).scalar_subquery(), 0.0
+    )
+    return case(
+        (review_count == 0, 0.0),
+        else_=(review_count * score + weight * mean) / (review_count + weight),
+    )
+
+
+async def add_review_score(
+    session: AsyncSession, beer_id: uuid.UUID, score: float
+) -> None:
+    """
+    Add the score of a new review to its beer's average and weighted score.
+
+    Updates the beer in a single statement from its stored review count rather
+    than reading every review, so concurrent reviews of the same beer can't
+    overwrite each other's score. The caller is responsible for committing.
+    """
+    await add_review_scores(session, {beer_id: [score]})
+
+
+async def add_review_scores(
+    session: AsyncSession, scores: Mapping[uuid.UUID, Sequence[float]]
+) -> None:
+    """
+    Add the scores of several new reviews, keyed by beer, to their beers.
+
+    Each beer is updated once with the count and total of all its new scores,
+    see add_review_score. Beers are updated in order of their id so concurrent
+    batches lock them in the same order. The caller is responsible for
+    committing.
+    """
+    for beer_id in sorted(scores):
+        beer_scores = scores[beer_id]
+        review_count = col(Beers.review_count) + len(beer_scores)
+        average = (
+            col(Beers.score) * col(Beers.review_count) + sum(beer_scores)
+        ) / review_count
+        await session.exec(
+            update(Beers)
+            .where(col(Beers.id) == beer_id)
+            .values(
+                score=average,
+                review_count=review_count,
+                weighted_score=weighted_score(review_count, average),
+                last_updated=datetime.datetime.now(datetime.UTC),
+            )
+        )
+
+
+async def recompute_beer_scores(
+    session: AsyncSession, beer_ids: Collection[uuid.UUID]
+) -> list[uuid.UUID]:
+    """
+    Recalculate the scores of the given beers in a single statement.
+
+    :param session: default connection into the database
+    :param beer_ids: The beers to recalculate
+
+    Their average, review count and weighted score are all recalculated. Beers
+    without any reviews go back to a score of 0. The caller is
+    responsible for committing. Returns the ids of the beers whose score
+    changed.
+    """
+    if not beer_ids:
+        return []
+    averages = (
+        select(
+            col(Beers.id).label("beer_id"),
+            func.coalesce(func.avg(Reviews.score), 0.0).label("avg_score"),
+            func.count(col(Reviews.id)).label("review_count"),
+        )
+        .select_from(Beers)
+        .outerjoin(Reviews, col(Reviews.beer_id) == col(Beers.id))
+        .where(col(Beers.id).in_(beer_ids))
+        .group_by(col(Beers.id))
+        .subquery()
+    )
+    stmt = (
+        update(Beers)
+        .where(col(Beers.id) == averages.c.beer_id)
+        .where(
+            or_(
+                func.abs(col(Beers.score) - averages.c.avg_score) > SCORE_TOLERANCE,
+                col(Beers.review_count) != averages.c.review_count,
+            )
+        )
+        .values(
+            score=averages.c.avg_score,
+            review_count=averages.c.review_count,
+            weighted_score=weighted_score(
+                averages.c.review_count, averages.c.avg_score
+            ),
+            last_updated=datetime.datetime.now(datetime.UTC),
+        )
+        .returning(col(Beers.id))
+    )
+    return list((await session.exec(stmt)).scalars())
+
+
+async def reconcile_scores(
+    session_factory: async_sessionmaker[AsyncSession], batch_size: int = 500
+) -> int:
+    """
+    Recalculate the score of every beer from its reviews.
+
+    Beers are processed in batches of batch_size, each committed in its own
+    transaction so row locks are only held briefly. Returns how many beer scores
+    were corrected.
+    """
+    corrected = 0
+    last_id: uuid.UUID | None = None
+    while True:
+        async with session_factory() as session:
+            stmt = select(Beers.id).order_by(col(Beers.id)).limit(batch_size)
+            if last_id is not None:
+                stmt = stmt.where(col(Beers.id) > last_id)
+            beer_ids = list((await session.exec(stmt)).all())
+            if not beer_ids:
+                break
+            corrected += len(await recompute_beer_scores(session, beer_ids))
+            await session.commit()
+        last_id = beer_ids[-1]
+    logger.info("Score reconciliation corrected %d beers", corrected)
+    return corrected
+
+
+async def refresh_weighted_scores(
+    session_factory: async_sessionmaker[AsyncSession], prior_weight: float = 10.0
+) -> int:
+    """
+    Recalculate the prior and the weighted score of every beer.
+
+    The prior mean is the mean of every review, worked out from the stored
+    review count and average of each beer, and every weighted score is then
+    recalculated from them in one statement without reading any reviews. New
+    reviews only update their own beer, so this keeps the others in step as the
+    prior drifts. Returns how many weighted scores changed.
+    """
+    reviewed = func.sum(col(Beers.review_count))
+    mean = select(
+        func.coalesce(
+            func.sum(col(Beers.score) * col(Beers.review_count))
+            / func.nullif(reviewed, 0),
+            0.0,
+        )
+    ).scalar_subquery()
+    prior = insert(ScorePriors).values(id=PRIOR_ID, mean=mean, weight=prior_weight)
+    prior = prior.on_conflict_do_update(
+        index_elements=[col(ScorePriors.id)],
+        set_={
+            "mean": prior.excluded.mean,
+            "weight": prior.excluded.weight,
+            "last_updated": func.now(),
+        },
+    )
+    weighted = weighted_score(col(Beers.review_count), col(Beers.score))
+    async with session_factory() as session:
+        # Nothing caches weighted scores, so other workers needn't be told
+        connection = await session.connection()
+        await connection.exec_driver_sql("SET LOCAL beer_review.notify = 'off'")
+        await session.exec(prior)
+        result = await session.exec(
+            update(Beers)
+            .where(func.abs(col(Beers.weighted_score) - weighted) > SCORE_TOLERANCE)
+            .values(weighted_score=weighted)
+        )
+        await session.commit()
+    logger.info("Refreshed %d weighted beer scores", result.rowcount)
+    return result.rowcount
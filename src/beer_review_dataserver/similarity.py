@@ -0,0 +1,224 @@
+"""Item-item similarity of beers computed from their review scores."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import array
+    from collections.abc import Sequence
+
+    import numpy as np
+    from scipy import sparse
+
+# Beers whose similarities are computed at once. Each block is a dense
+# BLOCK_SIZE x beers array, so this bounds the memory a rebuild needs.
+BLOCK_SIZE = 256
+
+
+@dataclass(frozen=True)
+class SimilarityOptions:
+    """
+    How neighbours are chosen.
+
+    :param neighbours: Most similar beers kept per beer
+    :param min_overlap: Users that must have reviewed both beers for them to be
+        similar at all
+    :param shrinkage: Damps the similarity of beers few users reviewed both
+        of, a pair reviewed by shrinkage users keeps half its similarity
+    """
+
+    neighbours: int = 20
+    min_overlap: int = 3
+    shrinkage: float = 10.0
+
+
+@dataclass(frozen=True)
+class Ratings:
+    """Review scores with their username and beer as integer codes."""
+
+    users: array.array
+    beers: array.array
+    scores: array.array
+    beer_count: int
+
+
+@dataclass(frozen=True)
+class Neighbours:
+    """The most similar beers of every beer, best first and padded with -1."""
+
+    indices: np.ndarray
+    scores: np.ndarray
+
+
+@dataclass(frozen=True)
+class PreviousNeighbours:
+    """
+    Neighbours from an earlier build to update rather than recompute.
+
+    :param neighbours: The earlier neighbours
+    :param positions: The code each earlier beer code has now, -1 if deleted
+    :param changed: Codes of the beers whose reviews changed since
+    """
+
+    neighbours: Neighbours
+    positions: Sequence[int]
+    changed: Sequence[int]
+
+
+def score_matrices(ratings: Ratings) -> tuple[sparse.csr_array, sparse.csr_array]:
+    """
+    Build the user x beer matrices the similarities are computed from.
+
+    Returns the scores centred on each user's mean score, so a beer a user
+    scored above their usual counts as liked, with each beer's column scaled to
+    unit length so the dot product of two columns is their cosine similarity.
+    Along with a matrix of ones marking who reviewed which beer.
+    """
+    import numpy as np  # noqa: PLC0415
+    from scipy import sparse  # noqa: PLC0415
+
+    beer_count = ratings.beer_count
+    users = np.asarray(ratings.users, dtype=np.int64)
+    beers = np.asarray(ratings.beers, dtype=np.int64)
+    scores = np.asarray(ratings.scores, dtype=np.float64)
+    user_count = int(users.max()) + 1 if users.size else 0
+
+    # A user reviewing a beer more than once counts with their mean score
+    pairs, inverse = np.unique(users * beer_count + beers, return_inverse=True)
+    pair_scores = np.bincount(inverse, weights=scores) / np.bincount(inverse)
+    users, beers = np.divmod(pairs, beer_count)
+
+    user_means = np.bincount(
+        users, weights=pair_scores, minlength=user_count
+    ) / np.maximum(np.bincount(users, minlength=user_count), 1)
+    centred = pair_scores - user_means[users]
+    norms = np.sqrt(np.bincount(beers, weights=centred**2, minlength=beer_count))
+    values = np.divide(
+        centred, norms[beers], out=np.zeros_like(centred), where=norms[beers] > 0
+    )
+
+    shape = (user_count, beer_count)
+    normalised = sparse.csr_array(
+        (values.astype(np.float32), (users, beers)), shape=shape
+    )
+    reviewed = sparse.csr_array(
+        (np.ones(len(users), dtype=np.float32), (users, beers)), shape=shape
+    )
+    return normalised, reviewed
+
+
+def top_neighbours(
+    normalised: sparse.csr_array,
+    reviewed: sparse.csr_array,
+    rows: np.ndarray,
+    options: SimilarityOptions,
+) -> Neighbours:
+    """Return the neighbours of the beers with the codes in rows."""
+    import numpy as np  # noqa: PLC0415
+
+    beer_count = normalised.shape[1]
+    indices = np.full((len(rows), options.neighbours), -1, dtype=np.int32)
+    scores = np.zeros((len(rows), options.neighbours), dtype=np.float32)
+    # A beer isn't its own neighbour
+    width = min(options.neighbours, beer_count - 1)
+    if width <= 0:
+        return Neighbours(indices=indices, scores=scores)
+
+    by_beer = normalised.T.tocsr()
+    reviewed_by_beer = reviewed.T.tocsr()
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start : start + BLOCK_SIZE]
+        similarity = (by_beer[block] @ normalised).toarray()
+        overlap = (reviewed_by_beer[block] @ reviewed).toarray()
+        similarity *= np.divide(
+            overlap,
+            overlap + options.shrinkage,
+            out=np.zeros_like(overlap),
+            where=overlap > 0,
+        )
+        similarity[overlap < options.min_overlap] = 0
+        similarity[np.arange(len(block)), block] = 0
+
+        top = np.argpartition(-similarity, width - 1, axis=1)[:, :width]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        # Only beers liked by the same users count as neighbours
+        unrelated = top_scores <= 0
+        top[unrelated] = -1
+        top_scores[unrelated] = 0
+
+        indices[start : start + len(block), :width] = top
+        scores[start : start + len(block), :width] = top_scores
+    return Neighbours(indices=indices, scores=scores)
+
+
+def build_neighbours(
+    ratings: Ratings,
+    options: SimilarityOptions,
+    previous: PreviousNeighbours | None = None,
+) -> Neighbours:
+    """
+    Compute the neighbours of every beer.
+
+    Given the previous neighbours only the beers that could have been affected
+    by the changes are recomputed: the changed beers, the beers that had one of
+    them, or a deleted beer, as a neighbour, and the beers sharing a user with
+    any beer reviewed by the changed beers' users, whose similarities moved
+    with those users' mean scores. Everything is recomputed when that's most of
+    the beers.
+
+    Deleted reviews also move the mean score of their users, which slightly
+    shifts the similarities of the other beers they reviewed. Updates can't see
+    those users any more, so a full build should still be done from time to
+    time.
+    """
+    import numpy as np  # noqa: PLC0415
+
+    beer_count = ratings.beer_count
+    if not beer_count:
+        return Neighbours(
+            indices=np.zeros((0, options.neighbours), dtype=np.int32),
+            scores=np.zeros((0, options.neighbours), dtype=np.float32),
+        )
+    normalised, reviewed = score_matrices(ratings)
+    if previous is None:
+        return top_neighbours(normalised, reviewed, np.arange(beer_count), options)
+
+    positions = np.asarray(previous.positions, dtype=np.int64)
+    kept = positions >= 0
+    old_indices = previous.neighbours.indices
+    moved = np.where(old_indices >= 0, positions[old_indices], -1)
+    width = min(old_indices.shape[1], options.neighbours)
+
+    indices = np.full((beer_count, options.neighbours), -1, dtype=np.int32)
+    scores = np.zeros((beer_count, options.neighbours), dtype=np.float32)
+    indices[positions[kept], :width] = moved[kept, :width]
+    scores[positions[kept], :width] = previous.neighbours.scores[kept, :width]
+
+    # New beers and beers that had a deleted beer as a neighbour
+    stale = np.ones(beer_count, dtype=bool)
+    stale[positions[kept]] = False
+    lost = ((old_indices >= 0) & (moved < 0)).any(axis=1)
+    stale[positions[kept & lost]] = True
+
+    changed = np.asarray(previous.changed, dtype=np.int64)
+    if changed.size:
+        stale[changed] = True
+        by_beer = reviewed.tocsc()
+        users = np.unique(by_beer[:, changed].indices)
+        affected = np.unique(reviewed[users].indices)
+        users = np.unique(by_beer[:, affected].indices)
+        stale[reviewed[users].indices] = True
+        stale |= np.isin(indices, changed).any(axis=1)
+
+    rows = np.flatnonzero(stale)
+    if len(rows) > beer_count // 2:
+        return top_neighbours(normalised, reviewed, np.arange(beer_count), options)
+    updated = top_neighbours(normalised, reviewed, rows, options)
+    indices[rows] = updated.indices
+    scores[rows] = updated.scores
+    return Neighbours(indices=indices, scores=scores)
@@ -0,0 +1,60 @@
+"""Background tasks run by each worker alongside the app."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """Keep track of the tasks started from lifespan so they can be stopped."""
+
+    def __init__(self) -> None:
+        """Create an empty set of tasks."""
+        self._tasks: set[asyncio.Task] = set()
+
+    def run_periodically(
+        self, interval: float, func: Callable[[], Awaitable[Any]], name: str
+    ) -> None:
+        """Await func every interval seconds until stopped."""
+        task = asyncio.create_task(_periodic(interval, func, name), name=name)
+        self._tasks.add(task)
+
+    def run(self, func: Callable[[], Awaitable[Any]], name: str) -> None:
+        """Await func once in the background."""
+        task = asyncio.create_task(_once(func, name), name=name)
+        self._tasks.add(task)
+
+    async def stop(self) -> None:
+        """Cancel every task and wait for them to finish."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks.clear()
+
+
+async def _once(func: Callable[[], Awaitable[Any]], name: str) -> None:
+    try:
+        await func()
+    except Exception:
+        logger.exception("Background task %s failed", name)
+
+
+async def _periodic(
+    interval: float, func: Callable[[], Awaitable[Any]], name: str
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await func()
+        except Exception:
+            logger.exception("Background task %s failed", name)
@@ -0,0 +1,106 @@
+"""Warming up a worker's connection pool before it receives traffic."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy.pool import QueuePool
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, async_sessionmaker
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from .routers.batch import AnySubQuery
+
+logger = logging.getLogger(__name__)
+
+# The read queries run on every warmed connection, as batch sub-queries with
+# their default parameters so the statements are the ones the routes send
+WARMUP_QUERIES: dict[str, dict[str, Any]] = {
+    "beers": {"route": "/beers/"},
+    "list-beers": {"route": "/beers/list-beers"},
+    "breweries": {"route": "/breweries/"},
+    "brewery-summaries": {"route": "/breweries/summary"},
+    "reviews": {"route": "/reviews/"},
+}
+
+# Seconds to wait before trying again when the database can't be reached
+RETRY_DELAY = 5.0
+
+
+@dataclass
+class Readiness:
+    """Whether the worker has warmed up and should be sent traffic."""
+
+    ready: bool = False
+    warmed_connections: int = 0
+
+
+def pool_status(engine: AsyncEngine) -> dict[str, int]:
+    """Return the size and usage of the engine's connection pool."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+async def _prime(
+    session_factory: async_sessionmaker[AsyncSession],
+    connection: AsyncConnection,
+    queries: list[AnySubQuery],
+) -> None:
+    """Run the warm-up queries on one connection."""
+    async with session_factory(bind=connection) as session:
+        for query in queries:
+            await query.run(session)
+
+
+async def warm_up(
+    engine: AsyncEngine,
+    session_factory: async_sessionmaker[AsyncSession],
+    readiness: Readiness,
+    connections: int,
+) -> None:
+    """
+    Open pooled connections and run the hot read queries on each of them.
+
+    Opening the connections up front pays for connecting and asyncpg's type
+    introspection, and running the queries prepares their statements on every
+    connection and fills SQLAlchemy's compiled statement cache. The connections
+    go back to the pool afterwards and the worker is marked ready. Retries every
+    RETRY_DELAY seconds until the database can be reached.
+    """
+    # The routers import this package's dependencies
+    from .routers.batch import BatchRequest  # noqa: PLC0415
+
+    batch = BatchRequest.model_validate({"queries": WARMUP_QUERIES})
+    queries = list(batch.queries.values())
+    while True:
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                opened = await asyncio.gather(
+                    *(
+                        stack.enter_async_context(engine.connect())
+                        for _ in range(connections)
+                    )
+                )
+                await asyncio.gather(
+                    *(_prime(session_factory, c, queries) for c in opened)
+                )
+        except Exception:
+            logger.exception("Warming up failed, retrying in %.0fs", RETRY_DELAY)
+            await asyncio.sleep(RETRY_DELAY)
+            continue
+        break
+    readiness.warmed_connections = connections
+    readiness.ready = True
+    logger.info("Warmed up %d connections", connections)
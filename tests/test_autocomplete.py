@@ -0,0 +1,107 @@
+"""Tests of the in-memory name index behind autocomplete."""
+
+import asyncio
+from collections.abc import Callable
+from typing import Any
+
+from sqlmodel import col
+
+from beer_review_dataserver.autocomplete import NameIndex
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.notifications import CONNECTED, ChangeEvent
+
+ROWS = [
+    ("1", "Pale Ale", 3.5),
+    ("2", "pacific ale", 4.5),
+    ("3", "Pilsner", 4.0),
+    ("4", "Pale Lager", 3.5),
+    ("5", "Porter", 5.0),
+]
+
+
+class FakeResult:
+    """The result of a query, as much of it as the index uses."""
+
+    def __init__(self, rows: list[tuple[str, str, float]]) -> None:
+        """Hold the rows."""
+        self.rows = rows
+
+    def all(self) -> list[tuple[str, str, float]]:
+        """Return every row."""
+        return self.rows
+
+
+class FakeSession:
+    """Return the rows to any query, running during while it's in flight."""
+
+    def __init__(
+        self,
+        rows: list[tuple[str, str, float]],
+        during: Callable[[], None] | None = None,
+    ) -> None:
+        """Hold the rows and the callback."""
+        self.rows = rows
+        self.during = during
+
+    async def exec(self, _stmt: Any) -> FakeResult:  # noqa: ANN401
+        """Run the callback and return the rows."""
+        if self.during is not None:
+            self.during()
+        return FakeResult(self.rows)
+
+
+def event(op: str, identifier: str, name: str, score: float = 0) -> ChangeEvent:
+    """Return a change to a beer."""
+    return ChangeEvent(
+        table="beers", op=op, identifier=identifier, name=name, score=score
+    )
+
+
+def loaded_index(during: Callable[[NameIndex], None] | None = None) -> NameIndex:
+    """Return an enabled index loaded with ROWS."""
+    index = NameIndex(Beers, score=col(Beers.score))
+    index.handle_change(ChangeEvent(table="beers", op=CONNECTED))
+    session = FakeSession(ROWS, None if during is None else lambda: during(index))
+    asyncio.run(index.load(session))
+    return index
+
+
+def search(index: NameIndex, prefix: str, limit: int = 10) -> list[str]:
+    """Search a loaded index, which doesn't touch the session."""
+    return asyncio.run(index.search(None, prefix, limit))
+
+
+def test_best_scoring_matches_ignoring_case() -> None:
+    """Matches are ranked by score, ties in name order."""
+    index = loaded_index()
+    assert search(index, "PA") == ["pacific ale", "Pale Ale", "Pale Lager"]
+    assert search(index, "pa", limit=2) == ["pacific ale", "Pale Ale"]
+    assert search(index, "p", limit=3) == ["Porter", "pacific ale", "Pilsner"]
+    assert search(index, "stout") == []
+
+
+def test_updated_in_place() -> None:
+    """Inserts, renames and deletes are applied without reloading."""
+    index = loaded_index()
+    index.handle_change(event("INSERT", "6", "Pale Stout", 4.8))
+    index.handle_change(event("UPDATE", "1", "Amber Ale", 3.5))
+    index.handle_change(event("DELETE", "2", "pacific ale"))
+    assert search(index, "pa") == ["Pale Stout", "Pale Lager"]
+    assert search(index, "amber") == ["Amber Ale"]
+
+
+def test_changes_during_load_are_replayed() -> None:
+    """A change arriving while the names are read isn't lost."""
+    index = loaded_index(
+        lambda index: index.handle_change(event("INSERT", "6", "Pale Stout", 4.8))
+    )
+    assert index.loaded
+    assert search(index, "pale") == ["Pale Stout", "Pale Ale", "Pale Lager"]
+
+
+def test_load_overlapping_a_clear_is_discarded() -> None:
+    """Rows read before the index was cleared may already be stale."""
+    index = loaded_index(
+        lambda index: index.handle_change(ChangeEvent(table="beers", op="TRUNCATE"))
+    )
+    assert not index.loaded
@@ -0,0 +1,81 @@
+"""Tests of running the sub-queries of a batch."""
+
+import asyncio
+from typing import Any, Self
+
+import pytest
+
+from beer_review_dataserver.routers import batch
+
+
+class FakeQuery:
+    """A sub-query that takes a while, tracking how many run at once."""
+
+    route = "/beers/"
+    running = 0
+    most_running = 0
+
+    def __init__(self, error: Exception | None = None) -> None:
+        """Fail with error, if given, rather than return."""
+        self.error = error
+        self.cancelled = False
+
+    async def run(self, _session: Any) -> str:  # noqa: ANN401
+        """Run the query."""
+        FakeQuery.running += 1
+        FakeQuery.most_running = max(FakeQuery.most_running, FakeQuery.running)
+        try:
+            await asyncio.sleep(0.01 if self.error else 0.05)
+            if self.error:
+                raise self.error
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            FakeQuery.running -= 1
+        return "ok"
+
+
+class FakeSession:
+    """A session that's never used by the fake queries."""
+
+    async def __aenter__(self) -> Self:
+        """Open the session."""
+        return self
+
+    async def __aexit__(self, *_exc_info: object) -> None:
+        """Close the session."""
+
+
+@pytest.fixture(autouse=True)
+def fake_sessions(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Give sub-queries fake sessions, at most 2 at a time."""
+    monkeypatch.setattr(batch, "async_session", FakeSession)
+    monkeypatch.setattr(batch, "apply_statement_timeout", lambda *_args: None)
+    monkeypatch.setattr(batch, "batch_connections", asyncio.Semaphore(2))
+    FakeQuery.most_running = 0
+
+
+def test_sub_queries_share_the_connection_limit() -> None:
+    """Concurrent batches never hold more connections than the limit."""
+    request = batch.BatchRequest.model_construct(
+        queries={str(i): FakeQuery() for i in range(5)}
+    )
+
+    async def main() -> list[dict]:
+        return await asyncio.gather(batch.run_batch(request), batch.run_batch(request))
+
+    for results in asyncio.run(main()):
+        assert {result.body for result in results.values()} == {"ok"}
+    assert FakeQuery.most_running == 2
+
+
+def test_database_error_cancels_the_rest() -> None:
+    """A failing sub-query doesn't leave its siblings running."""
+    slow = FakeQuery()
+    request = batch.BatchRequest.model_construct(
+        queries={"slow": slow, "failing": FakeQuery(RuntimeError("broken"))}
+    )
+    with pytest.raises(RuntimeError, match="broken"):
+        asyncio.run(batch.run_batch(request))
+    assert slow.cancelled
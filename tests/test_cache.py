@@ -0,0 +1,150 @@
+"""Tests of the caches kept consistent by change notifications."""
+
+from beer_review_dataserver.cache import (
+    MISSING,
+    ListingCache,
+    LookupCache,
+    listing_columns,
+)
+from beer_review_dataserver.notifications import CONNECTED, DISCONNECTED, ChangeEvent
+
+
+def connected[T: LookupCache](cache: T) -> T:
+    """Enable a cache as the change listener does when it connects."""
+    cache.handle_change(ChangeEvent(table="breweries", op=CONNECTED))
+    return cache
+
+
+def test_stores_nothing_until_connected() -> None:
+    """Without the listener there's no way to know when an entry goes stale."""
+    cache = LookupCache("breweries")
+    cache.set("Moon Dog", 1, cache.version)
+    assert cache.get("Moon Dog") is MISSING
+
+    connected(cache)
+    cache.set("Moon Dog", 1, cache.version)
+    assert cache.get("Moon Dog") == 1
+
+
+def test_disconnecting_clears_and_disables() -> None:
+    """Entries may miss changes made while disconnected, so they're dropped."""
+    cache = connected(LookupCache("breweries"))
+    cache.set("Moon Dog", 1, cache.version)
+    cache.handle_change(ChangeEvent(table="breweries", op=DISCONNECTED))
+    assert cache.get("Moon Dog") is MISSING
+    cache.set("Moon Dog", 1, cache.version)
+    assert cache.get("Moon Dog") is MISSING
+
+    # Reconnecting starts empty
+    connected(cache)
+    assert cache.get("Moon Dog") is MISSING
+
+
+def test_change_evicts_id_and_name() -> None:
+    """A change to a record evicts it under both of its keys."""
+    cache = connected(LookupCache("breweries"))
+    cache.set("Moon Dog", 1, cache.version)
+    cache.set("1", "Moon Dog", cache.version)
+    cache.set("Bodriggy", 2, cache.version)
+    cache.handle_change(
+        ChangeEvent(table="breweries", op="UPDATE", identifier="1", name="Moon Dog")
+    )
+    assert cache.get("Moon Dog") is MISSING
+    assert cache.get("1") is MISSING
+    assert cache.get("Bodriggy") == 2
+
+
+def test_value_loaded_before_a_change_is_ignored() -> None:
+    """A value loaded while its record changed would otherwise be cached stale."""
+    cache = connected(LookupCache("breweries"))
+    version = cache.version
+    cache.handle_change(
+        ChangeEvent(table="breweries", op="UPDATE", identifier="1", name="Moon Dog")
+    )
+    cache.set("Moon Dog", 1, version)
+    assert cache.get("Moon Dog") is MISSING
+
+
+def test_least_recently_used_is_dropped() -> None:
+    """Reading an entry keeps it over ones read less recently."""
+    cache = connected(LookupCache("breweries", maxsize=2))
+    cache.set("a", 1, cache.version)
+    cache.set("b", 2, cache.version)
+    cache.get("a")
+    cache.set("c", 3, cache.version)
+    assert cache.get("a") == 1
+    assert cache.get("b") is MISSING
+    assert cache.get("c") == 3
+
+
+def listings() -> ListingCache:
+    """Return a connected cache of beer name listings."""
+    return connected(ListingCache("beers", columns=listing_columns))
+
+
+def test_listing_cleared_by_inserts_and_deletes() -> None:
+    """A listing can hold any record, so inserts and deletes clear the cache."""
+    cache = listings()
+    for op in ("INSERT", "DELETE"):
+        cache.get((0, 10, None, "asc"))
+        cache.set((0, 10, None, "asc"), ["Pacific Ale"], cache.version)
+        cache.handle_change(
+            ChangeEvent(table="beers", op=op, identifier="2", name="Lager")
+        )
+        assert cache.get((0, 10, None, "asc")) is MISSING
+
+
+def test_listing_kept_by_updates_to_other_columns() -> None:
+    """A new review's score update only drops the listings ordered by score."""
+    cache = listings()
+    by_name = (0, 10, "name", "asc")
+    by_score = (0, 10, "score", "desc")
+    for key in (by_name, by_score):
+        cache.get(key)
+        cache.set(key, ["Pacific Ale"], cache.version)
+    cache.handle_change(
+        ChangeEvent(
+            table="beers",
+            op="UPDATE",
+            identifier="2",
+            name="Lager",
+            changed=frozenset({"score", "weighted_score"}),
+        )
+    )
+    assert cache.get(by_name) == ["Pacific Ale"]
+    assert cache.get(by_score) is MISSING
+
+    cache.handle_change(
+        ChangeEvent(
+            table="beers",
+            op="UPDATE",
+            identifier="2",
+            name="Pilsner",
+            changed=frozenset({"name"}),
+        )
+    )
+    assert cache.get(by_name) is MISSING
+
+
+def test_listing_loaded_during_an_update_is_ignored() -> None:
+    """A key is watched from its miss, before its value has been loaded."""
+    cache = listings()
+    by_score = (0, 10, "score", "desc")
+    cache.get(by_score)
+    version = cache.version
+    cache.handle_change(
+        ChangeEvent(
+            table="beers", op="UPDATE", identifier="2", changed=frozenset({"score"})
+        )
+    )
+    cache.set(by_score, ["Pacific Ale"], version)
+    assert cache.get(by_score) is MISSING
+
+
+def test_listing_cleared_by_updates_of_unknown_columns() -> None:
+    """Notifications from before changed columns were sent clear the cache."""
+    cache = listings()
+    cache.get((0, 10, None, "asc"))
+    cache.set((0, 10, None, "asc"), ["Pacific Ale"], cache.version)
+    cache.handle_change(ChangeEvent(table="beers", op="UPDATE", identifier="2"))
+    assert cache.get((0, 10, None, "asc")) is MISSING
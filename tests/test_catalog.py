@@ -0,0 +1,47 @@
+"""Tests of the in-memory catalog snapshot."""
+
+from beer_review_dataserver.catalog import CatalogSnapshot
+from beer_review_dataserver.notifications import CONNECTED, ChangeEvent
+
+
+def connected_snapshot() -> CatalogSnapshot:
+    """Return a snapshot whose change listener is connected, not yet stale."""
+    snapshot = CatalogSnapshot(None, rebuild_delay=0)
+    snapshot.handle_change(ChangeEvent(table="beers", op=CONNECTED))
+    snapshot._stale.clear()  # noqa: SLF001
+    return snapshot
+
+
+def is_stale(snapshot: CatalogSnapshot) -> bool:
+    """Return whether a rebuild is due."""
+    return snapshot._stale.is_set()  # noqa: SLF001
+
+
+def test_score_updates_are_ignored() -> None:
+    """Every review updates its beer's score, which isn't in the catalog."""
+    snapshot = connected_snapshot()
+    snapshot.handle_change(
+        ChangeEvent(
+            table="beers",
+            op="UPDATE",
+            identifier="1",
+            name="Pale Ale",
+            changed=frozenset({"score", "review_count", "weighted_score"}),
+        )
+    )
+    assert not is_stale(snapshot)
+
+
+def test_catalog_changes_mark_it_stale() -> None:
+    """Renames, new companies, inserts and deletes are rebuilt."""
+    changes = [
+        ChangeEvent(table="beers", op="UPDATE", changed=frozenset({"name"})),
+        ChangeEvent(table="beers", op="UPDATE", changed=frozenset({"company"})),
+        ChangeEvent(table="beers", op="UPDATE"),
+        ChangeEvent(table="breweries", op="INSERT", identifier="2", name="Moon Dog"),
+        ChangeEvent(table="beers", op="DELETE", identifier="1", name="Pale Ale"),
+    ]
+    for change in changes:
+        snapshot = connected_snapshot()
+        snapshot.handle_change(change)
+        assert is_stale(snapshot), change
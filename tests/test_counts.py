@@ -0,0 +1,101 @@
+"""Tests of counting the records matching a query, exactly or estimated."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Self
+
+from sqlalchemy.dialects.postgresql.asyncpg import dialect
+from sqlmodel import col
+
+# Beers' relationships need the other models mapped
+from beer_review_dataserver.models import breweries, reviews  # noqa: F401
+from beer_review_dataserver.models.beers import Beers
+from beer_review_dataserver.routers.common import MAX_EXACT_COUNT, count_records
+
+
+class FakeSession:
+    """Answer the table estimate, the capped count and EXPLAIN."""
+
+    def __init__(self, table_rows: int, matching: int, planned: int = 0) -> None:
+        """Set the table's estimated rows, the matching rows and the plan's."""
+        self.table_rows = table_rows
+        self.matching = matching
+        self.planned = planned
+        self.dialect = dialect()
+        self.statements: list[str] = []
+        self.value: Any = None
+
+    async def connection(self) -> Self:
+        """Return the session's connection."""
+        return self
+
+    async def execute(self, stmt: Any, _params: Any) -> Self:  # noqa: ANN401
+        """Run the table estimate."""
+        self.statements.append(str(stmt))
+        self.value = self.table_rows
+        return self
+
+    async def exec(self, stmt: Any) -> Self:  # noqa: ANN401
+        """Run the capped count."""
+        compiled = stmt.compile(
+            dialect=self.dialect, compile_kwargs={"literal_binds": True}
+        )
+        self.statements.append(str(compiled))
+        self.value = min(self.matching, MAX_EXACT_COUNT + 1)
+        return self
+
+    async def exec_driver_sql(self, statement: str, _params: Any) -> Self:  # noqa: ANN401
+        """Run EXPLAIN, returning the plan as postgres does."""
+        self.statements.append(statement)
+        self.value = json.dumps([{"Plan": {"Plan Rows": self.planned}}])
+        return self
+
+    def one(self) -> Any:  # noqa: ANN401
+        """Return the single row of the last statement."""
+        return self.value
+
+    scalar_one = one
+
+
+def count(session: FakeSession, *, filtered: bool) -> tuple[int, bool]:
+    """Count the beers, those named Pale Ale when filtered."""
+    clauses = [col(Beers.name) == "Pale Ale"] if filtered else []
+    return asyncio.run(count_records(session, Beers, clauses))
+
+
+def test_large_unfiltered_count_is_the_table_estimate() -> None:
+    """Counting every row of a large table doesn't scan it."""
+    session = FakeSession(table_rows=5_000_000, matching=5_000_000)
+    assert count(session, filtered=False) == (5_000_000, False)
+    assert len(session.statements) == 1
+
+
+def test_small_table_is_counted_exactly() -> None:
+    """The table estimate may be stale, so small tables are counted."""
+    session = FakeSession(table_rows=100, matching=120)
+    assert count(session, filtered=False) == (120, True)
+
+
+def test_count_under_the_cap_is_exact() -> None:
+    """Filtered counts read at most one row more than the cap."""
+    session = FakeSession(table_rows=5_000_000, matching=MAX_EXACT_COUNT)
+    assert count(session, filtered=True) == (MAX_EXACT_COUNT, True)
+    assert f"LIMIT {MAX_EXACT_COUNT + 1}" in session.statements[0]
+
+
+def test_count_over_the_cap_is_the_planner_estimate() -> None:
+    """Filtered counts over the cap are estimated by the planner."""
+    session = FakeSession(
+        table_rows=5_000_000, matching=50_000, planned=MAX_EXACT_COUNT * 3
+    )
+    assert count(session, filtered=True) == (MAX_EXACT_COUNT * 3, False)
+    assert session.statements[-1].startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert "'Pale Ale'" in session.statements[-1]
+
+
+def test_estimate_is_at_least_the_rows_counted() -> None:
+    """A planner estimate under the cap can't be lower than the rows seen."""
+    session = FakeSession(table_rows=5_000_000, matching=50_000, planned=10)
+    assert count(session, filtered=True) == (MAX_EXACT_COUNT + 1, False)
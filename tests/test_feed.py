@@ -0,0 +1,147 @@
+"""Tests of fanning review changes out to the feed's subscribers."""
+
+import asyncio
+import datetime
+import uuid
+from typing import Any, Self
+
+import pytest
+
+from beer_review_dataserver.feed import (
+    FeedFullError,
+    FeedResponse,
+    FeedUnavailableError,
+    ReviewFeed,
+)
+from beer_review_dataserver.models.reviews import ReviewsPublic
+from beer_review_dataserver.notifications import CONNECTED, DISCONNECTED, ChangeEvent
+
+NOW = datetime.datetime(2026, 10, 1, tzinfo=datetime.UTC)
+
+
+def review(username: str, beer_name: str) -> ReviewsPublic:
+    """Return a review of a beer."""
+    return ReviewsPublic(
+        id=uuid.uuid4(),
+        username=username,
+        score=4.0,
+        beer_name=beer_name,
+        beer_id=uuid.uuid4(),
+        last_updated=NOW,
+        date_created=NOW,
+    )
+
+
+class FakeSession:
+    """Return the reviews to any query."""
+
+    def __init__(self, reviews: list[ReviewsPublic]) -> None:
+        """Hold the reviews."""
+        self.reviews = reviews
+
+    async def __aenter__(self) -> Self:
+        """Open the session."""
+        return self
+
+    async def __aexit__(self, *_exc_info: object) -> None:
+        """Close the session."""
+
+    async def exec(self, _stmt: Any) -> Self:  # noqa: ANN401
+        """Run a query."""
+        return self
+
+    def all(self) -> list[ReviewsPublic]:
+        """Return every row."""
+        return self.reviews
+
+
+def connected_feed(
+    reviews: list[ReviewsPublic] | None = None,
+    max_connections: int = 10,
+    queue_size: int = 4,
+) -> ReviewFeed:
+    """Return a feed whose change listener is connected."""
+    feed = ReviewFeed(
+        lambda: FakeSession(reviews or []),
+        max_connections=max_connections,
+        queue_size=queue_size,
+    )
+    feed.handle_change(ChangeEvent(table="reviews", op=CONNECTED))
+    return feed
+
+
+def test_unavailable_until_connected() -> None:
+    """Without the listener no reviews would be published."""
+    feed = ReviewFeed(None, max_connections=10, queue_size=4)
+    with pytest.raises(FeedUnavailableError):
+        feed.subscribe()
+
+
+def test_connection_limit() -> None:
+    """Subscribing takes a slot straight away, unsubscribing gives it back."""
+    feed = connected_feed(max_connections=2)
+    first = feed.subscribe()
+    feed.subscribe()
+    with pytest.raises(FeedFullError):
+        feed.subscribe()
+    feed.unsubscribe(first)
+    feed.subscribe()
+
+
+def test_response_gives_back_its_slot_when_never_streamed() -> None:
+    """A client gone before the response starts doesn't keep its slot."""
+    feed = connected_feed(max_connections=1)
+    response = FeedResponse(feed.subscribe(), keepalive=15.0)
+
+    async def receive() -> dict:
+        return {"type": "http.disconnect"}
+
+    async def send(_message: dict) -> None:
+        raise OSError
+
+    with pytest.raises(OSError):  # noqa: PT011
+        asyncio.run(response({"type": "http"}, receive, send))
+    assert feed.connections == 0
+
+
+def test_fan_out_to_matching_subscribers() -> None:
+    """Each subscriber gets the reviews matching its filters."""
+    reviews = [review("alice", "Pale Ale"), review("bob", "Porter")]
+    feed = connected_feed(reviews)
+    everything = feed.subscribe()
+    pale_ale = feed.subscribe(beer_name="Pale Ale")
+    bob = feed.subscribe(username="bob")
+
+    asyncio.run(feed._publish({r.id for r in reviews}))  # noqa: SLF001
+
+    assert everything.queue.qsize() == 2
+    assert pale_ale.queue.get_nowait()[0] == str(reviews[0].id)
+    assert pale_ale.queue.empty()
+    assert bob.queue.get_nowait()[0] == str(reviews[1].id)
+    assert bob.queue.empty()
+
+
+def test_slow_subscriber_overflows() -> None:
+    """A full queue ends the client's stream rather than holding up the rest."""
+    reviews = [review("alice", "Pale Ale") for _ in range(3)]
+    feed = connected_feed(reviews, queue_size=2)
+    slow = feed.subscribe()
+
+    asyncio.run(feed._publish({r.id for r in reviews}))  # noqa: SLF001
+
+    assert slow.overflowed
+
+    async def events() -> list[str]:
+        return [event async for event in slow.stream(keepalive=15.0)]
+
+    assert asyncio.run(events()) == ["event: overflow\ndata: {}\n\n"]
+
+
+def test_disconnecting_overflows_everyone() -> None:
+    """Reviews made while disconnected would be missed, so clients reconnect."""
+    feed = connected_feed()
+    subscription = feed.subscribe()
+    feed.handle_change(ChangeEvent(table="reviews", op=DISCONNECTED))
+    assert subscription.overflowed
+    with pytest.raises(FeedUnavailableError):
+        feed.subscribe()
@@ -0,0 +1,68 @@
+"""Tests of writing reviews in batches."""
+
+import asyncio
+
+import pytest
+
+from beer_review_dataserver import group_commit
+from beer_review_dataserver.group_commit import PendingReview, ReviewBatcher
+from beer_review_dataserver.routers.common import QUERY_TIMEOUT
+
+
+class SlowBatcher(ReviewBatcher):
+    """Batcher whose commits take a while and fail for more than one review."""
+
+    fail = False
+
+    def __init__(self) -> None:
+        """Batch reviews submitted within 50ms."""
+        super().__init__(None, window=0.05)
+        self.commits: list[int] = []
+
+    async def _commit(self, batch: list[PendingReview]) -> list:
+        self.commits.append(len(batch))
+        await asyncio.sleep(0.2)
+        if self.fail and len(batch) > 1:
+            message = "batch failed"
+            raise RuntimeError(message)
+        return [pending.review for pending in batch]
+
+
+def test_stop_finishes_the_batch_being_written() -> None:
+    """Stopping mid-batch mustn't fail requests whose reviews were written."""
+
+    async def main() -> tuple[list, list[int]]:
+        batcher = SlowBatcher()
+        await batcher.start()
+        written = [asyncio.create_task(batcher.submit(i)) for i in range(3)]
+        await asyncio.sleep(0.1)
+        queued = [asyncio.create_task(batcher.submit(i)) for i in range(3, 5)]
+        await asyncio.sleep(0)
+        await batcher.stop()
+        return await asyncio.gather(*written, *queued), batcher.commits
+
+    assert asyncio.run(main()) == ([0, 1, 2, 3, 4], [3, 2])
+
+
+def test_one_by_one_retry_is_bounded(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Reviews not retried within the route's time budget fail with a 504."""
+    monkeypatch.setattr(group_commit, "route_timeout", lambda _key: 0.5)
+
+    async def main() -> tuple[list, list[int]]:
+        batcher = SlowBatcher()
+        batcher.fail = True
+        await batcher.start()
+        results = await asyncio.gather(
+            *(batcher.submit(i) for i in range(6)), return_exceptions=True
+        )
+        await batcher.stop()
+        return results, batcher.commits
+
+    results, commits = asyncio.run(main())
+    assert results[:3] == [0, 1, 2]
+    timed_out = results[3:]
+    assert all(exc.status_code == QUERY_TIMEOUT.status_code for exc in timed_out)
+    # Every request raises its own exception, not the shared one
+    assert len({id(exc) for exc in timed_out}) == 3
+    assert QUERY_TIMEOUT not in timed_out
+    assert commits == [6, 1, 1, 1]
@@ -0,0 +1,220 @@
+"""Tests of replaying the stored response of a retried create request."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Self
+
+from beer_review_dataserver.idempotency import IdempotencyMiddleware
+from beer_review_dataserver.models.idempotency import IdempotencyKeys
+
+
+class FakeDatabase:
+    """The idempotency keys, and how often a claim was extended."""
+
+    def __init__(self) -> None:
+        """Start without any keys."""
+        self.keys: dict[str, IdempotencyKeys] = {}
+        self.extended = 0
+
+    def session(self) -> FakeSession:
+        """Open a session on the database."""
+        return FakeSession(self)
+
+
+class FakeSession:
+    """Keep the idempotency keys in a dict, by interpreting the statements."""
+
+    def __init__(self, database: FakeDatabase) -> None:
+        """Use the keys of the fake database."""
+        self.database = database
+        self.keys = database.keys
+        self.row: Any = None
+
+    async def __aenter__(self) -> Self:
+        """Open the session."""
+        return self
+
+    async def __aexit__(self, *_exc_info: object) -> None:
+        """Close the session."""
+
+    async def commit(self) -> None:
+        """Commit the transaction."""
+
+    async def exec(self, stmt: Any) -> Self:  # noqa: ANN401
+        """Run a statement against the single key of the tests."""
+        params = stmt.compile().params
+        key = params.get("key", params.get("key_1"))
+        stored = self.keys.get(key)
+        if stmt.is_select:
+            self.row = stored
+        elif stmt.is_insert:
+            # Only unused keys are claimed, none of the tests' keys expire
+            self.row = None
+            if stored is None:
+                self.keys[key] = IdempotencyKeys(
+                    key=key, route=params["route"], request_hash=params["request_hash"]
+                )
+                self.row = key
+        elif stmt.is_update and "status_code" in params:
+            stored.status_code = params["status_code"]
+            stored.content_type = params["content_type"]
+            stored.body = params["body"]
+        elif stmt.is_update:
+            self.database.extended += 1
+        elif stmt.is_delete and stored is not None and stored.status_code is None:
+            del self.keys[key]
+        return self
+
+    def first(self) -> Any:  # noqa: ANN401
+        """Return the row of the last statement."""
+        return self.row
+
+
+class CreateApp:
+    """Create something, counting how often it ran."""
+
+    def __init__(self, status: int = 201, delay: float = 0.0) -> None:
+        """Respond with status after delay seconds."""
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, _scope: Any, receive: Any, send: Any) -> None:  # noqa: ANN401
+        """Read the body and echo it back."""
+        self.calls += 1
+        message = await receive()
+        await asyncio.sleep(self.delay)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": message["body"]})
+
+
+def middleware(
+    app: CreateApp, database: FakeDatabase | None = None, **kwargs: float
+) -> IdempotencyMiddleware:
+    """Wrap the app, with the keys stored in the fake database."""
+    database = database or FakeDatabase()
+    return IdempotencyMiddleware(app, database.session, paths=["/beers/"], **kwargs)
+
+
+async def post(
+    app: IdempotencyMiddleware, body: bytes, key: bytes = b"key", *chunks: bytes
+) -> tuple[int, dict[bytes, bytes], bytes]:
+    """POST the body, followed by any more chunks, and return the response."""
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/beers/",
+        "headers": [(b"idempotency-key", key)],
+    }
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": True}
+        for chunk in (body, *chunks)
+    ]
+    messages[-1]["more_body"] = False
+    sent: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        return messages.pop(0)
+
+    async def send(message: dict[str, Any]) -> None:
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return (
+        sent[0]["status"],
+        dict(sent[0]["headers"]),
+        b"".join(message.get("body", b"") for message in sent[1:]),
+    )
+
+
+def test_retry_replays_the_stored_response() -> None:
+    """A retry gets the first response back without running the route again."""
+    app = CreateApp()
+    wrapped = middleware(app)
+
+    async def scenario() -> None:
+        first = await post(wrapped, b'{"name": "Pale"}')
+        retry = await post(wrapped, b'{"name": "Pale"}')
+        assert first[0] == retry[0] == 201
+        assert first[2] == retry[2] == b'{"name": "Pale"}'
+        assert retry[1][b"idempotent-replayed"] == b"true"
+
+    asyncio.run(scenario())
+    assert app.calls == 1
+
+
+def test_key_reused_for_another_body() -> None:
+    """A key sent again with a different body is refused."""
+    app = CreateApp()
+    wrapped = middleware(app)
+
+    async def scenario() -> None:
+        await post(wrapped, b'{"name": "Pale"}')
+        status, _headers, _body = await post(wrapped, b'{"name": "Stout"}')
+        assert status == 422
+
+    asyncio.run(scenario())
+    assert app.calls == 1
+
+
+def test_retry_while_in_progress() -> None:
+    """A retry sent while the first request runs gets a 409."""
+    app = CreateApp(delay=0.05)
+    wrapped = middleware(app)
+
+    async def scenario() -> None:
+        first, retry = await asyncio.gather(
+            post(wrapped, b'{"name": "Pale"}'), post(wrapped, b'{"name": "Pale"}')
+        )
+        assert first[0] == 201
+        assert retry[0] == 409
+
+    asyncio.run(scenario())
+    assert app.calls == 1
+
+
+def test_failed_request_releases_its_key() -> None:
+    """The key of a failed request can be used to retry it."""
+    database = FakeDatabase()
+    app = CreateApp(status=500)
+    wrapped = middleware(app, database)
+
+    async def scenario() -> None:
+        status, _headers, _body = await post(wrapped, b"{}")
+        assert status == 500
+        assert not database.keys
+        app.status = 201
+        status, _headers, _body = await post(wrapped, b"{}")
+        assert status == 201
+
+    asyncio.run(scenario())
+    assert app.calls == 2
+
+
+def test_body_larger_than_max_body() -> None:
+    """A keyed request whose body is too large to buffer is refused."""
+    app = CreateApp()
+    wrapped = middleware(app, max_body=8)
+
+    async def scenario() -> None:
+        status, _headers, _body = await post(wrapped, b"1234", b"key", b"56789")
+        assert status == 413
+
+    asyncio.run(scenario())
+    assert app.calls == 0
+
+
+def test_claim_is_extended_while_running() -> None:
+    """A request running for longer than pending_ttl keeps its key claimed."""
+    database = FakeDatabase()
+    app = CreateApp(delay=0.05)
+
+    asyncio.run(post(middleware(app, database, pending_ttl=0.02), b"{}"))
+    assert database.extended >= 2
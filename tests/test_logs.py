@@ -0,0 +1,113 @@
+"""Tests of the access log and the JSON log format."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import uuid
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from beer_review_dataserver import logs
+from beer_review_dataserver.logs import AccessLogMiddleware, JsonFormatter
+from beer_review_dataserver.profiling import RequestTimings
+
+SCOPE = {
+    "type": "http",
+    "method": "GET",
+    "path": "/beers/1",
+    "route": SimpleNamespace(path="/beers/{beer_id}"),
+}
+
+
+def access_log(
+    caplog: pytest.LogCaptureFixture, status_code: int | None, latency: float = 0.01
+) -> list[logging.LogRecord]:
+    """Log a request with a sample rate of 0.1, returning the records logged."""
+    middleware = AccessLogMiddleware(None, sample_rate=0.1, slow=1.0)
+    with caplog.at_level(logging.INFO, logger=logs.access_logger.name):
+        middleware.log(SCOPE, status_code, latency, RequestTimings())
+    return caplog.records
+
+
+def test_fast_requests_are_sampled(
+    caplog: pytest.LogCaptureFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Requests that aren't slow or failing are logged at the sample rate."""
+    monkeypatch.setattr(logs.random, "random", lambda: 0.5)
+    assert not access_log(caplog, 200)
+
+    monkeypatch.setattr(logs.random, "random", lambda: 0.05)
+    (record,) = access_log(caplog, 200)
+    assert record.sample_rate == 0.1
+    assert record.route == "/beers/{beer_id}"
+    assert record.status == 200
+
+
+@pytest.mark.parametrize(
+    ("status_code", "latency"), [(200, 1.5), (503, 0.01), (None, 0.01)]
+)
+def test_slow_and_failed_requests_are_always_logged(
+    caplog: pytest.LogCaptureFixture,
+    monkeypatch: pytest.MonkeyPatch,
+    status_code: int | None,
+    latency: float,
+) -> None:
+    """Slow requests, server errors and requests without a response are kept."""
+    monkeypatch.setattr(logs.random, "random", lambda: 0.99)
+    (record,) = access_log(caplog, status_code, latency)
+    assert record.sample_rate == 1.0
+
+
+def test_failing_app_is_logged_as_a_server_error(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """An exception escaping the app is logged as a 500 and raised again."""
+
+    async def failing_app(*_args: Any) -> None:  # noqa: ANN401
+        message = "route failed"
+        raise RuntimeError(message)
+
+    middleware = AccessLogMiddleware(failing_app, sample_rate=0.0)
+    with (
+        caplog.at_level(logging.INFO, logger=logs.access_logger.name),
+        pytest.raises(RuntimeError),
+    ):
+        asyncio.run(middleware(SCOPE, None, None))
+    (record,) = caplog.records
+    assert record.status == 500
+
+
+def test_json_formatter_adds_extra_fields() -> None:
+    """Extra fields become keys, values JSON can't hold become strings."""
+    beer_id = uuid.uuid4()
+    record = logging.LogRecord(
+        "beer_review_dataserver.access", logging.INFO, "", 0, "GET %s", ("/",), None
+    )
+    record.beer_id = beer_id
+    record.queries = 3
+
+    data = json.loads(JsonFormatter().format(record))
+
+    assert data["message"] == "GET /"
+    assert data["level"] == "INFO"
+    assert data["logger"] == "beer_review_dataserver.access"
+    assert data["time"].endswith("+00:00")
+    assert data["beer_id"] == str(beer_id)
+    assert data["queries"] == 3
+    assert "exc_info" not in data
+
+
+def test_json_formatter_includes_the_traceback() -> None:
+    """Records logged with an exception carry its formatted traceback."""
+    error = ValueError("boom")
+    record = logging.LogRecord(
+        "test", logging.ERROR, "", 0, "failed", (), (ValueError, error, None)
+    )
+
+    data = json.loads(JsonFormatter().format(record))
+
+    assert "ValueError: boom" in data["exc_info"]
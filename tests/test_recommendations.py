@@ -0,0 +1,65 @@
+"""Tests of which changes update the beer similarities."""
+
+import uuid
+
+from beer_review_dataserver.notifications import ChangeEvent
+from beer_review_dataserver.recommendations import Recommender
+from beer_review_dataserver.similarity import SimilarityOptions
+
+
+def idle_recommender() -> Recommender:
+    """Return a recommender that has nothing to update."""
+    recommender = Recommender(
+        None, SimilarityOptions(), update_delay=0, rebuild_interval=0
+    )
+    recommender._rebuild = False  # noqa: SLF001
+    return recommender
+
+
+def is_stale(recommender: Recommender) -> bool:
+    """Return whether an update is due."""
+    return recommender._stale.is_set()  # noqa: SLF001
+
+
+def test_beer_score_updates_are_ignored() -> None:
+    """Every review updates its beer's score, which the index doesn't hold."""
+    recommender = idle_recommender()
+    recommender.handle_change(
+        ChangeEvent(
+            table="beers",
+            op="UPDATE",
+            name="Pale Ale",
+            changed=frozenset({"score", "review_count", "weighted_score"}),
+        )
+    )
+    assert not is_stale(recommender)
+
+
+def test_beers_added_deleted_or_renamed() -> None:
+    """The beers of the index change, without any of them being recomputed."""
+    changes = [
+        ChangeEvent(table="beers", op="INSERT"),
+        ChangeEvent(table="beers", op="DELETE"),
+        ChangeEvent(table="beers", op="UPDATE", changed=frozenset({"name"})),
+    ]
+    for change in changes:
+        recommender = idle_recommender()
+        recommender.handle_change(change)
+        assert is_stale(recommender), change
+        assert not recommender._changed  # noqa: SLF001
+
+
+def test_reviews_mark_their_beer_changed() -> None:
+    """Any change to a review recomputes the neighbours of its beer."""
+    beer_id = str(uuid.uuid4())
+    recommender = idle_recommender()
+    recommender.handle_change(
+        ChangeEvent(
+            table="reviews",
+            op="UPDATE",
+            beer_id=beer_id,
+            changed=frozenset({"score"}),
+        )
+    )
+    assert is_stale(recommender)
+    assert recommender._changed == {beer_id}  # noqa: SLF001
@@ -0,0 +1,162 @@
+"""Tests of updating the neighbours of beers rather than rebuilding them."""
+
+import random
+from array import array
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from beer_review_dataserver import similarity  # noqa: E402
+from beer_review_dataserver.similarity import (  # noqa: E402
+    Neighbours,
+    PreviousNeighbours,
+    Ratings,
+    SimilarityOptions,
+    build_neighbours,
+)
+
+# Beers in separate groups reviewed by separate users, so a change to one group
+# leaves the others out of date and the update doesn't fall back to a rebuild.
+# Each user reviews a run of consecutive beers of their group, so the beers of
+# a group are more than one shared user apart.
+GROUPS = 4
+GROUP_BEERS = 10
+GROUP_USERS = 40
+RUN = 3
+BEERS = GROUPS * GROUP_BEERS
+
+OPTIONS = SimilarityOptions(neighbours=5, min_overlap=2, shrinkage=5.0)
+
+type Review = tuple[int, int, float]
+
+
+def grouped_reviews(seed: int = 0) -> list[Review]:
+    """Return (user, beer, score) for users reviewing a run of their group."""
+    rng = random.Random(seed)  # noqa: S311
+    reviews = []
+    for group in range(GROUPS):
+        for user in range(group * GROUP_USERS, (group + 1) * GROUP_USERS):
+            first = group * GROUP_BEERS + rng.randrange(GROUP_BEERS - RUN + 1)
+            reviews.extend(
+                (user, beer, rng.uniform(1, 5)) for beer in range(first, first + RUN)
+            )
+    return reviews
+
+
+def ratings(reviews: list[Review], beer_count: int = BEERS) -> Ratings:
+    """Return the reviews as ratings."""
+    return Ratings(
+        users=array("l", [user for user, _, _ in reviews]),
+        beers=array("l", [beer for _, beer, _ in reviews]),
+        scores=array("d", [score for _, _, score in reviews]),
+        beer_count=beer_count,
+    )
+
+
+def assert_same(updated: Neighbours, rebuilt: Neighbours) -> None:
+    """Assert an update found the same neighbours as a rebuild."""
+    np.testing.assert_array_equal(updated.indices, rebuilt.indices)
+    np.testing.assert_allclose(updated.scores, rebuilt.scores, rtol=1e-5)
+
+
+@pytest.fixture
+def recomputed(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    """Record how many beers each call to top_neighbours computes."""
+    counts: list[int] = []
+    top_neighbours = similarity.top_neighbours
+
+    def counting(*args: object) -> Neighbours:
+        counts.append(len(args[2]))
+        return top_neighbours(*args)
+
+    monkeypatch.setattr(similarity, "top_neighbours", counting)
+    return counts
+
+
+def test_update_after_review_changes(recomputed: list[int]) -> None:
+    """Changed scores and new reviews move their users' means, which is seen."""
+    reviews = grouped_reviews()
+    previous = build_neighbours(ratings(reviews), OPTIONS)
+
+    changed = [
+        (user, beer, 6 - score) if beer == 3 else (user, beer, score)
+        for user, beer, score in reviews
+    ]
+    changed += [(user, 1, 4.5) for user, beer, _ in reviews if beer == 3]
+    rebuilt = build_neighbours(ratings(changed), OPTIONS)
+    recomputed.clear()
+    updated = build_neighbours(
+        ratings(changed),
+        OPTIONS,
+        PreviousNeighbours(previous, positions=range(BEERS), changed=[1, 3]),
+    )
+    assert 0 < recomputed[0] <= GROUP_BEERS
+    assert_same(updated, rebuilt)
+
+
+def test_update_after_adding_beers(recomputed: list[int]) -> None:
+    """New beers get neighbours, and become the neighbours of others."""
+    reviews = grouped_reviews()
+    previous = build_neighbours(ratings(reviews), OPTIONS)
+
+    # One reviewed by the users of the third group, one not reviewed yet
+    added = [*reviews, *((user, BEERS, 5.0) for user in range(80, 95))]
+    rebuilt = build_neighbours(ratings(added, BEERS + 2), OPTIONS)
+    recomputed.clear()
+    updated = build_neighbours(
+        ratings(added, BEERS + 2),
+        OPTIONS,
+        PreviousNeighbours(previous, positions=range(BEERS), changed=[BEERS]),
+    )
+    assert 0 < recomputed[0] <= GROUP_BEERS + 2
+    assert_same(updated, rebuilt)
+
+
+def test_update_after_deleting_a_beer(recomputed: list[int]) -> None:
+    """A deleted beer is dropped as a neighbour and the codes after it move."""
+    deleted = 25
+    # Each user scores the deleted beer at their mean, so deleting its reviews
+    # doesn't move the means the update can't see
+    reviews = [review for review in grouped_reviews() if review[1] != deleted]
+    users = {user for user, beer, _ in grouped_reviews() if beer == deleted}
+    for user in users:
+        scores = [score for reviewer, _, score in reviews if reviewer == user]
+        reviews.append((user, deleted, sum(scores) / len(scores)))
+    previous = build_neighbours(ratings(reviews), OPTIONS)
+    assert (previous.indices == deleted).any()
+
+    remaining = [
+        (user, beer - (beer > deleted), score)
+        for user, beer, score in reviews
+        if beer != deleted
+    ]
+    positions = [
+        -1 if beer == deleted else beer - (beer > deleted) for beer in range(BEERS)
+    ]
+    rebuilt = build_neighbours(ratings(remaining, BEERS - 1), OPTIONS)
+    recomputed.clear()
+    updated = build_neighbours(
+        ratings(remaining, BEERS - 1),
+        OPTIONS,
+        PreviousNeighbours(previous, positions=positions, changed=[]),
+    )
+    assert 0 < recomputed[0] < GROUP_BEERS
+    assert_same(updated, rebuilt)
+
+
+def test_rebuilds_when_most_beers_changed(recomputed: list[int]) -> None:
+    """Updating most of the beers costs as much as rebuilding them all."""
+    reviews = grouped_reviews()
+    previous = build_neighbours(ratings(reviews), OPTIONS)
+    changed = [(user, beer, 6 - score) for user, beer, score in reviews]
+    rebuilt = build_neighbours(ratings(changed), OPTIONS)
+    recomputed.clear()
+    updated = build_neighbours(
+        ratings(changed),
+        OPTIONS,
+        PreviousNeighbours(previous, positions=range(BEERS), changed=[4, 14, 24, 34]),
+    )
+    assert recomputed == [BEERS]
+    assert_same(updated, rebuilt)